@@ -2,13 +2,798 @@
 API управления посещаемостью.
 Отметка присутствия и автоматическое списание средств.
 """
+import base64
+import csv
+import gzip
+import hashlib
+import hmac
+import io
 import json
 import os
-from datetime import datetime
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
 
-def handler(event: dict, context) -> dict:
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '1'))
+DB_PING_AFTER = float(os.environ.get('DB_PING_AFTER', '30'))
+
+_pool = None
+_conn = None
+_last_used = {}
+
+def _connection_alive(conn) -> bool:
+    """Дешёвая проверка соединения: статус транзакции, а после простоя — SELECT 1"""
+    if conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        last_used = _last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used > DB_PING_AFTER:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+def get_connection():
+    """
+    Возвращает соединение с БД, переживающее вызовы в прогретом контейнере.
+    При DB_POOL_SIZE > 1 соединения выдаются из ограниченного пула.
+    """
+    started = time.perf_counter()
+    try:
+        load_psycopg2()
+        return _acquire_connection()
+    finally:
+        current_timings().connect += time.perf_counter() - started
+
+def _acquire_connection():
+    global _pool, _conn
+    if DB_POOL_SIZE > 1:
+        if _pool is None:
+            _pool = psycopg2.pool.ThreadedConnectionPool(1, DB_POOL_SIZE, os.environ['DATABASE_URL'])
+        conn = _pool.getconn()
+        if not _connection_alive(conn):
+            _pool.putconn(conn, close=True)
+            conn = _pool.getconn()
+        return conn
+    if _conn is None or not _connection_alive(_conn):
+        if _conn is not None and not _conn.closed:
+            _conn.close()
+        _conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    return _conn
+
+def release_connection(conn, broken: bool = False):
+    """Возвращает соединение для повторного использования, незавершённая транзакция откатывается"""
+    global _conn
+    if not broken and not conn.closed:
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    _last_used[id(conn)] = time.monotonic()
+    if _pool is not None:
+        _pool.putconn(conn, close=broken or bool(conn.closed))
+    elif broken:
+        if not conn.closed:
+            conn.close()
+        _conn = None
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+
+_request = threading.local()
+
+class RequestTimings:
+    """Замеры одного вызова: подключение к БД, SQL-запросы и сериализация ответа"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connect = 0.0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.statements = 0
+        self.slow_queries = []
+        self.error = None
+
+def current_timings() -> RequestTimings:
+    timings = getattr(_request, 'timings', None)
+    if timings is None:
+        timings = _request.timings = RequestTimings()
+    return timings
+
+class TimedCursorMixin:
+    """Считает запросы курсора, их время и отмечает медленные"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(query, time.perf_counter() - started)
+
+def record_query(query: str, elapsed: float, statements: int = 1):
+    """Добавляет время запроса в тайминги вызова и отмечает медленный запрос"""
+    timings = current_timings()
+    timings.db += elapsed
+    timings.statements += statements
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        timings.slow_queries.append({'ms': round(elapsed * 1000, 1), 'query': ' '.join(query.split())[:300]})
+
+psycopg2 = None
+TimedCursor = None
+TimedTupleCursor = None
+
+def load_psycopg2():
+    """
+    Импортирует драйвер БД при первом подключении, а не при загрузке модуля:
+    preflight и отказы до обращения к БД обходятся без него на холодном старте.
+    """
+    global psycopg2, TimedCursor, TimedTupleCursor
+    if TimedCursor is None:
+        import psycopg2
+        import psycopg2.extensions
+        import psycopg2.extras
+        import psycopg2.pool
+
+        class TimedCursor(TimedCursorMixin, psycopg2.extras.RealDictCursor):
+            """Курсор со строками-словарями для логики обработчика"""
+
+        class TimedTupleCursor(TimedCursorMixin, psycopg2.extensions.cursor):
+            """Курсор с кортежами для выборок, которые целиком уходят в ответ через encode_rows"""
+    return psycopg2
+
+# date, time, timestamp, timestamptz, numeric — в ответе они передаются строками
+TEXT_COLUMN_TYPES = {1082, 1083, 1114, 1184, 1700}
+
+def encode_rows(description, rows) -> list:
+    """
+    Превращает строки кортежного курсора в словари для ответа.
+    Колонки, которые нужно привести к строке, находятся один раз по описанию курсора,
+    поэтому сериализатору не приходится вызывать default= для каждого значения.
+    """
+    columns = [column.name for column in description]
+    text_columns = [index for index, column in enumerate(description) if column.type_code in TEXT_COLUMN_TYPES]
+    if not text_columns:
+        return [dict(zip(columns, row)) for row in rows]
+    result = []
+    for row in rows:
+        row = list(row)
+        for index in text_columns:
+            if row[index] is not None:
+                row[index] = str(row[index])
+        result.append(dict(zip(columns, row)))
+    return result
+
+orjson = None
+_orjson_checked = False
+
+def load_orjson():
+    """
+    Импортирует orjson при первой сериализации, а не при загрузке модуля:
+    preflight обходится без него на холодном старте. Возвращает None, если он не установлен.
+    """
+    global orjson, _orjson_checked
+    if not _orjson_checked:
+        _orjson_checked = True
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+    return orjson
+
+def dump_json(data) -> str:
+    """
+    Сериализует тело ответа с замером времени: orjson, если он установлен, иначе компактный json.
+    default=str остаётся запасным путём для одиночных дат и Decimal вне encode_rows.
+    """
+    started = time.perf_counter()
+    if load_orjson() is not None:
+        body = orjson.dumps(data, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+    else:
+        body = json.dumps(data, default=str, ensure_ascii=False, separators=(',', ':'))
+    current_timings().serialize += time.perf_counter() - started
+    return body
+
+def report_timings(function: str, event: dict, response: dict, timings: RequestTimings) -> dict:
+    """Добавляет в ответ заголовок Server-Timing и пишет в лог JSON-строку с замерами"""
+    total = time.perf_counter() - timings.started
+    response.setdefault('headers', {})
+    response['headers']['Server-Timing'] = (
+        f'connect;dur={timings.connect * 1000:.1f}, '
+        f'db;dur={timings.db * 1000:.1f};desc="{timings.statements} queries", '
+        f'serialize;dur={timings.serialize * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+    response['headers']['Timing-Allow-Origin'] = '*'
+    record = {
+        'level': 'warning' if timings.slow_queries or timings.error else 'info',
+        'function': function,
+        'method': event.get('httpMethod', 'GET'),
+        'status': response.get('statusCode'),
+        'total_ms': round(total * 1000, 1),
+        'connect_ms': round(timings.connect * 1000, 1),
+        'db_ms': round(timings.db * 1000, 1),
+        'statements': timings.statements,
+        'serialize_ms': round(timings.serialize * 1000, 1)
+    }
+    if timings.slow_queries:
+        record['slow_queries'] = timings.slow_queries
+    if timings.error:
+        record['error'] = timings.error
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+    return response
+
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(*key) -> str:
+    """Непрозрачный курсор страницы: ключ сортировки последней отданной строки"""
+    raw = json.dumps(key, default=str, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str, parse_key) -> list:
+    """
+    Разбирает курсор, выданный encode_cursor: parse_key проверяет ключ сортировки, второй
+    элемент — целый id строки. Подделанный курсор даёт ValueError, а не ошибку в запросе.
+    """
+    key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    if not isinstance(key, list) or len(key) != 2 or not isinstance(key[0], str) or type(key[1]) is not int:
+        raise ValueError('cursor')
+    return [parse_key(key[0]), key[1]]
+
+def parse_page_size(value, default: int) -> int:
+    """Размер страницы из параметра limit, ограниченный MAX_PAGE_SIZE"""
+    if not value:
+        return default
+    return max(1, min(int(value), MAX_PAGE_SIZE))
+
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '300'))
+CACHE_VERSION_TTL = float(os.environ.get('CACHE_VERSION_TTL', '5'))
+CACHE_SIZE = 256
+
+class MemoryCache:
+    """TTL/LRU-кэш процесса. Другой бэкенд с теми же get/set можно присвоить cache_backend"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.items = OrderedDict()
+
+    def get(self, key: str):
+        item = self.items.get(key)
+        if item is None or item[1] < time.monotonic():
+            return None
+        self.items.move_to_end(key)
+        return item[0]
+
+    def set(self, key: str, value, ttl: float):
+        self.items[key] = (value, time.monotonic() + ttl)
+        self.items.move_to_end(key)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+cache_backend = MemoryCache(CACHE_SIZE)
+_versions = {}
+_versions_checked_at = 0.0
+
+def cache_versions(cur, max_age: float = CACHE_VERSION_TTL) -> dict:
+    """Штампы версий из cache_versions; перечитываются, если прочитаны больше max_age секунд назад"""
+    global _versions, _versions_checked_at
+    if time.monotonic() - _versions_checked_at >= max_age:
+        cur.execute("SELECT scope, version FROM cache_versions")
+        _versions = {row['scope']: row['version'] for row in cur.fetchall()}
+        _versions_checked_at = time.monotonic()
+    return _versions
+
+def cached(cur, name: str, scopes: tuple, loader):
+    """Значение из кэша или loader(cur) при промахе; ключ включает текущие версии scopes"""
+    versions = cache_versions(cur)
+    key = name + ':' + ':'.join(str(versions.get(scope, 0)) for scope in scopes)
+    value = cache_backend.get(key)
+    if value is None:
+        value = loader(cur)
+        cache_backend.set(key, value, CACHE_TTL)
+    return value
+
+def load_groups(cur) -> dict:
+    """Стоимость занятия всех групп по id"""
+    cur.execute("SELECT id, cost_per_session FROM groups")
+    return {row['id']: row['cost_per_session'] for row in cur.fetchall()}
+
+def load_group_costs(cur, group_ids) -> dict:
+    """
+    Стоимость занятия групп из кэша. Группа, созданная в другом контейнере, может
+    отсутствовать в нём до перечитывания версий, поэтому промахи по group_ids
+    дочитываются из БД; ненайденной считается только группа, которой нет и там.
+    """
+    group_costs = cached(cur, 'groups', ('groups',), load_groups)
+    missing = [group_id for group_id in group_ids if group_id not in group_costs]
+    if missing:
+        cur.execute("SELECT id, cost_per_session FROM groups WHERE id = ANY(%s)", (missing,))
+        group_costs = {**group_costs, **{row['id']: row['cost_per_session'] for row in cur.fetchall()}}
+    return group_costs
+
+def load_roster(cur, group_id: int) -> frozenset:
+    """Ученики группы"""
+    cur.execute("SELECT id FROM students WHERE group_id = %s", (group_id,))
+    return frozenset(row['id'] for row in cur.fetchall())
+
+def make_etag(versions: dict, scopes: list, params: dict) -> str:
+    """Слабый ETag из версий данных scopes и параметров запроса"""
+    raw = json.dumps([[versions.get(scope, 0) for scope in scopes], params], sort_keys=True, default=str)
+    return 'W/"' + hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20] + '"'
+
+def not_modified(event: dict, etag: str):
+    """Ответ 304, если клиент прислал тот же ETag (или *) в If-None-Match, иначе None"""
+    headers = event.get('headers') or {}
+    header = headers.get('If-None-Match') or headers.get('if-none-match') or ''
+    tags = [tag.strip() for tag in header.split(',')]
+    if etag not in tags and '*' not in tags:
+        return None
+    return {
+        'statusCode': 304,
+        'headers': {'ETag': etag, 'Cache-Control': 'no-cache', 'Access-Control-Allow-Origin': '*'},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def bump_cache_versions(cur, *scopes) -> dict:
+    """
+    Инвалидирует кэши функций во всех контейнерах, увеличивая версии scopes, в транзакции записи:
+    версия и данные фиксируются вместе, и сбой после COMMIT не оставит устаревший ETag.
+    Строки блокируются в порядке имён. Возвращает новые версии: вызывающий код переносит их
+    в _versions своего контейнера только после COMMIT, чтобы откат не оставил версию, которой нет в БД.
+    """
+    cur.execute("""
+        INSERT INTO cache_versions (scope, version)
+        SELECT unnest(%s::text[]), 1
+        ON CONFLICT (scope) DO UPDATE SET version = cache_versions.version + 1
+        RETURNING scope, version
+    """, (sorted(set(scopes)),))
+    return {row['scope']: row['version'] for row in cur.fetchall()}
+
+REFRESH_STATS_QUERY = """
+    WITH session AS (
+        SELECT student_id, is_present, cost_charged
+        FROM attendance
+        WHERE group_id = %(group_id)s AND session_date = %(session_date)s
+    ),
+    daily AS (
+        INSERT INTO group_daily_stats (group_id, session_date, present_count, absent_count, revenue_charged)
+        SELECT %(group_id)s::integer, %(session_date)s::date,
+               COUNT(*) FILTER (WHERE is_present),
+               COUNT(*) FILTER (WHERE NOT is_present),
+               COALESCE(SUM(cost_charged) FILTER (WHERE is_present), 0)
+        FROM session
+        ON CONFLICT (group_id, session_date) DO UPDATE
+        SET present_count = EXCLUDED.present_count,
+            absent_count = EXCLUDED.absent_count,
+            revenue_charged = EXCLUDED.revenue_charged
+    )
+    INSERT INTO student_monthly_stats (student_id, month, sessions, visits, charged)
+    SELECT a.student_id, date_trunc('month', %(session_date)s::date)::date,
+           COUNT(*), COUNT(*) FILTER (WHERE a.is_present),
+           COALESCE(SUM(a.cost_charged) FILTER (WHERE a.is_present), 0)
+    FROM attendance a
+    WHERE a.student_id IN (SELECT student_id FROM session)
+      AND a.session_date >= date_trunc('month', %(session_date)s::date)
+      AND a.session_date < date_trunc('month', %(session_date)s::date) + INTERVAL '1 month'
+    GROUP BY a.student_id
+    ON CONFLICT (student_id, month) DO UPDATE
+    SET sessions = EXCLUDED.sessions,
+        visits = EXCLUDED.visits,
+        charged = EXCLUDED.charged
+"""
+
+# Повторная отметка того же занятия списывает или возвращает только разницу
+MARK_SESSION_QUERY = """
+    WITH previous AS (
+        SELECT student_id, is_present, cost_charged
+        FROM attendance
+        WHERE group_id = %(group_id)s AND session_date = %(session_date)s
+    ),
+    marked AS (
+        INSERT INTO attendance (student_id, group_id, session_date, is_present, trainer_comment, cost_charged)
+        SELECT s.id, %(group_id)s::integer, %(session_date)s::date, s.id = ANY(%(present)s), %(comment)s::text,
+               CASE WHEN s.id = ANY(%(present)s) THEN %(cost)s ELSE 0 END
+        FROM students s
+        WHERE s.group_id = %(group_id)s
+        ON CONFLICT (student_id, group_id, session_date)
+        DO UPDATE SET is_present = EXCLUDED.is_present,
+                      trainer_comment = EXCLUDED.trainer_comment,
+                      cost_charged = CASE WHEN attendance.is_present = EXCLUDED.is_present
+                                          THEN attendance.cost_charged
+                                          ELSE EXCLUDED.cost_charged END
+        RETURNING student_id, is_present
+    ),
+    changes AS (
+        SELECT m.student_id, m.is_present, p.student_id IS NULL AS is_new,
+               COALESCE(p.is_present, FALSE) AS was_present,
+               CASE
+                   WHEN m.is_present AND NOT COALESCE(p.is_present, FALSE) THEN -%(cost)s
+                   WHEN NOT m.is_present AND p.is_present THEN p.cost_charged
+                   ELSE 0
+               END AS delta
+        FROM marked m
+        LEFT JOIN previous p ON p.student_id = m.student_id
+    ),
+    charged AS (
+        UPDATE students s
+        SET balance = s.balance + c.delta,
+            total_sessions = s.total_sessions + c.is_new::int,
+            total_visits = s.total_visits + c.is_present::int - c.was_present::int,
+            last_visit = CASE
+                WHEN c.is_present THEN GREATEST(s.last_visit, %(session_date)s::date)
+                WHEN c.was_present AND s.last_visit = %(session_date)s::date THEN (
+                    SELECT MAX(a.session_date) FROM attendance a
+                    WHERE a.student_id = s.id AND a.is_present
+                      AND NOT (a.group_id = %(group_id)s AND a.session_date = %(session_date)s)
+                )
+                ELSE s.last_visit
+            END
+        FROM changes c
+        WHERE s.id = c.student_id
+        RETURNING s.id, s.balance, c.delta
+    ),
+    recorded AS (
+        INSERT INTO transactions (student_id, amount, transaction_type, description, created_by)
+        SELECT id, delta,
+               CASE WHEN delta < 0 THEN 'charge' ELSE 'adjustment' END,
+               CASE WHEN delta < 0 THEN %(description)s ELSE %(refund_description)s END,
+               %(trainer_id)s::integer
+        FROM charged
+        WHERE delta <> 0
+        RETURNING id, student_id, amount, transaction_type
+    )
+    SELECT r.id, r.student_id, r.amount, r.transaction_type, c.balance
+    FROM recorded r
+    JOIN charged c ON c.id = r.student_id
+"""
+
+BATCH_SESSIONS_LIMIT = 100
+
+def mark_session(cur, group_id: int, session_date: str, present_students: list, cost: int, comment: str, trainer_id) -> list:
+    """Отмечает одно занятие и пересчитывает сводки; возвращает созданные транзакции с новыми балансами"""
+    cur.execute(MARK_SESSION_QUERY, {
+        'group_id': group_id,
+        'session_date': session_date,
+        'present': present_students,
+        'comment': comment,
+        'cost': cost,
+        'description': f'Посещение {session_date}',
+        'refund_description': f'Отмена посещения {session_date}',
+        'trainer_id': trainer_id
+    })
+    transactions = cur.fetchall()
+    cur.execute(REFRESH_STATS_QUERY, {'group_id': group_id, 'session_date': session_date})
+    return transactions
+
+def session_changes(group_id: int, session_date: str, present_students: list, transactions: list) -> list:
+    """События ленты изменений для отмеченного занятия: само занятие, транзакции и новые балансы"""
+    events = [{
+        'entity': 'attendance',
+        'entity_id': group_id,
+        'data': {'session_date': session_date, 'present_students': present_students}
+    }]
+    for row in transactions:
+        events.append({
+            'entity': 'transaction',
+            'entity_id': row['id'],
+            'data': {'student_id': row['student_id'], 'amount': row['amount'], 'transaction_type': row['transaction_type']}
+        })
+        events.append({'entity': 'balance', 'entity_id': row['student_id'], 'data': {'balance': row['balance']}})
+    return events
+
+def record_changes(cur, events: list):
+    """
+    Добавляет события в ленту изменений. Вызывается последним шагом перед COMMIT:
+    вставка берёт блокировку ленты, которая держится до конца транзакции.
+    """
+    if not events:
+        return
+    cur.execute("""
+        INSERT INTO change_events (entity, entity_id, data)
+        SELECT entity, entity_id, data
+        FROM jsonb_to_recordset(%s::jsonb) AS e(entity text, entity_id integer, data jsonb)
+    """, (json.dumps(events, default=str, ensure_ascii=False),))
+
+def archive_boundary(cur, table: str):
+    """
+    Первый день после месяцев table, перенесённых в схему archive (V0017), или None.
+    Занятия раньше границы не отмечаются, а выгрузки с такого дня читают archive.*_all.
+    """
+    cur.execute("SELECT archive_boundary(%s) AS boundary", (table,))
+    return cur.fetchone()['boundary']
+
+ARCHIVED_SESSION_ERROR = 'Месяц занятия перенесён в архив, отметка невозможна'
+
+def validate_session_entry(entry, group_costs: dict) -> tuple:
+    """Проверяет одно занятие из пачки; возвращает (поля, ошибка)"""
+    if not isinstance(entry, dict):
+        return None, 'Ожидается объект с group_id, session_date и present_students'
+    try:
+        group_id = int(entry.get('group_id'))
+        present_students = [int(student_id) for student_id in entry.get('present_students') or []]
+    except (TypeError, ValueError):
+        return None, 'Некорректная группа или список учеников'
+    if group_id not in group_costs:
+        return None, 'Группа не найдена'
+    try:
+        session_date = datetime.strptime(str(entry.get('session_date')), '%Y-%m-%d').date()
+    except ValueError:
+        return None, 'Некорректная дата занятия'
+    return {
+        'group_id': group_id,
+        'session_date': session_date.isoformat(),
+        'present_students': present_students,
+        'trainer_comment': entry.get('trainer_comment') or ''
+    }, None
+
+def mark_sessions(cur, entries: list, trainer_id) -> tuple:
+    """
+    Отмечает пачку занятий в одной транзакции и возвращает (отчёт по каждому, события ленты).
+    Все записи проверяются до обращения к данным, блокировки занятий берутся
+    одним запросом в порядке (группа, дата), а каждое занятие выполняется
+    в своей точке сохранения: ошибка одного не отменяет остальные.
+    """
+    requested = set()
+    for entry in entries:
+        try:
+            requested.add(int(entry.get('group_id')))
+        except (AttributeError, TypeError, ValueError):
+            pass
+    group_costs = load_group_costs(cur, requested)
+    boundary = archive_boundary(cur, 'attendance')
+    report = []
+    events = []
+    valid = []
+    seen = set()
+    for number, entry in enumerate(entries, start=1):
+        fields, error = validate_session_entry(entry, group_costs)
+        if not error and boundary and fields['session_date'] < boundary.isoformat():
+            error = ARCHIVED_SESSION_ERROR
+        if not error and (fields['group_id'], fields['session_date']) in seen:
+            error = 'Занятие повторяется в пачке'
+        if error:
+            report.append({'entry': number, 'status': 'error', 'error': error})
+            continue
+        seen.add((fields['group_id'], fields['session_date']))
+        valid.append((number, fields))
+    if not valid:
+        return report, events
+    
+    cur.execute("""
+        SELECT pg_advisory_xact_lock(group_id, session_date - DATE '2000-01-01')
+        FROM (
+            SELECT * FROM unnest(%s::integer[], %s::date[]) AS s(group_id, session_date)
+            ORDER BY group_id, session_date
+        ) sessions
+    """, ([fields['group_id'] for _, fields in valid], [fields['session_date'] for _, fields in valid]))
+    
+    for number, fields in valid:
+        group_id = fields['group_id']
+        roster = cached(cur, f'roster:{group_id}', ('students',), lambda cur: load_roster(cur, group_id))
+        cur.execute('SAVEPOINT session_entry')
+        try:
+            transactions = mark_session(
+                cur, group_id, fields['session_date'], fields['present_students'],
+                group_costs[group_id], fields['trainer_comment'], trainer_id
+            )
+        except psycopg2.Error as e:
+            cur.execute('ROLLBACK TO SAVEPOINT session_entry')
+            report.append({
+                'entry': number,
+                'group_id': group_id,
+                'session_date': fields['session_date'],
+                'status': 'error',
+                'error': e.diag.message_primary or str(e)
+            })
+            continue
+        cur.execute('RELEASE SAVEPOINT session_entry')
+        events.extend(session_changes(group_id, fields['session_date'], fields['present_students'], transactions))
+        transaction_types = [row['transaction_type'] for row in transactions]
+        report.append({
+            'entry': number,
+            'group_id': group_id,
+            'session_date': fields['session_date'],
+            'status': 'marked',
+            'charged': transaction_types.count('charge'),
+            'refunded': transaction_types.count('adjustment'),
+            'unknown_students': sorted(set(fields['present_students']) - roster)
+        })
+    
+    report.sort(key=lambda item: item['entry'])
+    return report, events
+
+# {source} — attendance или archive.attendance_all, если период заходит в архив
+EXPORT_QUERY = """
+    SELECT a.id, a.session_date, a.group_id, g.name AS group_name, a.student_id,
+           u.full_name AS student_name, a.is_present, a.cost_charged, a.trainer_comment
+    FROM {source} a
+    JOIN students s ON a.student_id = s.id
+    JOIN users u ON s.user_id = u.id
+    JOIN groups g ON a.group_id = g.id
+    WHERE a.session_date BETWEEN %(date_from)s AND %(date_to)s
+      AND (%(group_id)s::integer IS NULL OR a.group_id = %(group_id)s::integer)
+    ORDER BY a.session_date, a.id
+"""
+
+EXPORT_FORMATS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson; charset=utf-8'}
+EXPORT_ITERSIZE = 2000
+# Тело ответа функции держится в памяти целиком и передаётся в base64 (+1/3 к размеру),
+# поэтому сжатая выгрузка ограничена; большие периоды выгружаются частями
+EXPORT_MAX_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', str(2 * 1024 * 1024)))
+
+def export_rows(conn, query: str, params: dict, fmt: str):
+    """
+    Построчно отдаёт результат запроса в CSV или NDJSON.
+    Строки читаются серверным курсором пачками по EXPORT_ITERSIZE, поэтому
+    чтение не держит в памяти всю выборку. DECLARE учитывается курсором
+    TimedTupleCursor, время чтения пачек добавляется к нему после выгрузки.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    columns = None
+    fetching = 0.0
+    with conn.cursor(name='export', cursor_factory=TimedTupleCursor) as cur:
+        cur.execute(query, params)
+        try:
+            while True:
+                started = time.perf_counter()
+                rows = cur.fetchmany(EXPORT_ITERSIZE)
+                fetching += time.perf_counter() - started
+                if not rows:
+                    break
+                if columns is None:
+                    columns = [column.name for column in cur.description]
+                    if fmt == 'csv':
+                        writer.writerow(columns)
+                for row in rows:
+                    if fmt == 'csv':
+                        writer.writerow(row)
+                    else:
+                        buffer.write(json.dumps(dict(zip(columns, row)), default=str, ensure_ascii=False))
+                        buffer.write('\n')
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        finally:
+            record_query(query, fetching, statements=0)
+
+def export_response(conn, filename: str, query: str, params: dict, fmt: str) -> dict:
+    """
+    Ответ с выгрузкой, сжатой gzip по мере чтения строк. Сжатое тело не больше
+    EXPORT_MAX_BYTES: при превышении чтение прекращается и возвращается 413.
+    """
+    body = io.BytesIO()
+    chunks = export_rows(conn, query, params, fmt)
+    with gzip.GzipFile(fileobj=body, mode='wb') as archive:
+        for chunk in chunks:
+            archive.write(chunk.encode('utf-8'))
+            if body.tell() > EXPORT_MAX_BYTES:
+                chunks.close()
+                return {
+                    'statusCode': 413,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dump_json({'error': 'Выгрузка слишком большая, сократите период или выберите группу'}),
+                    'isBase64Encoded': False
+                }
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': EXPORT_FORMATS[fmt],
+            'Content-Encoding': 'gzip',
+            'Content-Disposition': f'attachment; filename="{filename}.{fmt}"',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': base64.b64encode(body.getbuffer()).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+SESSION_SECRET = os.environ.get('SESSION_SECRET', '')
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED') == '1'
+# Без секрета ни один токен не проверить: с AUTH_REQUIRED=1 функция отказала бы каждому
+# запросу, поэтому падает при загрузке, а не отвечает 401 на любой X-Authorization
+if AUTH_REQUIRED and not SESSION_SECRET:
+    raise RuntimeError('AUTH_REQUIRED=1 требует SESSION_SECRET')
+
+def verify_token(token: str):
+    """Проверяет access-токен функции auth по подписи и сроку, без обращения к БД"""
+    if not SESSION_SECRET:
+        return None
+    try:
+        body, signature = token.split('.')
+        expected = hmac.new(SESSION_SECRET.encode('utf-8'), body.encode('ascii'), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, base64.urlsafe_b64decode(signature + '=' * (-len(signature) % 4))):
+            return None
+        payload = json.loads(base64.urlsafe_b64decode(body + '=' * (-len(body) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('typ') != 'access' or payload.get('exp', 0) < time.time():
+        return None
+    return payload
+
+def authenticate(event: dict):
+    """
+    Возвращает (payload токена из X-Authorization или None, отказать ли в доступе).
+    Отказ — при недействительном токене или его отсутствии при AUTH_REQUIRED=1.
+    Без SESSION_SECRET auth не выдаёт токены, и заголовок не проверяется: запрос анонимный.
+    """
+    headers = event.get('headers') or {}
+    header = headers.get('X-Authorization') or headers.get('x-authorization') or ''
+    token = header[7:] if header.startswith('Bearer ') else header
+    if not token or not SESSION_SECRET:
+        return None, AUTH_REQUIRED
+    identity = verify_token(token)
+    return identity, identity is None
+
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+
+def get_idempotency_key(event: dict, body: dict):
+    """Ключ идемпотентности из заголовка Idempotency-Key или поля idempotency_key"""
+    headers = event.get('headers') or {}
+    key = headers.get('Idempotency-Key') or headers.get('idempotency-key') or body.get('idempotency_key')
+    return str(key)[:100] if key else None
+
+def request_hash(body: dict) -> str:
+    """SHA-256 тела запроса без поля idempotency_key; порядок ключей и пробелы не влияют"""
+    payload = {name: value for name, value in body.items() if name != 'idempotency_key'}
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def claim_idempotency_key(cur, scope: str, key: str, body: dict):
+    """
+    Занимает ключ в текущей транзакции (параллельный запрос с тем же ключом ждёт её конца).
+    Если запрос с этим ключом уже выполнен и ключ не истёк, возвращает сохранённый ответ
+    с пометкой replayed: true, а если тело запроса было другим — ответ 422.
+    """
+    body_hash = request_hash(body)
+    cur.execute("""
+        INSERT INTO idempotency_keys (scope, key, request_hash) VALUES (%(scope)s, %(key)s, %(hash)s)
+        ON CONFLICT (scope, key) DO UPDATE
+        SET created_at = CURRENT_TIMESTAMP, status_code = NULL, response = NULL, request_hash = EXCLUDED.request_hash
+        WHERE idempotency_keys.created_at < CURRENT_TIMESTAMP - make_interval(hours => %(ttl)s)
+        RETURNING key
+    """, {'scope': scope, 'key': key, 'hash': body_hash, 'ttl': IDEMPOTENCY_TTL_HOURS})
+    if cur.fetchone():
+        return None
+    cur.execute(
+        "SELECT status_code, response, request_hash FROM idempotency_keys WHERE scope = %s AND key = %s",
+        (scope, key)
+    )
+    stored = cur.fetchone()
+    if stored['request_hash'] and stored['request_hash'] != body_hash:
+        return {
+            'statusCode': 422,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': 'Ключ идемпотентности уже использован для другого запроса'}),
+            'isBase64Encoded': False
+        }
+    return {
+        'statusCode': stored['status_code'],
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Idempotent-Replayed': 'true'},
+        'body': dump_json(dict(json.loads(stored['response']), replayed=True)),
+        'isBase64Encoded': False
+    }
+
+def save_idempotent_response(cur, scope: str, key: str, response: dict):
+    """Сохраняет ответ под ключом и удаляет порцию истёкших ключей"""
+    cur.execute(
+        "UPDATE idempotency_keys SET status_code = %s, response = %s WHERE scope = %s AND key = %s",
+        (response['statusCode'], response['body'], scope, key)
+    )
+    cur.execute("""
+        DELETE FROM idempotency_keys
+        WHERE (scope, key) IN (
+            SELECT scope, key FROM idempotency_keys
+            WHERE created_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+            LIMIT 100
+        )
+    """, (IDEMPOTENCY_TTL_HOURS,))
+
+def _handle(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -17,17 +802,26 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Authorization',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Authorization, Idempotency-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
+    identity, denied = authenticate(event)
+    if denied:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': 'Требуется авторизация'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = None
     try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        conn = get_connection()
+        cur = conn.cursor(cursor_factory=TimedCursor)
         
         if method == 'POST':
             body = json.loads(event.get('body', '{}'))
@@ -35,124 +829,269 @@ def handler(event: dict, context) -> dict:
             session_date = body.get('session_date')
             present_students = body.get('present_students', [])
             trainer_comment = body.get('trainer_comment', '')
-            trainer_id = body.get('trainer_id')
+            trainer_id = body.get('trainer_id') or (identity or {}).get('sub')
+            
+            if 'sessions' in body:
+                entries = body.get('sessions')
+                if not isinstance(entries, list) or not entries or len(entries) > BATCH_SESSIONS_LIMIT:
+                    cur.close()
+                    release_connection(conn)
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': dump_json({'error': f'Передайте от 1 до {BATCH_SESSIONS_LIMIT} занятий'}),
+                        'isBase64Encoded': False
+                    }
+                
+                idempotency_key = get_idempotency_key(event, body)
+                if idempotency_key:
+                    replay = claim_idempotency_key(cur, 'attendance', idempotency_key, body)
+                    if replay:
+                        conn.rollback()
+                        cur.close()
+                        release_connection(conn)
+                        return replay
+                
+                report, events = mark_sessions(cur, entries, trainer_id)
+                marked_groups = sorted({item['group_id'] for item in report if item['status'] == 'marked'})
+                applied = sum(1 for item in report if item['status'] == 'marked')
+                response = {
+                    'statusCode': 200 if applied else 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dump_json({
+                        'success': applied > 0,
+                        'marked': applied,
+                        'failed': len(report) - applied,
+                        'results': report
+                    }),
+                    'isBase64Encoded': False
+                }
+                if idempotency_key:
+                    save_idempotent_response(cur, 'attendance', idempotency_key, response)
+                bumped = {}
+                if applied:
+                    bumped = bump_cache_versions(
+                        cur, 'attendance', *(f'attendance:group:{group_id}' for group_id in marked_groups), 'transactions', 'balances'
+                    )
+                record_changes(cur, events)
+                
+                conn.commit()
+                _versions.update(bumped)
+                cur.close()
+                release_connection(conn)
+                
+                return response
             
             if not group_id or not session_date:
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Группа и дата обязательны'}),
+                    'body': dump_json({'error': 'Группа и дата обязательны'}),
                     'isBase64Encoded': False
                 }
             
-            cur.execute("SELECT cost_per_session FROM groups WHERE id = %s", (group_id,))
-            group = cur.fetchone()
-            if not group:
+            try:
+                session_date = datetime.strptime(str(session_date), '%Y-%m-%d').date().isoformat()
+            except ValueError:
+                session_date = None
+            boundary = archive_boundary(cur, 'attendance') if session_date else None
+            if not session_date or (boundary and session_date < boundary.isoformat()):
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
-                    'statusCode': 404,
+                    'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Группа не найдена'}),
+                    'body': dump_json({'error': ARCHIVED_SESSION_ERROR if session_date else 'Некорректная дата занятия'}),
                     'isBase64Encoded': False
                 }
             
-            cost = group['cost_per_session']
+            idempotency_key = get_idempotency_key(event, body)
+            if idempotency_key:
+                replay = claim_idempotency_key(cur, 'attendance', idempotency_key, body)
+                if replay:
+                    conn.rollback()
+                    cur.close()
+                    release_connection(conn)
+                    return replay
             
-            cur.execute("SELECT id FROM students WHERE group_id = %s", (group_id,))
-            all_students = [row['id'] for row in cur.fetchall()]
+            group_id = int(group_id)
+            group_costs = load_group_costs(cur, [group_id])
+            if group_id not in group_costs:
+                cur.close()
+                release_connection(conn)
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dump_json({'error': 'Группа не найдена'}),
+                    'isBase64Encoded': False
+                }
             
-            for student_id in all_students:
-                is_present = student_id in present_students
-                
-                cur.execute("""
-                    INSERT INTO attendance (student_id, group_id, session_date, is_present, trainer_comment, cost_charged)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (student_id, group_id, session_date) 
-                    DO UPDATE SET is_present = EXCLUDED.is_present, trainer_comment = EXCLUDED.trainer_comment
-                """, (student_id, group_id, session_date, is_present, trainer_comment, cost if is_present else 0))
-                
-                if is_present:
-                    cur.execute("UPDATE students SET balance = balance - %s WHERE id = %s", (cost, student_id))
-                    
-                    cur.execute("""
-                        INSERT INTO transactions (student_id, amount, transaction_type, description, created_by)
-                        VALUES (%s, %s, 'charge', %s, %s)
-                    """, (student_id, -cost, f'Посещение {session_date}', trainer_id))
+            cost = group_costs[group_id]
+            present_students = [int(student_id) for student_id in present_students]
+            roster = cached(cur, f'roster:{group_id}', ('students',), lambda cur: load_roster(cur, group_id))
+            unknown_students = sorted(set(present_students) - roster)
             
-            conn.commit()
-            cur.close()
-            conn.close()
+            cur.execute("SELECT pg_advisory_xact_lock(%s, %s::date - DATE '2000-01-01')", (group_id, session_date))
             
-            return {
+            transactions = mark_session(cur, group_id, session_date, present_students, cost, trainer_comment, trainer_id)
+            transaction_types = [row['transaction_type'] for row in transactions]
+            
+            response = {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'message': 'Посещаемость отмечена'}),
+                'body': dump_json({
+                    'success': True,
+                    'message': 'Посещаемость отмечена',
+                    'charged': transaction_types.count('charge'),
+                    'refunded': transaction_types.count('adjustment'),
+                    'unknown_students': unknown_students
+                }),
                 'isBase64Encoded': False
             }
+            if idempotency_key:
+                save_idempotent_response(cur, 'attendance', idempotency_key, response)
+            bumped = bump_cache_versions(cur, 'attendance', f'attendance:group:{group_id}', 'transactions', 'balances')
+            record_changes(cur, session_changes(group_id, session_date, present_students, transactions))
+            
+            conn.commit()
+            _versions.update(bumped)
+            cur.close()
+            release_connection(conn)
+            
+            return response
         
         elif method == 'GET':
             params = event.get('queryStringParameters', {}) or {}
             group_id = params.get('group_id')
             student_id = params.get('student_id')
+            try:
+                date_from = date.fromisoformat(params['date_from']) if params.get('date_from') else None
+                date_to = date.fromisoformat(params['date_to']) if params.get('date_to') else None
+            except ValueError:
+                cur.close()
+                release_connection(conn)
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dump_json({'error': 'Некорректная дата date_from или date_to, нужен формат ГГГГ-ММ-ДД'}),
+                    'isBase64Encoded': False
+                }
             
+            export_format = params.get('format')
+            if export_format:
+                if export_format not in EXPORT_FORMATS or not date_from or not date_to:
+                    cur.close()
+                    release_connection(conn)
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': dump_json({'error': 'Для выгрузки нужны format (csv или ndjson), date_from и date_to'}),
+                        'isBase64Encoded': False
+                    }
+                boundary = archive_boundary(cur, 'attendance')
+                source = 'archive.attendance_all' if boundary and date_from < boundary else 'attendance'
+                cur.close()
+                response = export_response(conn, 'attendance', EXPORT_QUERY.format(source=source), {
+                    'date_from': date_from,
+                    'date_to': date_to,
+                    'group_id': group_id
+                }, export_format)
+                release_connection(conn)
+                return response
+            
+            try:
+                limit = parse_page_size(params.get('limit'), MAX_PAGE_SIZE if group_id and not student_id else 100)
+                after = decode_cursor(params['cursor'], date.fromisoformat) if params.get('cursor') else None
+            except ValueError:
+                cur.close()
+                release_connection(conn)
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dump_json({'error': 'Некорректные параметры страницы'}),
+                    'isBase64Encoded': False
+                }
+            
+            scopes = [f'attendance:group:{group_id}' if group_id else 'attendance', 'groups', 'students']
+            etag = make_etag(cache_versions(cur, max_age=0), scopes, params)
+            unchanged = not_modified(event, etag)
+            if unchanged:
+                cur.close()
+                release_connection(conn)
+                return unchanged
+            
+            conditions = []
             if student_id:
-                cur.execute("""
-                    SELECT a.*, g.name as group_name
-                    FROM attendance a
-                    JOIN groups g ON a.group_id = g.id
-                    WHERE a.student_id = %s
-                    ORDER BY a.session_date DESC
-                    LIMIT 100
-                """, (student_id,))
-            elif group_id:
-                cur.execute("""
-                    SELECT a.*, u.full_name as student_name
-                    FROM attendance a
-                    JOIN students s ON a.student_id = s.id
-                    JOIN users u ON s.user_id = u.id
-                    WHERE a.group_id = %s
-                    ORDER BY a.session_date DESC, u.full_name
-                    LIMIT 500
-                """, (group_id,))
-            else:
-                cur.execute("""
-                    SELECT a.*, u.full_name as student_name, g.name as group_name
-                    FROM attendance a
-                    JOIN students s ON a.student_id = s.id
-                    JOIN users u ON s.user_id = u.id
-                    JOIN groups g ON a.group_id = g.id
-                    ORDER BY a.session_date DESC
-                    LIMIT 100
-                """)
-            
-            records = cur.fetchall()
+                conditions.append('a.student_id = %(student_id)s')
+            if group_id:
+                conditions.append('a.group_id = %(group_id)s')
+            if date_from:
+                conditions.append('a.session_date >= %(date_from)s')
+            if date_to:
+                conditions.append('a.session_date <= %(date_to)s')
+            if after:
+                conditions.append('(a.session_date, a.id) < (%(after_date)s::date, %(after_id)s)')
+            
+            rows_cur = conn.cursor(cursor_factory=TimedTupleCursor)
+            rows_cur.execute(f"""
+                SELECT a.*, u.full_name as student_name, g.name as group_name
+                FROM attendance a
+                JOIN students s ON a.student_id = s.id
+                JOIN users u ON s.user_id = u.id
+                JOIN groups g ON a.group_id = g.id
+                {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+                ORDER BY a.session_date DESC, a.id DESC
+                LIMIT %(limit)s
+            """, {
+                'student_id': student_id,
+                'group_id': group_id,
+                'date_from': date_from,
+                'date_to': date_to,
+                'after_date': after[0] if after else None,
+                'after_id': after[1] if after else None,
+                'limit': limit + 1
+            })
+            
+            records = encode_rows(rows_cur.description, rows_cur.fetchall())
+            rows_cur.close()
+            next_cursor = None
+            if len(records) > limit:
+                records = records[:limit]
+                next_cursor = encode_cursor(records[-1]['session_date'], records[-1]['id'])
             cur.close()
-            conn.close()
+            release_connection(conn)
             
             return {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'attendance': [dict(r) for r in records]}, default=str),
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'ETag': etag, 'Cache-Control': 'no-cache'},
+                'body': dump_json({'attendance': records, 'next_cursor': next_cursor}),
                 'isBase64Encoded': False
             }
         
         else:
             cur.close()
-            conn.close()
+            release_connection(conn)
             return {
                 'statusCode': 405,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Method not allowed'}),
+                'body': dump_json({'error': 'Method not allowed'}),
                 'isBase64Encoded': False
             }
             
     except Exception as e:
+        current_timings().error = repr(e)
+        if conn is not None:
+            release_connection(conn, broken=isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)))
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'}),
+            'body': dump_json({'error': f'Ошибка сервера: {str(e)}'}),
             'isBase64Encoded': False
         }
+
+def handler(event: dict, context) -> dict:
+    timings = _request.timings = RequestTimings()
+    response = _handle(event, context)
+    return report_timings('attendance', event, response, timings)
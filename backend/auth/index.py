@@ -1,14 +1,367 @@
 """
 API авторизации для системы учета САМБО.
 Поддерживает вход администраторов, тренеров и учеников.
+После входа выдаёт подписанные access/refresh токены, которые другие
+функции проверяют без обращения к БД.
 """
+import base64
+import hashlib
+import hmac
 import json
 import os
-import bcrypt
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import secrets
+import threading
+import time
+from collections import OrderedDict
 
-def handler(event: dict, context) -> dict:
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '1'))
+DB_PING_AFTER = float(os.environ.get('DB_PING_AFTER', '30'))
+
+_pool = None
+_conn = None
+_last_used = {}
+
+def _connection_alive(conn) -> bool:
+    """Дешёвая проверка соединения: статус транзакции, а после простоя — SELECT 1"""
+    if conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        last_used = _last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used > DB_PING_AFTER:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+def get_connection():
+    """
+    Возвращает соединение с БД, переживающее вызовы в прогретом контейнере.
+    При DB_POOL_SIZE > 1 соединения выдаются из ограниченного пула.
+    """
+    started = time.perf_counter()
+    try:
+        load_psycopg2()
+        return _acquire_connection()
+    finally:
+        current_timings().connect += time.perf_counter() - started
+
+def _acquire_connection():
+    global _pool, _conn
+    if DB_POOL_SIZE > 1:
+        if _pool is None:
+            _pool = psycopg2.pool.ThreadedConnectionPool(1, DB_POOL_SIZE, os.environ['DATABASE_URL'])
+        conn = _pool.getconn()
+        if not _connection_alive(conn):
+            _pool.putconn(conn, close=True)
+            conn = _pool.getconn()
+        return conn
+    if _conn is None or not _connection_alive(_conn):
+        if _conn is not None and not _conn.closed:
+            _conn.close()
+        _conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    return _conn
+
+def release_connection(conn, broken: bool = False):
+    """Возвращает соединение для повторного использования, незавершённая транзакция откатывается"""
+    global _conn
+    if not broken and not conn.closed:
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    _last_used[id(conn)] = time.monotonic()
+    if _pool is not None:
+        _pool.putconn(conn, close=broken or bool(conn.closed))
+    elif broken:
+        if not conn.closed:
+            conn.close()
+        _conn = None
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+
+_request = threading.local()
+
+class RequestTimings:
+    """Замеры одного вызова: подключение к БД, SQL-запросы и сериализация ответа"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connect = 0.0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.statements = 0
+        self.slow_queries = []
+        self.error = None
+
+def current_timings() -> RequestTimings:
+    timings = getattr(_request, 'timings', None)
+    if timings is None:
+        timings = _request.timings = RequestTimings()
+    return timings
+
+class TimedCursorMixin:
+    """Считает запросы курсора, их время и отмечает медленные"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            timings = current_timings()
+            timings.db += elapsed
+            timings.statements += 1
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                timings.slow_queries.append({'ms': round(elapsed * 1000, 1), 'query': ' '.join(query.split())[:300]})
+
+psycopg2 = None
+TimedCursor = None
+
+def load_psycopg2():
+    """
+    Импортирует драйвер БД при первом подключении, а не при загрузке модуля:
+    preflight и отказы до обращения к БД обходятся без него на холодном старте.
+    """
+    global psycopg2, TimedCursor
+    if TimedCursor is None:
+        import psycopg2
+        import psycopg2.extensions
+        import psycopg2.extras
+        import psycopg2.pool
+
+        class TimedCursor(TimedCursorMixin, psycopg2.extras.RealDictCursor):
+            """Курсор со строками-словарями для логики обработчика"""
+    return psycopg2
+
+orjson = None
+_orjson_checked = False
+
+def load_orjson():
+    """
+    Импортирует orjson при первой сериализации, а не при загрузке модуля:
+    preflight обходится без него на холодном старте. Возвращает None, если он не установлен.
+    """
+    global orjson, _orjson_checked
+    if not _orjson_checked:
+        _orjson_checked = True
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+    return orjson
+
+def dump_json(data) -> str:
+    """
+    Сериализует тело ответа с замером времени: orjson, если он установлен, иначе компактный json.
+    default=str остаётся запасным путём для дат и Decimal.
+    """
+    started = time.perf_counter()
+    if load_orjson() is not None:
+        body = orjson.dumps(data, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+    else:
+        body = json.dumps(data, default=str, ensure_ascii=False, separators=(',', ':'))
+    current_timings().serialize += time.perf_counter() - started
+    return body
+
+def report_timings(function: str, event: dict, response: dict, timings: RequestTimings) -> dict:
+    """Добавляет в ответ заголовок Server-Timing и пишет в лог JSON-строку с замерами"""
+    total = time.perf_counter() - timings.started
+    response.setdefault('headers', {})
+    response['headers']['Server-Timing'] = (
+        f'connect;dur={timings.connect * 1000:.1f}, '
+        f'db;dur={timings.db * 1000:.1f};desc="{timings.statements} queries", '
+        f'serialize;dur={timings.serialize * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+    response['headers']['Timing-Allow-Origin'] = '*'
+    record = {
+        'level': 'warning' if timings.slow_queries or timings.error else 'info',
+        'function': function,
+        'method': event.get('httpMethod', 'GET'),
+        'status': response.get('statusCode'),
+        'total_ms': round(total * 1000, 1),
+        'connect_ms': round(timings.connect * 1000, 1),
+        'db_ms': round(timings.db * 1000, 1),
+        'statements': timings.statements,
+        'serialize_ms': round(timings.serialize * 1000, 1)
+    }
+    if timings.slow_queries:
+        record['slow_queries'] = timings.slow_queries
+    if timings.error:
+        record['error'] = timings.error
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+    return response
+
+SESSION_SECRET = os.environ.get('SESSION_SECRET', '')
+ACCESS_TOKEN_TTL = int(os.environ.get('ACCESS_TOKEN_TTL', str(15 * 60)))
+REFRESH_TOKEN_TTL = int(os.environ.get('REFRESH_TOKEN_TTL', str(30 * 24 * 3600)))
+REVOCATION_CACHE_SIZE = 1024
+
+_revoked = OrderedDict()
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def sign_token(claims: dict, token_type: str, ttl: int) -> str:
+    """Подписывает HMAC-SHA256 токен вида payload.signature"""
+    payload = dict(claims, typ=token_type, exp=int(time.time()) + ttl, jti=secrets.token_urlsafe(12))
+    body = _b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    signature = hmac.new(SESSION_SECRET.encode('utf-8'), body.encode('ascii'), hashlib.sha256).digest()
+    return f'{body}.{_b64encode(signature)}'
+
+def verify_token(token: str, token_type: str = 'access'):
+    """Проверяет подпись, тип и срок действия токена; возвращает payload или None"""
+    if not SESSION_SECRET:
+        return None
+    try:
+        body, signature = token.split('.')
+        expected = hmac.new(SESSION_SECRET.encode('utf-8'), body.encode('ascii'), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            return None
+        payload = json.loads(_b64decode(body))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('typ') != token_type or payload.get('exp', 0) < time.time():
+        return None
+    return payload
+
+def issue_tokens(claims: dict) -> dict:
+    """Пара токенов: короткий access для других функций и долгий refresh для продления"""
+    return {
+        'access_token': sign_token(claims, 'access', ACCESS_TOKEN_TTL),
+        'refresh_token': sign_token(claims, 'refresh', REFRESH_TOKEN_TTL),
+        'expires_in': ACCESS_TOKEN_TTL
+    }
+
+def remember_revoked(jti: str):
+    """Запоминает отозванный токен в небольшом LRU-кэше процесса"""
+    _revoked[jti] = True
+    _revoked.move_to_end(jti)
+    while len(_revoked) > REVOCATION_CACHE_SIZE:
+        _revoked.popitem(last=False)
+
+def is_revoked(cur, jti: str) -> bool:
+    """Отозван ли refresh-токен: сначала кэш процесса, затем таблица revoked_tokens"""
+    if jti in _revoked:
+        return True
+    cur.execute("SELECT 1 FROM revoked_tokens WHERE jti = %s", (jti,))
+    if cur.fetchone():
+        remember_revoked(jti)
+        return True
+    return False
+
+LOGIN_BURST = int(os.environ.get('LOGIN_BURST', '5'))
+LOGIN_REFILL_SECONDS = float(os.environ.get('LOGIN_REFILL_SECONDS', '60'))
+IP_BURST = int(os.environ.get('IP_BURST', '30'))
+IP_REFILL_SECONDS = float(os.environ.get('IP_REFILL_SECONDS', '10'))
+LOCKOUT_AFTER = int(os.environ.get('LOCKOUT_AFTER', '5'))
+IP_LOCKOUT_AFTER = int(os.environ.get('IP_LOCKOUT_AFTER', '50'))
+LOCKOUT_BASE_SECONDS = 30
+LOCKOUT_MAX_SECONDS = 3600
+LOCKOUT_FORGET_SECONDS = 3600
+THROTTLE_CACHE_SIZE = 4096
+# Значение ключа обрезается до длины users.login: ключ login_throttle — VARCHAR(300),
+# а длинный логин или X-Forwarded-For не должен ронять вход ошибкой БД
+THROTTLE_KEY_VALUE_MAX = 100
+
+_throttled = OrderedDict()
+
+LOGIN_QUERY = """
+    SELECT t.retry_after, t.blocked_key, t.failures,
+           u.id, u.login, u.password_hash, u.role, u.full_name, u.email,
+           s.id AS student_id, s.group_id, s.balance
+    FROM login_throttle_take(%(keys)s, %(burst)s, %(refill)s, make_interval(secs => %(forget)s)) t
+    LEFT JOIN users u ON t.retry_after = 0 AND u.login = %(login)s
+    LEFT JOIN students s ON s.user_id = u.id AND u.role = 'student'
+"""
+
+REFRESH_QUERY = """
+    SELECT u.id, u.role, s.id AS student_id, s.group_id
+    FROM users u
+    LEFT JOIN students s ON s.user_id = u.id AND u.role = 'student'
+    WHERE u.id = %s
+"""
+
+def client_ip(event: dict) -> str:
+    """
+    Адрес клиента из контекста запроса платформы. Без него — последний адрес X-Forwarded-For:
+    его дописал ближайший прокси, а адреса левее клиент может подставить сам и обойти
+    ограничение по IP, меняя заголовок.
+    """
+    source_ip = ((event.get('requestContext') or {}).get('identity') or {}).get('sourceIp')
+    if source_ip:
+        return source_ip
+    headers = event.get('headers') or {}
+    forwarded = headers.get('X-Forwarded-For') or headers.get('x-forwarded-for') or ''
+    hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+    return hops[-1] if hops else 'unknown'
+
+def throttled_locally(keys: list) -> tuple:
+    """
+    Отказ, уже известный этому экземпляру, без обращения к БД:
+    (через сколько секунд повторить, ключ) или (0, None).
+    """
+    now = time.monotonic()
+    for key in keys:
+        until = _throttled.get(key)
+        if until is None:
+            continue
+        if until <= now:
+            del _throttled[key]
+        else:
+            return int(until - now) + 1, key
+    return 0, None
+
+def remember_throttled(key: str, seconds: int):
+    """Запоминает отказ по ключу в небольшом LRU-кэше процесса"""
+    _throttled[key] = time.monotonic() + seconds
+    _throttled.move_to_end(key)
+    while len(_throttled) > THROTTLE_CACHE_SIZE:
+        _throttled.popitem(last=False)
+
+def record_login_failure(cur, keys: list, lock_after: list) -> int:
+    """Учитывает неудачный вход по ключам; возвращает назначенный срок блокировки в секундах"""
+    cur.execute(
+        "SELECT login_throttle_fail(%s, %s, %s, %s) AS locked_for",
+        (keys, lock_after, LOCKOUT_BASE_SECONDS, LOCKOUT_MAX_SECONDS)
+    )
+    locked_for = cur.fetchone()['locked_for']
+    if locked_for:
+        print(json.dumps({'level': 'warning', 'function': 'auth', 'locked': keys, 'locked_for': locked_for}, ensure_ascii=False), flush=True)
+    return locked_for
+
+def throttled_response(retry_after: int, key: str, source: str) -> dict:
+    """Отказ 429 до проверки пароля; каждый отказ пишется в лог отдельной строкой"""
+    print(json.dumps({
+        'level': 'warning',
+        'function': 'auth',
+        'throttled': key,
+        'retry_after': retry_after,
+        'source': source
+    }, ensure_ascii=False), flush=True)
+    return {
+        'statusCode': 429,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Retry-After': str(retry_after)
+        },
+        'body': dump_json({
+            'error': f'Слишком много попыток входа, повторите через {retry_after} с',
+            'retry_after': retry_after
+        }),
+        'isBase64Encoded': False
+    }
+
+def _handle(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -28,12 +381,79 @@ def handler(event: dict, context) -> dict:
         return {
             'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
+            'body': dump_json({'error': 'Method not allowed'}),
             'isBase64Encoded': False
         }
     
+    conn = None
     try:
         body = json.loads(event.get('body', '{}'))
+        action = body.get('action', 'login')
+        
+        if action in ('refresh', 'logout'):
+            claims = verify_token(str(body.get('refresh_token') or ''), 'refresh')
+            if not claims:
+                return {
+                    'statusCode': 401,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dump_json({'error': 'Сессия недействительна, войдите заново'}),
+                    'isBase64Encoded': False
+                }
+            
+            conn = get_connection()
+            cur = conn.cursor(cursor_factory=TimedCursor)
+            
+            if action == 'logout':
+                cur.execute("""
+                    INSERT INTO revoked_tokens (jti, expires_at) VALUES (%s, to_timestamp(%s))
+                    ON CONFLICT (jti) DO NOTHING
+                """, (claims['jti'], claims['exp']))
+                cur.execute("DELETE FROM revoked_tokens WHERE expires_at < CURRENT_TIMESTAMP")
+                conn.commit()
+                remember_revoked(claims['jti'])
+                cur.close()
+                release_connection(conn)
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dump_json({'success': True}),
+                    'isBase64Encoded': False
+                }
+            
+            revoked = is_revoked(cur, claims['jti'])
+            user = None
+            if not revoked:
+                # Роль и группа берутся из БД, а не из старого токена: смена группы или роли
+                # действует с ближайшего продления, а удалённый пользователь сессию не продлит
+                cur.execute(REFRESH_QUERY, (claims.get('sub'),))
+                user = cur.fetchone()
+            cur.close()
+            release_connection(conn)
+            if revoked or not user:
+                return {
+                    'statusCode': 401,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dump_json({'error': 'Сессия недействительна, войдите заново'}),
+                    'isBase64Encoded': False
+                }
+            
+            session_claims = {
+                'sub': user['id'],
+                'role': user['role'],
+                'student_id': user['student_id'],
+                'group_id': user['group_id']
+            }
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': dump_json({
+                    'success': True,
+                    'access_token': sign_token(session_claims, 'access', ACCESS_TOKEN_TTL),
+                    'expires_in': ACCESS_TOKEN_TTL
+                }),
+                'isBase64Encoded': False
+            }
+        
         login = body.get('login', '').strip()
         password = body.get('password', '').strip()
         
@@ -41,39 +461,79 @@ def handler(event: dict, context) -> dict:
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Логин и пароль обязательны'}),
+                'body': dump_json({'error': 'Логин и пароль обязательны'}),
                 'isBase64Encoded': False
             }
         
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        # Ключи всегда в одном порядке: login_throttle_take блокирует их строки по порядку
+        ip_key = f'ip:{client_ip(event)[:THROTTLE_KEY_VALUE_MAX]}'
+        login_key = f'login:{login[:THROTTLE_KEY_VALUE_MAX]}'
+        keys = [ip_key, login_key]
+        retry_after, blocked_key = throttled_locally(keys)
+        if retry_after:
+            return throttled_response(retry_after, blocked_key, 'cache')
         
-        cur.execute(
-            "SELECT id, login, password_hash, role, full_name, email FROM users WHERE login = %s",
-            (login,)
-        )
-        user = cur.fetchone()
+        conn = get_connection()
+        cur = conn.cursor(cursor_factory=TimedCursor)
         
-        if not user:
+        # Корзины попыток, пользователь и строка ученика одним запросом; при отказе
+        # пользователь не читается. Соединение возвращается до bcrypt,
+        # чтобы проверка пароля не держала его занятым
+        cur.execute(LOGIN_QUERY, {
+            'keys': keys,
+            'burst': [IP_BURST, LOGIN_BURST],
+            'refill': [IP_REFILL_SECONDS, LOGIN_REFILL_SECONDS],
+            'forget': LOCKOUT_FORGET_SECONDS,
+            'login': login
+        })
+        user = cur.fetchone()
+        if user['retry_after']:
+            conn.commit()
             cur.close()
-            conn.close()
+            release_connection(conn)
+            conn = None
+            remember_throttled(user['blocked_key'], user['retry_after'])
+            return throttled_response(user['retry_after'], user['blocked_key'], 'db')
+        
+        if not user['id']:
+            # Несуществующий логин не стоит bcrypt, поэтому неудача учитывается только для IP
+            record_login_failure(cur, [ip_key], [IP_LOCKOUT_AFTER])
+        conn.commit()
+        cur.close()
+        release_connection(conn)
+        conn = None
+        
+        if not user['id']:
             return {
                 'statusCode': 401,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Неверный логин или пароль'}),
+                'body': dump_json({'error': 'Неверный логин или пароль'}),
                 'isBase64Encoded': False
             }
         
+        import bcrypt
         password_valid = bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8'))
         
-        if not password_valid:
+        if not password_valid or user['failures']:
+            conn = get_connection()
+            cur = conn.cursor(cursor_factory=TimedCursor)
+            if password_valid:
+                cur.execute(
+                    "UPDATE login_throttle SET failures = 0, failed_at = NULL, locked_until = NULL WHERE key = %s",
+                    (login_key,)
+                )
+            else:
+                record_login_failure(cur, keys, [IP_LOCKOUT_AFTER, LOCKOUT_AFTER])
+            conn.commit()
             cur.close()
-            conn.close()
+            release_connection(conn)
+            conn = None
+        
+        if not password_valid:
             return {
                 'statusCode': 401,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Неверный логин или пароль'}),
+                'body': dump_json({'error': 'Неверный логин или пароль'}),
                 'isBase64Encoded': False
             }
         
@@ -85,31 +545,39 @@ def handler(event: dict, context) -> dict:
             'email': user['email']
         }
         
-        if user['role'] == 'student':
-            cur.execute(
-                "SELECT id, group_id, balance FROM students WHERE user_id = %s",
-                (user['id'],)
-            )
-            student = cur.fetchone()
-            if student:
-                user_data['student_id'] = student['id']
-                user_data['group_id'] = student['group_id']
-                user_data['balance'] = student['balance']
+        if user['student_id']:
+            user_data['student_id'] = user['student_id']
+            user_data['group_id'] = user['group_id']
+            user_data['balance'] = user['balance']
         
-        cur.close()
-        conn.close()
+        response = {'success': True, 'user': user_data}
+        if SESSION_SECRET:
+            response.update(issue_tokens({
+                'sub': user['id'],
+                'role': user['role'],
+                'student_id': user_data.get('student_id'),
+                'group_id': user_data.get('group_id')
+            }))
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': True, 'user': user_data}),
+            'body': dump_json(response),
             'isBase64Encoded': False
         }
         
     except Exception as e:
+        current_timings().error = repr(e)
+        if conn is not None:
+            release_connection(conn, broken=isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)))
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'}),
+            'body': dump_json({'error': f'Ошибка сервера: {str(e)}'}),
             'isBase64Encoded': False
         }
+
+def handler(event: dict, context) -> dict:
+    timings = _request.timings = RequestTimings()
+    response = _handle(event, context)
+    return report_timings('auth', event, response, timings)
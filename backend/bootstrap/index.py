@@ -0,0 +1,351 @@
+"""
+Стартовые данные первого экрана одним запросом.
+Асинхронный обработчик на пуле asyncpg: независимые запросы выполняются
+одновременно на разных соединениях вместо последовательных вызовов функций.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+
+_request = threading.local()
+
+class RequestTimings:
+    """Замеры одного вызова: подключение к БД, SQL-запросы и сериализация ответа"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connect = 0.0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.statements = 0
+        self.slow_queries = []
+        self.error = None
+
+def current_timings() -> RequestTimings:
+    timings = getattr(_request, 'timings', None)
+    if timings is None:
+        timings = _request.timings = RequestTimings()
+    return timings
+
+BOOTSTRAP_POOL_SIZE = int(os.environ.get('BOOTSTRAP_POOL_SIZE', '4'))
+
+_loop = None
+_pool = None
+
+async def get_pool():
+    """Пул соединений asyncpg, переживающий вызовы в прогретом контейнере"""
+    global _pool
+    if _pool is None:
+        import asyncpg
+        started = time.perf_counter()
+        _pool = await asyncpg.create_pool(os.environ['DATABASE_URL'], min_size=1, max_size=BOOTSTRAP_POOL_SIZE)
+        current_timings().connect += time.perf_counter() - started
+    return _pool
+
+async def fetch(pool, query: str, *args) -> list:
+    """Запрос на свободном соединении пула; строки возвращаются словарями"""
+    started = time.perf_counter()
+    rows = await pool.fetch(query, *args)
+    elapsed = time.perf_counter() - started
+    timings = current_timings()
+    timings.statements += 1
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        timings.slow_queries.append({'ms': round(elapsed * 1000, 1), 'query': ' '.join(query.split())[:300]})
+    return [dict(row) for row in rows]
+
+async def gather_queries(pool, **queries) -> dict:
+    """
+    Выполняет независимые запросы одновременно, каждый на своём соединении пула.
+    В db попадает общее время ожидания, а не сумма времени запросов.
+    """
+    started = time.perf_counter()
+    results = await asyncio.gather(*(fetch(pool, query, *args) for query, *args in queries.values()))
+    current_timings().db += time.perf_counter() - started
+    return dict(zip(queries, results))
+
+orjson = None
+_orjson_checked = False
+
+def load_orjson():
+    """
+    Импортирует orjson при первой сериализации, а не при загрузке модуля:
+    preflight обходится без него на холодном старте. Возвращает None, если он не установлен.
+    """
+    global orjson, _orjson_checked
+    if not _orjson_checked:
+        _orjson_checked = True
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+    return orjson
+
+def dump_json(data) -> str:
+    """
+    Сериализует тело ответа с замером времени: orjson, если он установлен, иначе компактный json.
+    default=str остаётся запасным путём для дат и Decimal.
+    """
+    started = time.perf_counter()
+    if load_orjson() is not None:
+        body = orjson.dumps(data, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+    else:
+        body = json.dumps(data, default=str, ensure_ascii=False, separators=(',', ':'))
+    current_timings().serialize += time.perf_counter() - started
+    return body
+
+def report_timings(function: str, event: dict, response: dict, timings: RequestTimings) -> dict:
+    """Добавляет в ответ заголовок Server-Timing и пишет в лог JSON-строку с замерами"""
+    total = time.perf_counter() - timings.started
+    response.setdefault('headers', {})
+    response['headers']['Server-Timing'] = (
+        f'connect;dur={timings.connect * 1000:.1f}, '
+        f'db;dur={timings.db * 1000:.1f};desc="{timings.statements} queries", '
+        f'serialize;dur={timings.serialize * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+    response['headers']['Timing-Allow-Origin'] = '*'
+    record = {
+        'level': 'warning' if timings.slow_queries or timings.error else 'info',
+        'function': function,
+        'method': event.get('httpMethod', 'GET'),
+        'status': response.get('statusCode'),
+        'total_ms': round(total * 1000, 1),
+        'connect_ms': round(timings.connect * 1000, 1),
+        'db_ms': round(timings.db * 1000, 1),
+        'statements': timings.statements,
+        'serialize_ms': round(timings.serialize * 1000, 1)
+    }
+    if timings.slow_queries:
+        record['slow_queries'] = timings.slow_queries
+    if timings.error:
+        record['error'] = timings.error
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+    return response
+
+SESSION_SECRET = os.environ.get('SESSION_SECRET', '')
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED') == '1'
+# Без секрета ни один токен не проверить: с AUTH_REQUIRED=1 функция отказала бы каждому
+# запросу, поэтому падает при загрузке, а не отвечает 401 на любой X-Authorization
+if AUTH_REQUIRED and not SESSION_SECRET:
+    raise RuntimeError('AUTH_REQUIRED=1 требует SESSION_SECRET')
+
+def verify_token(token: str):
+    """Проверяет access-токен функции auth по подписи и сроку, без обращения к БД"""
+    if not SESSION_SECRET:
+        return None
+    try:
+        body, signature = token.split('.')
+        expected = hmac.new(SESSION_SECRET.encode('utf-8'), body.encode('ascii'), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, base64.urlsafe_b64decode(signature + '=' * (-len(signature) % 4))):
+            return None
+        payload = json.loads(base64.urlsafe_b64decode(body + '=' * (-len(body) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('typ') != 'access' or payload.get('exp', 0) < time.time():
+        return None
+    return payload
+
+def authenticate(event: dict):
+    """
+    Возвращает (payload токена из X-Authorization или None, отказать ли в доступе).
+    Отказ — при недействительном токене или его отсутствии при AUTH_REQUIRED=1.
+    Без SESSION_SECRET auth не выдаёт токены, и заголовок не проверяется: запрос анонимный.
+    """
+    headers = event.get('headers') or {}
+    header = headers.get('X-Authorization') or headers.get('x-authorization') or ''
+    token = header[7:] if header.startswith('Bearer ') else header
+    if not token or not SESSION_SECRET:
+        return None, AUTH_REQUIRED
+    identity = verify_token(token)
+    return identity, identity is None
+
+USER_QUERY = """
+    SELECT u.id, u.login, u.role, u.full_name, u.email,
+           s.id AS student_id, s.group_id, s.balance
+    FROM users u
+    LEFT JOIN students s ON s.user_id = u.id
+    WHERE u.id = $1
+"""
+
+GROUPS_QUERY = """
+    SELECT g.*, u.full_name as trainer_name,
+           COUNT(s.id) as student_count
+    FROM groups g
+    LEFT JOIN users u ON g.trainer_id = u.id
+    LEFT JOIN students s ON s.group_id = g.id
+    WHERE g.is_archived = FALSE
+    GROUP BY g.id, u.full_name
+    ORDER BY g.created_at DESC
+"""
+
+STUDENTS_QUERY = """
+    SELECT s.*, u.full_name, u.login, u.email, u.phone, g.name as group_name,
+           CASE WHEN s.total_sessions > 0
+                THEN ROUND(s.total_visits * 100.0 / s.total_sessions)::int
+                ELSE 0
+           END as attendance_percentage
+    FROM students s
+    JOIN users u ON s.user_id = u.id
+    LEFT JOIN groups g ON s.group_id = g.id
+    ORDER BY u.full_name, s.id
+    LIMIT $1
+"""
+
+RECENT_TRANSACTIONS_QUERY = """
+    SELECT t.*, u1.full_name as student_name, u2.full_name as created_by_name
+    FROM transactions t
+    JOIN students s ON t.student_id = s.id
+    JOIN users u1 ON s.user_id = u1.id
+    LEFT JOIN users u2 ON t.created_by = u2.id
+    ORDER BY t.created_at DESC, t.id DESC
+    LIMIT $1
+"""
+
+# Группа берётся из строки ученика, а не из токена: после перевода в другую группу
+# access-токен ещё до 15 минут несёт старый group_id
+STUDENT_GROUP_QUERY = """
+    SELECT g.*, u.full_name as trainer_name
+    FROM students s
+    JOIN groups g ON g.id = s.group_id
+    LEFT JOIN users u ON g.trainer_id = u.id
+    WHERE s.id = $1
+"""
+
+STUDENT_ATTENDANCE_QUERY = """
+    SELECT a.*, g.name as group_name
+    FROM attendance a
+    JOIN groups g ON a.group_id = g.id
+    WHERE a.student_id = $1
+    ORDER BY a.session_date DESC, a.id DESC
+    LIMIT $2
+"""
+
+STUDENT_TRANSACTIONS_QUERY = """
+    SELECT t.*
+    FROM transactions t
+    WHERE t.student_id = $1
+    ORDER BY t.created_at DESC, t.id DESC
+    LIMIT $2
+"""
+
+STUDENTS_LIMIT = 500
+RECENT_LIMIT = 20
+
+def encode_cursor(*key) -> str:
+    """Курсор продолжения для функции students, в её формате"""
+    raw = json.dumps(key, default=str, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+async def load_staff_screen(pool, user_id: int) -> dict:
+    """Первый экран тренера и администратора: группы, ученики и последние операции"""
+    results = await gather_queries(
+        pool,
+        user=(USER_QUERY, user_id),
+        groups=(GROUPS_QUERY,),
+        students=(STUDENTS_QUERY, STUDENTS_LIMIT + 1),
+        transactions=(RECENT_TRANSACTIONS_QUERY, RECENT_LIMIT)
+    )
+    students = results['students']
+    next_cursor = None
+    if len(students) > STUDENTS_LIMIT:
+        students = students[:STUDENTS_LIMIT]
+        next_cursor = encode_cursor(students[-1]['full_name'], students[-1]['id'])
+    return {
+        'user': results['user'][0] if results['user'] else None,
+        'groups': results['groups'],
+        'students': students,
+        'students_next_cursor': next_cursor,
+        'transactions': results['transactions']
+    }
+
+async def load_student_screen(pool, user_id: int, student_id: int) -> dict:
+    """Первый экран ученика: своя группа, последние посещения и операции"""
+    results = await gather_queries(
+        pool,
+        user=(USER_QUERY, user_id),
+        group=(STUDENT_GROUP_QUERY, student_id),
+        attendance=(STUDENT_ATTENDANCE_QUERY, student_id, RECENT_LIMIT),
+        transactions=(STUDENT_TRANSACTIONS_QUERY, student_id, RECENT_LIMIT)
+    )
+    return {
+        'user': results['user'][0] if results['user'] else None,
+        'group': results['group'][0] if results['group'] else None,
+        'attendance': results['attendance'],
+        'transactions': results['transactions']
+    }
+
+async def _handle(event: dict, context) -> dict:
+    method = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Authorization',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    identity, denied = authenticate(event)
+    if denied or identity is None:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': 'Требуется авторизация'}),
+            'isBase64Encoded': False
+        }
+    
+    try:
+        pool = await get_pool()
+        user_id = int(identity['sub'])
+        if identity.get('role') == 'student' and identity.get('student_id'):
+            result = await load_student_screen(pool, user_id, int(identity['student_id']))
+        else:
+            result = await load_staff_screen(pool, user_id)
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json(result),
+            'isBase64Encoded': False
+        }
+        
+    except Exception as e:
+        current_timings().error = repr(e)
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': f'Ошибка сервера: {str(e)}'}),
+            'isBase64Encoded': False
+        }
+
+def handler(event: dict, context) -> dict:
+    """
+    Обработчик платформы синхронный, поэтому корутина выполняется на одном
+    цикле событий на весь контейнер: пул asyncpg привязан к циклу, где создан.
+    """
+    global _loop
+    timings = _request.timings = RequestTimings()
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    response = _loop.run_until_complete(_handle(event, context))
+    return report_timings('bootstrap', event, response, timings)
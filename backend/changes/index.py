@@ -0,0 +1,387 @@
+"""
+Лента изменений для клиентов вместо периодического опроса списков.
+Отдаёт события после номера since; если новых нет, ждёт их до wait секунд
+через LISTEN change_events (long-poll) и отвечает, как только они появятся.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import select
+import threading
+import time
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '1'))
+DB_PING_AFTER = float(os.environ.get('DB_PING_AFTER', '30'))
+
+_pool = None
+_conn = None
+_last_used = {}
+
+def _connection_alive(conn) -> bool:
+    """Дешёвая проверка соединения: статус транзакции, а после простоя — SELECT 1"""
+    if conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        last_used = _last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used > DB_PING_AFTER:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+def get_connection():
+    """
+    Возвращает соединение с БД, переживающее вызовы в прогретом контейнере.
+    При DB_POOL_SIZE > 1 соединения выдаются из ограниченного пула.
+    """
+    started = time.perf_counter()
+    try:
+        load_psycopg2()
+        return _acquire_connection()
+    finally:
+        current_timings().connect += time.perf_counter() - started
+
+def _acquire_connection():
+    global _pool, _conn
+    if DB_POOL_SIZE > 1:
+        if _pool is None:
+            _pool = psycopg2.pool.ThreadedConnectionPool(1, DB_POOL_SIZE, os.environ['DATABASE_URL'])
+        conn = _pool.getconn()
+        if not _connection_alive(conn):
+            _pool.putconn(conn, close=True)
+            conn = _pool.getconn()
+        return conn
+    if _conn is None or not _connection_alive(_conn):
+        if _conn is not None and not _conn.closed:
+            _conn.close()
+        _conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    return _conn
+
+def release_connection(conn, broken: bool = False):
+    """Возвращает соединение для повторного использования, незавершённая транзакция откатывается"""
+    global _conn
+    if not broken and not conn.closed:
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    _last_used[id(conn)] = time.monotonic()
+    if _pool is not None:
+        _pool.putconn(conn, close=broken or bool(conn.closed))
+    elif broken:
+        if not conn.closed:
+            conn.close()
+        _conn = None
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+
+_request = threading.local()
+
+class RequestTimings:
+    """Замеры одного вызова: подключение к БД, SQL-запросы и сериализация ответа"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connect = 0.0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.statements = 0
+        self.slow_queries = []
+        self.error = None
+
+def current_timings() -> RequestTimings:
+    timings = getattr(_request, 'timings', None)
+    if timings is None:
+        timings = _request.timings = RequestTimings()
+    return timings
+
+class TimedCursorMixin:
+    """Считает запросы курсора, их время и отмечает медленные"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            timings = current_timings()
+            timings.db += elapsed
+            timings.statements += 1
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                timings.slow_queries.append({'ms': round(elapsed * 1000, 1), 'query': ' '.join(query.split())[:300]})
+
+psycopg2 = None
+TimedCursor = None
+
+def load_psycopg2():
+    """
+    Импортирует драйвер БД при первом подключении, а не при загрузке модуля:
+    preflight и отказы до обращения к БД обходятся без него на холодном старте.
+    """
+    global psycopg2, TimedCursor
+    if TimedCursor is None:
+        import psycopg2
+        import psycopg2.extensions
+        import psycopg2.extras
+        import psycopg2.pool
+
+        class TimedCursor(TimedCursorMixin, psycopg2.extras.RealDictCursor):
+            """Курсор со строками-словарями для логики обработчика"""
+    return psycopg2
+
+orjson = None
+_orjson_checked = False
+
+def load_orjson():
+    """
+    Импортирует orjson при первой сериализации, а не при загрузке модуля:
+    preflight обходится без него на холодном старте. Возвращает None, если он не установлен.
+    """
+    global orjson, _orjson_checked
+    if not _orjson_checked:
+        _orjson_checked = True
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+    return orjson
+
+def dump_json(data) -> str:
+    """
+    Сериализует тело ответа с замером времени: orjson, если он установлен, иначе компактный json.
+    default=str остаётся запасным путём для дат и Decimal.
+    """
+    started = time.perf_counter()
+    if load_orjson() is not None:
+        body = orjson.dumps(data, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+    else:
+        body = json.dumps(data, default=str, ensure_ascii=False, separators=(',', ':'))
+    current_timings().serialize += time.perf_counter() - started
+    return body
+
+def report_timings(function: str, event: dict, response: dict, timings: RequestTimings) -> dict:
+    """Добавляет в ответ заголовок Server-Timing и пишет в лог JSON-строку с замерами"""
+    total = time.perf_counter() - timings.started
+    response.setdefault('headers', {})
+    response['headers']['Server-Timing'] = (
+        f'connect;dur={timings.connect * 1000:.1f}, '
+        f'db;dur={timings.db * 1000:.1f};desc="{timings.statements} queries", '
+        f'serialize;dur={timings.serialize * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+    response['headers']['Timing-Allow-Origin'] = '*'
+    record = {
+        'level': 'warning' if timings.slow_queries or timings.error else 'info',
+        'function': function,
+        'method': event.get('httpMethod', 'GET'),
+        'status': response.get('statusCode'),
+        'total_ms': round(total * 1000, 1),
+        'connect_ms': round(timings.connect * 1000, 1),
+        'db_ms': round(timings.db * 1000, 1),
+        'statements': timings.statements,
+        'serialize_ms': round(timings.serialize * 1000, 1)
+    }
+    if timings.slow_queries:
+        record['slow_queries'] = timings.slow_queries
+    if timings.error:
+        record['error'] = timings.error
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+    return response
+
+SESSION_SECRET = os.environ.get('SESSION_SECRET', '')
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED') == '1'
+# Без секрета ни один токен не проверить: с AUTH_REQUIRED=1 функция отказала бы каждому
+# запросу, поэтому падает при загрузке, а не отвечает 401 на любой X-Authorization
+if AUTH_REQUIRED and not SESSION_SECRET:
+    raise RuntimeError('AUTH_REQUIRED=1 требует SESSION_SECRET')
+
+def verify_token(token: str):
+    """Проверяет access-токен функции auth по подписи и сроку, без обращения к БД"""
+    if not SESSION_SECRET:
+        return None
+    try:
+        body, signature = token.split('.')
+        expected = hmac.new(SESSION_SECRET.encode('utf-8'), body.encode('ascii'), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, base64.urlsafe_b64decode(signature + '=' * (-len(signature) % 4))):
+            return None
+        payload = json.loads(base64.urlsafe_b64decode(body + '=' * (-len(body) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('typ') != 'access' or payload.get('exp', 0) < time.time():
+        return None
+    return payload
+
+def authenticate(event: dict):
+    """
+    Возвращает (payload токена из X-Authorization или None, отказать ли в доступе).
+    Отказ — при недействительном токене или его отсутствии при AUTH_REQUIRED=1.
+    Без SESSION_SECRET auth не выдаёт токены, и заголовок не проверяется: запрос анонимный.
+    """
+    headers = event.get('headers') or {}
+    header = headers.get('X-Authorization') or headers.get('x-authorization') or ''
+    token = header[7:] if header.startswith('Bearer ') else header
+    if not token or not SESSION_SECRET:
+        return None, AUTH_REQUIRED
+    identity = verify_token(token)
+    return identity, identity is None
+
+
+CHANGES_LIMIT = 500
+MAX_WAIT_SECONDS = 25
+
+CHANGES_QUERY = """
+    SELECT json_build_object(
+        'events', COALESCE(json_agg(json_build_object(
+            'seq', e.seq, 'entity', e.entity, 'id', e.entity_id, 'data', e.data, 'at', e.created_at
+        ) ORDER BY e.seq), '[]'::json),
+        'last_seq', COALESCE(MAX(e.seq), %(since)s),
+        'has_more', COUNT(*) = %(limit)s,
+        'reset', COALESCE(%(since)s + 1 < (SELECT MIN(seq) FROM change_events), FALSE)
+    )::text AS changes,
+    COUNT(*) AS found
+    FROM (
+        SELECT seq, entity, entity_id, data, created_at
+        FROM change_events
+        WHERE seq > %(since)s
+        ORDER BY seq
+        LIMIT %(limit)s
+    ) e
+"""
+
+def last_seq(cur) -> int:
+    cur.execute("SELECT COALESCE(MAX(seq), 0) AS seq FROM change_events")
+    return cur.fetchone()['seq']
+
+def wait_for_changes(conn, since: int, timeout: float) -> bool:
+    """
+    Ждёт уведомления о событии с номером больше since не дольше timeout секунд.
+    После LISTEN лента проверяется ещё раз, чтобы не пропустить событие,
+    зафиксированное между первым чтением и подпиской.
+    """
+    conn.autocommit = True
+    try:
+        with conn.cursor(cursor_factory=TimedCursor) as cur:
+            cur.execute('LISTEN change_events')
+            if last_seq(cur) > since:
+                return True
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([conn], [], [], remaining)[0]:
+                return False
+            conn.poll()
+            arrived = any(int(notify.payload or 0) > since for notify in conn.notifies)
+            conn.notifies.clear()
+            if arrived:
+                return True
+    finally:
+        if not conn.closed:
+            with conn.cursor() as cur:
+                cur.execute('UNLISTEN change_events')
+            conn.notifies.clear()
+            conn.autocommit = False
+
+def _handle(event: dict, context) -> dict:
+    method = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Authorization',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    identity, denied = authenticate(event)
+    if denied:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': 'Требуется авторизация'}),
+            'isBase64Encoded': False
+        }
+    if identity and identity.get('role') == 'student':
+        return {
+            'statusCode': 403,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': 'Лента изменений доступна только тренерам и администраторам'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = None
+    try:
+        params = event.get('queryStringParameters', {}) or {}
+        
+        try:
+            since = int(params['since']) if params.get('since') else None
+            wait = max(0, min(int(params.get('wait') or MAX_WAIT_SECONDS), MAX_WAIT_SECONDS))
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': dump_json({'error': 'Некорректные since или wait'}),
+                'isBase64Encoded': False
+            }
+        
+        conn = get_connection()
+        cur = conn.cursor(cursor_factory=TimedCursor)
+        
+        if since is None:
+            # Клиент запоминает номер до загрузки данных и затем получает всё, что изменилось после него
+            body = dump_json({'events': [], 'last_seq': last_seq(cur), 'has_more': False, 'reset': False})
+        else:
+            query = {'since': since, 'limit': CHANGES_LIMIT}
+            cur.execute(CHANGES_QUERY, query)
+            changes = cur.fetchone()
+            if wait and not changes['found']:
+                conn.rollback()
+                if wait_for_changes(conn, since, wait):
+                    cur.execute(CHANGES_QUERY, query)
+                    changes = cur.fetchone()
+            body = changes['changes']
+        
+        cur.close()
+        release_connection(conn)
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Cache-Control': 'no-store'},
+            'body': body,
+            'isBase64Encoded': False
+        }
+        
+    except Exception as e:
+        current_timings().error = repr(e)
+        if conn is not None:
+            release_connection(conn, broken=isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)))
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': f'Ошибка сервера: {str(e)}'}),
+            'isBase64Encoded': False
+        }
+
+def handler(event: dict, context) -> dict:
+    timings = _request.timings = RequestTimings()
+    response = _handle(event, context)
+    return report_timings('changes', event, response, timings)
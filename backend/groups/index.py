@@ -2,12 +2,371 @@
 API управления группами.
 Позволяет создавать, читать, обновлять группы и управлять учениками.
 """
+import base64
+import hashlib
+import hmac
 import json
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import threading
+import time
+from collections import OrderedDict
 
-def handler(event: dict, context) -> dict:
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '1'))
+DB_PING_AFTER = float(os.environ.get('DB_PING_AFTER', '30'))
+
+_pool = None
+_conn = None
+_last_used = {}
+
+def _connection_alive(conn) -> bool:
+    """Дешёвая проверка соединения: статус транзакции, а после простоя — SELECT 1"""
+    if conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        last_used = _last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used > DB_PING_AFTER:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+def get_connection():
+    """
+    Возвращает соединение с БД, переживающее вызовы в прогретом контейнере.
+    При DB_POOL_SIZE > 1 соединения выдаются из ограниченного пула.
+    """
+    started = time.perf_counter()
+    try:
+        load_psycopg2()
+        return _acquire_connection()
+    finally:
+        current_timings().connect += time.perf_counter() - started
+
+def _acquire_connection():
+    global _pool, _conn
+    if DB_POOL_SIZE > 1:
+        if _pool is None:
+            _pool = psycopg2.pool.ThreadedConnectionPool(1, DB_POOL_SIZE, os.environ['DATABASE_URL'])
+        conn = _pool.getconn()
+        if not _connection_alive(conn):
+            _pool.putconn(conn, close=True)
+            conn = _pool.getconn()
+        return conn
+    if _conn is None or not _connection_alive(_conn):
+        if _conn is not None and not _conn.closed:
+            _conn.close()
+        _conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    return _conn
+
+def release_connection(conn, broken: bool = False):
+    """Возвращает соединение для повторного использования, незавершённая транзакция откатывается"""
+    global _conn
+    if not broken and not conn.closed:
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    _last_used[id(conn)] = time.monotonic()
+    if _pool is not None:
+        _pool.putconn(conn, close=broken or bool(conn.closed))
+    elif broken:
+        if not conn.closed:
+            conn.close()
+        _conn = None
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+
+_request = threading.local()
+
+class RequestTimings:
+    """Замеры одного вызова: подключение к БД, SQL-запросы и сериализация ответа"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connect = 0.0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.statements = 0
+        self.slow_queries = []
+        self.error = None
+
+def current_timings() -> RequestTimings:
+    timings = getattr(_request, 'timings', None)
+    if timings is None:
+        timings = _request.timings = RequestTimings()
+    return timings
+
+class TimedCursorMixin:
+    """Считает запросы курсора, их время и отмечает медленные"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            timings = current_timings()
+            timings.db += elapsed
+            timings.statements += 1
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                timings.slow_queries.append({'ms': round(elapsed * 1000, 1), 'query': ' '.join(query.split())[:300]})
+
+psycopg2 = None
+TimedCursor = None
+TimedTupleCursor = None
+
+def load_psycopg2():
+    """
+    Импортирует драйвер БД при первом подключении, а не при загрузке модуля:
+    preflight и отказы до обращения к БД обходятся без него на холодном старте.
+    """
+    global psycopg2, TimedCursor, TimedTupleCursor
+    if TimedCursor is None:
+        import psycopg2
+        import psycopg2.extensions
+        import psycopg2.extras
+        import psycopg2.pool
+
+        class TimedCursor(TimedCursorMixin, psycopg2.extras.RealDictCursor):
+            """Курсор со строками-словарями для логики обработчика"""
+
+        class TimedTupleCursor(TimedCursorMixin, psycopg2.extensions.cursor):
+            """Курсор с кортежами для выборок, которые целиком уходят в ответ через encode_rows"""
+    return psycopg2
+
+# date, time, timestamp, timestamptz, numeric — в ответе они передаются строками
+TEXT_COLUMN_TYPES = {1082, 1083, 1114, 1184, 1700}
+
+def encode_rows(description, rows) -> list:
+    """
+    Превращает строки кортежного курсора в словари для ответа.
+    Колонки, которые нужно привести к строке, находятся один раз по описанию курсора,
+    поэтому сериализатору не приходится вызывать default= для каждого значения.
+    """
+    columns = [column.name for column in description]
+    text_columns = [index for index, column in enumerate(description) if column.type_code in TEXT_COLUMN_TYPES]
+    if not text_columns:
+        return [dict(zip(columns, row)) for row in rows]
+    result = []
+    for row in rows:
+        row = list(row)
+        for index in text_columns:
+            if row[index] is not None:
+                row[index] = str(row[index])
+        result.append(dict(zip(columns, row)))
+    return result
+
+orjson = None
+_orjson_checked = False
+
+def load_orjson():
+    """
+    Импортирует orjson при первой сериализации, а не при загрузке модуля:
+    preflight обходится без него на холодном старте. Возвращает None, если он не установлен.
+    """
+    global orjson, _orjson_checked
+    if not _orjson_checked:
+        _orjson_checked = True
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+    return orjson
+
+def dump_json(data) -> str:
+    """
+    Сериализует тело ответа с замером времени: orjson, если он установлен, иначе компактный json.
+    default=str остаётся запасным путём для одиночных дат и Decimal вне encode_rows.
+    """
+    started = time.perf_counter()
+    if load_orjson() is not None:
+        body = orjson.dumps(data, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+    else:
+        body = json.dumps(data, default=str, ensure_ascii=False, separators=(',', ':'))
+    current_timings().serialize += time.perf_counter() - started
+    return body
+
+def report_timings(function: str, event: dict, response: dict, timings: RequestTimings) -> dict:
+    """Добавляет в ответ заголовок Server-Timing и пишет в лог JSON-строку с замерами"""
+    total = time.perf_counter() - timings.started
+    response.setdefault('headers', {})
+    response['headers']['Server-Timing'] = (
+        f'connect;dur={timings.connect * 1000:.1f}, '
+        f'db;dur={timings.db * 1000:.1f};desc="{timings.statements} queries", '
+        f'serialize;dur={timings.serialize * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+    response['headers']['Timing-Allow-Origin'] = '*'
+    record = {
+        'level': 'warning' if timings.slow_queries or timings.error else 'info',
+        'function': function,
+        'method': event.get('httpMethod', 'GET'),
+        'status': response.get('statusCode'),
+        'total_ms': round(total * 1000, 1),
+        'connect_ms': round(timings.connect * 1000, 1),
+        'db_ms': round(timings.db * 1000, 1),
+        'statements': timings.statements,
+        'serialize_ms': round(timings.serialize * 1000, 1)
+    }
+    if timings.slow_queries:
+        record['slow_queries'] = timings.slow_queries
+    if timings.error:
+        record['error'] = timings.error
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+    return response
+
+SESSION_SECRET = os.environ.get('SESSION_SECRET', '')
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED') == '1'
+# Без секрета ни один токен не проверить: с AUTH_REQUIRED=1 функция отказала бы каждому
+# запросу, поэтому падает при загрузке, а не отвечает 401 на любой X-Authorization
+if AUTH_REQUIRED and not SESSION_SECRET:
+    raise RuntimeError('AUTH_REQUIRED=1 требует SESSION_SECRET')
+
+def verify_token(token: str):
+    """Проверяет access-токен функции auth по подписи и сроку, без обращения к БД"""
+    if not SESSION_SECRET:
+        return None
+    try:
+        body, signature = token.split('.')
+        expected = hmac.new(SESSION_SECRET.encode('utf-8'), body.encode('ascii'), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, base64.urlsafe_b64decode(signature + '=' * (-len(signature) % 4))):
+            return None
+        payload = json.loads(base64.urlsafe_b64decode(body + '=' * (-len(body) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('typ') != 'access' or payload.get('exp', 0) < time.time():
+        return None
+    return payload
+
+def authenticate(event: dict):
+    """
+    Возвращает (payload токена из X-Authorization или None, отказать ли в доступе).
+    Отказ — при недействительном токене или его отсутствии при AUTH_REQUIRED=1.
+    Без SESSION_SECRET auth не выдаёт токены, и заголовок не проверяется: запрос анонимный.
+    """
+    headers = event.get('headers') or {}
+    header = headers.get('X-Authorization') or headers.get('x-authorization') or ''
+    token = header[7:] if header.startswith('Bearer ') else header
+    if not token or not SESSION_SECRET:
+        return None, AUTH_REQUIRED
+    identity = verify_token(token)
+    return identity, identity is None
+
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '300'))
+CACHE_VERSION_TTL = float(os.environ.get('CACHE_VERSION_TTL', '5'))
+CACHE_SIZE = 256
+
+class MemoryCache:
+    """TTL/LRU-кэш процесса. Другой бэкенд с теми же get/set можно присвоить cache_backend"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.items = OrderedDict()
+
+    def get(self, key: str):
+        item = self.items.get(key)
+        if item is None or item[1] < time.monotonic():
+            return None
+        self.items.move_to_end(key)
+        return item[0]
+
+    def set(self, key: str, value, ttl: float):
+        self.items[key] = (value, time.monotonic() + ttl)
+        self.items.move_to_end(key)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+cache_backend = MemoryCache(CACHE_SIZE)
+_versions = {}
+_versions_checked_at = 0.0
+
+def cache_versions(cur, max_age: float = CACHE_VERSION_TTL) -> dict:
+    """Штампы версий из cache_versions; перечитываются, если прочитаны больше max_age секунд назад"""
+    global _versions, _versions_checked_at
+    if time.monotonic() - _versions_checked_at >= max_age:
+        cur.execute("SELECT scope, version FROM cache_versions")
+        _versions = {row['scope']: row['version'] for row in cur.fetchall()}
+        _versions_checked_at = time.monotonic()
+    return _versions
+
+def cached(cur, name: str, scopes: tuple, loader):
+    """Значение из кэша или loader(cur) при промахе; ключ включает текущие версии scopes"""
+    versions = cache_versions(cur)
+    key = name + ':' + ':'.join(str(versions.get(scope, 0)) for scope in scopes)
+    value = cache_backend.get(key)
+    if value is None:
+        value = loader(cur)
+        cache_backend.set(key, value, CACHE_TTL)
+    return value
+
+def bump_cache_versions(cur, *scopes) -> dict:
+    """
+    Инвалидирует кэши функций во всех контейнерах, увеличивая версии scopes, в транзакции записи:
+    версия и данные фиксируются вместе, и сбой после COMMIT не оставит устаревший ETag.
+    Строки блокируются в порядке имён. Возвращает новые версии: вызывающий код переносит их
+    в _versions своего контейнера только после COMMIT, чтобы откат не оставил версию, которой нет в БД.
+    """
+    cur.execute("""
+        INSERT INTO cache_versions (scope, version)
+        SELECT unnest(%s::text[]), 1
+        ON CONFLICT (scope) DO UPDATE SET version = cache_versions.version + 1
+        RETURNING scope, version
+    """, (sorted(set(scopes)),))
+    return {row['scope']: row['version'] for row in cur.fetchall()}
+
+def record_changes(cur, events: list):
+    """
+    Добавляет события в ленту изменений. Вызывается последним шагом перед COMMIT:
+    вставка берёт блокировку ленты, которая держится до конца транзакции.
+    """
+    if not events:
+        return
+    cur.execute("""
+        INSERT INTO change_events (entity, entity_id, data)
+        SELECT entity, entity_id, data
+        FROM jsonb_to_recordset(%s::jsonb) AS e(entity text, entity_id integer, data jsonb)
+    """, (json.dumps(events, default=str, ensure_ascii=False),))
+
+def make_etag(versions: dict, scopes: list, params: dict) -> str:
+    """Слабый ETag из версий данных scopes и параметров запроса"""
+    raw = json.dumps([[versions.get(scope, 0) for scope in scopes], params], sort_keys=True, default=str)
+    return 'W/"' + hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20] + '"'
+
+def not_modified(event: dict, etag: str):
+    """Ответ 304, если клиент прислал тот же ETag (или *) в If-None-Match, иначе None"""
+    headers = event.get('headers') or {}
+    header = headers.get('If-None-Match') or headers.get('if-none-match') or ''
+    tags = [tag.strip() for tag in header.split(',')]
+    if etag not in tags and '*' not in tags:
+        return None
+    return {
+        'statusCode': 304,
+        'headers': {'ETag': etag, 'Cache-Control': 'no-cache', 'Access-Control-Allow-Origin': '*'},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def load_group_listing(cur) -> list:
+    """Активные группы с тренером и числом учеников"""
+    with cur.connection.cursor(cursor_factory=TimedTupleCursor) as rows_cur:
+        rows_cur.execute("""
+            SELECT g.*, u.full_name as trainer_name,
+                   COUNT(s.id) as student_count
+            FROM groups g
+            LEFT JOIN users u ON g.trainer_id = u.id
+            LEFT JOIN students s ON s.group_id = g.id
+            WHERE g.is_archived = FALSE
+            GROUP BY g.id, u.full_name
+            ORDER BY g.created_at DESC
+        """)
+        return encode_rows(rows_cur.description, rows_cur.fetchall())
+
+def _handle(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -23,31 +382,37 @@ def handler(event: dict, context) -> dict:
             'isBase64Encoded': False
         }
     
+    identity, denied = authenticate(event)
+    if denied:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': 'Требуется авторизация'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = None
     try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        conn = get_connection()
+        cur = conn.cursor(cursor_factory=TimedCursor)
         
         if method == 'GET':
-            cur.execute("""
-                SELECT g.*, u.full_name as trainer_name,
-                       COUNT(s.id) as student_count
-                FROM groups g
-                LEFT JOIN users u ON g.trainer_id = u.id
-                LEFT JOIN students s ON s.group_id = g.id
-                WHERE g.is_archived = FALSE
-                GROUP BY g.id, u.full_name
-                ORDER BY g.created_at DESC
-            """)
-            groups = cur.fetchall()
+            etag = make_etag(cache_versions(cur, max_age=0), ['groups', 'students'], {})
+            unchanged = not_modified(event, etag)
+            if unchanged:
+                cur.close()
+                release_connection(conn)
+                return unchanged
+            
+            groups = cached(cur, 'group_listing', ('groups', 'students'), load_group_listing)
             
             cur.close()
-            conn.close()
+            release_connection(conn)
             
             return {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'groups': [dict(g) for g in groups]}, default=str),
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'ETag': etag, 'Cache-Control': 'no-cache'},
+                'body': dump_json({'groups': groups}),
                 'isBase64Encoded': False
             }
         
@@ -60,46 +425,62 @@ def handler(event: dict, context) -> dict:
             
             if not name:
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Название группы обязательно'}),
+                    'body': dump_json({'error': 'Название группы обязательно'}),
                     'isBase64Encoded': False
                 }
             
             cur.execute("""
                 INSERT INTO groups (name, trainer_id, schedule, cost_per_session)
                 VALUES (%s, %s, %s, %s)
-                RETURNING id, name, trainer_id, schedule, cost_per_session, created_at
+                RETURNING id, name, trainer_id, schedule, schedule_days, schedule_time, cost_per_session, created_at
             """, (name, trainer_id, schedule, cost_per_session))
             
+            # Неразобранное расписание сохраняется текстом с schedule_days = NULL:
+            # группа создаётся, но не участвует в прогнозе балансов stats?at_risk
             new_group = cur.fetchone()
+            result = {'success': True, 'group': dict(new_group)}
+            if schedule and not new_group['schedule_days']:
+                result['warning'] = 'Не удалось разобрать дни занятий, пример: ПН, СР, ПТ 16:00'
+            bumped = bump_cache_versions(cur, 'groups')
+            record_changes(cur, [{'entity': 'group', 'entity_id': new_group['id'], 'data': dict(new_group)}])
             conn.commit()
+            _versions.update(bumped)
             cur.close()
-            conn.close()
+            release_connection(conn)
             
             return {
                 'statusCode': 201,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'group': dict(new_group)}, default=str),
+                'body': dump_json(result),
                 'isBase64Encoded': False
             }
         
         else:
             cur.close()
-            conn.close()
+            release_connection(conn)
             return {
                 'statusCode': 405,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Method not allowed'}),
+                'body': dump_json({'error': 'Method not allowed'}),
                 'isBase64Encoded': False
             }
             
     except Exception as e:
+        current_timings().error = repr(e)
+        if conn is not None:
+            release_connection(conn, broken=isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)))
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'}),
+            'body': dump_json({'error': f'Ошибка сервера: {str(e)}'}),
             'isBase64Encoded': False
         }
+
+def handler(event: dict, context) -> dict:
+    timings = _request.timings = RequestTimings()
+    response = _handle(event, context)
+    return report_timings('groups', event, response, timings)
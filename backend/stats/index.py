@@ -0,0 +1,451 @@
+"""
+API статистики для дашборда администратора.
+Читает сводные таблицы group_daily_stats и student_monthly_stats,
+которые обновляются при отметке посещаемости и приёме оплат.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '1'))
+DB_PING_AFTER = float(os.environ.get('DB_PING_AFTER', '30'))
+
+_pool = None
+_conn = None
+_last_used = {}
+
+def _connection_alive(conn) -> bool:
+    """Дешёвая проверка соединения: статус транзакции, а после простоя — SELECT 1"""
+    if conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        last_used = _last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used > DB_PING_AFTER:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+def get_connection():
+    """
+    Возвращает соединение с БД, переживающее вызовы в прогретом контейнере.
+    При DB_POOL_SIZE > 1 соединения выдаются из ограниченного пула.
+    """
+    started = time.perf_counter()
+    try:
+        load_psycopg2()
+        return _acquire_connection()
+    finally:
+        current_timings().connect += time.perf_counter() - started
+
+def _acquire_connection():
+    global _pool, _conn
+    if DB_POOL_SIZE > 1:
+        if _pool is None:
+            _pool = psycopg2.pool.ThreadedConnectionPool(1, DB_POOL_SIZE, os.environ['DATABASE_URL'])
+        conn = _pool.getconn()
+        if not _connection_alive(conn):
+            _pool.putconn(conn, close=True)
+            conn = _pool.getconn()
+        return conn
+    if _conn is None or not _connection_alive(_conn):
+        if _conn is not None and not _conn.closed:
+            _conn.close()
+        _conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    return _conn
+
+def release_connection(conn, broken: bool = False):
+    """Возвращает соединение для повторного использования, незавершённая транзакция откатывается"""
+    global _conn
+    if not broken and not conn.closed:
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    _last_used[id(conn)] = time.monotonic()
+    if _pool is not None:
+        _pool.putconn(conn, close=broken or bool(conn.closed))
+    elif broken:
+        if not conn.closed:
+            conn.close()
+        _conn = None
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+
+_request = threading.local()
+
+class RequestTimings:
+    """Замеры одного вызова: подключение к БД, SQL-запросы и сериализация ответа"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connect = 0.0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.statements = 0
+        self.slow_queries = []
+        self.error = None
+
+def current_timings() -> RequestTimings:
+    timings = getattr(_request, 'timings', None)
+    if timings is None:
+        timings = _request.timings = RequestTimings()
+    return timings
+
+class TimedCursorMixin:
+    """Считает запросы курсора, их время и отмечает медленные"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            timings = current_timings()
+            timings.db += elapsed
+            timings.statements += 1
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                timings.slow_queries.append({'ms': round(elapsed * 1000, 1), 'query': ' '.join(query.split())[:300]})
+
+psycopg2 = None
+TimedCursor = None
+TimedTupleCursor = None
+
+def load_psycopg2():
+    """
+    Импортирует драйвер БД при первом подключении, а не при загрузке модуля:
+    preflight и отказы до обращения к БД обходятся без него на холодном старте.
+    """
+    global psycopg2, TimedCursor, TimedTupleCursor
+    if TimedCursor is None:
+        import psycopg2
+        import psycopg2.extensions
+        import psycopg2.extras
+        import psycopg2.pool
+
+        class TimedCursor(TimedCursorMixin, psycopg2.extras.RealDictCursor):
+            """Курсор со строками-словарями для логики обработчика"""
+
+        class TimedTupleCursor(TimedCursorMixin, psycopg2.extensions.cursor):
+            """Курсор с кортежами для выборок, которые целиком уходят в ответ через encode_rows"""
+    return psycopg2
+
+# date, time, timestamp, timestamptz, numeric — в ответе они передаются строками
+TEXT_COLUMN_TYPES = {1082, 1083, 1114, 1184, 1700}
+
+def encode_rows(description, rows) -> list:
+    """
+    Превращает строки кортежного курсора в словари для ответа.
+    Колонки, которые нужно привести к строке, находятся один раз по описанию курсора,
+    поэтому сериализатору не приходится вызывать default= для каждого значения.
+    """
+    columns = [column.name for column in description]
+    text_columns = [index for index, column in enumerate(description) if column.type_code in TEXT_COLUMN_TYPES]
+    if not text_columns:
+        return [dict(zip(columns, row)) for row in rows]
+    result = []
+    for row in rows:
+        row = list(row)
+        for index in text_columns:
+            if row[index] is not None:
+                row[index] = str(row[index])
+        result.append(dict(zip(columns, row)))
+    return result
+
+orjson = None
+_orjson_checked = False
+
+def load_orjson():
+    """
+    Импортирует orjson при первой сериализации, а не при загрузке модуля:
+    preflight обходится без него на холодном старте. Возвращает None, если он не установлен.
+    """
+    global orjson, _orjson_checked
+    if not _orjson_checked:
+        _orjson_checked = True
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+    return orjson
+
+def dump_json(data) -> str:
+    """
+    Сериализует тело ответа с замером времени: orjson, если он установлен, иначе компактный json.
+    default=str остаётся запасным путём для дат и Decimal.
+    """
+    started = time.perf_counter()
+    if load_orjson() is not None:
+        body = orjson.dumps(data, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+    else:
+        body = json.dumps(data, default=str, ensure_ascii=False, separators=(',', ':'))
+    current_timings().serialize += time.perf_counter() - started
+    return body
+
+def report_timings(function: str, event: dict, response: dict, timings: RequestTimings) -> dict:
+    """Добавляет в ответ заголовок Server-Timing и пишет в лог JSON-строку с замерами"""
+    total = time.perf_counter() - timings.started
+    response.setdefault('headers', {})
+    response['headers']['Server-Timing'] = (
+        f'connect;dur={timings.connect * 1000:.1f}, '
+        f'db;dur={timings.db * 1000:.1f};desc="{timings.statements} queries", '
+        f'serialize;dur={timings.serialize * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+    response['headers']['Timing-Allow-Origin'] = '*'
+    record = {
+        'level': 'warning' if timings.slow_queries or timings.error else 'info',
+        'function': function,
+        'method': event.get('httpMethod', 'GET'),
+        'status': response.get('statusCode'),
+        'total_ms': round(total * 1000, 1),
+        'connect_ms': round(timings.connect * 1000, 1),
+        'db_ms': round(timings.db * 1000, 1),
+        'statements': timings.statements,
+        'serialize_ms': round(timings.serialize * 1000, 1)
+    }
+    if timings.slow_queries:
+        record['slow_queries'] = timings.slow_queries
+    if timings.error:
+        record['error'] = timings.error
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+    return response
+
+SESSION_SECRET = os.environ.get('SESSION_SECRET', '')
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED') == '1'
+# Без секрета ни один токен не проверить: с AUTH_REQUIRED=1 функция отказала бы каждому
+# запросу, поэтому падает при загрузке, а не отвечает 401 на любой X-Authorization
+if AUTH_REQUIRED and not SESSION_SECRET:
+    raise RuntimeError('AUTH_REQUIRED=1 требует SESSION_SECRET')
+
+def verify_token(token: str):
+    """Проверяет access-токен функции auth по подписи и сроку, без обращения к БД"""
+    if not SESSION_SECRET:
+        return None
+    try:
+        body, signature = token.split('.')
+        expected = hmac.new(SESSION_SECRET.encode('utf-8'), body.encode('ascii'), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, base64.urlsafe_b64decode(signature + '=' * (-len(signature) % 4))):
+            return None
+        payload = json.loads(base64.urlsafe_b64decode(body + '=' * (-len(body) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('typ') != 'access' or payload.get('exp', 0) < time.time():
+        return None
+    return payload
+
+def authenticate(event: dict):
+    """
+    Возвращает (payload токена из X-Authorization или None, отказать ли в доступе).
+    Отказ — при недействительном токене или его отсутствии при AUTH_REQUIRED=1.
+    Без SESSION_SECRET auth не выдаёт токены, и заголовок не проверяется: запрос анонимный.
+    """
+    headers = event.get('headers') or {}
+    header = headers.get('X-Authorization') or headers.get('x-authorization') or ''
+    token = header[7:] if header.startswith('Bearer ') else header
+    if not token or not SESSION_SECRET:
+        return None, AUTH_REQUIRED
+    identity = verify_token(token)
+    return identity, identity is None
+
+DASHBOARD_QUERY = """
+    SELECT json_build_object(
+        'groups', (
+            SELECT COALESCE(json_agg(row_to_json(gs) ORDER BY gs.name), '[]'::json)
+            FROM (
+                SELECT g.id, g.name, g.cost_per_session,
+                       (SELECT COUNT(*) FROM students s WHERE s.group_id = g.id) AS student_count,
+                       COALESCE(SUM(d.present_count), 0) AS present_count,
+                       COALESCE(SUM(d.present_count + d.absent_count), 0) AS marked_count,
+                       COALESCE(ROUND(SUM(d.present_count) * 100.0 / NULLIF(SUM(d.present_count + d.absent_count), 0)), 0)
+                           AS attendance_rate,
+                       COALESCE(SUM(d.revenue_charged), 0) AS revenue_charged
+                FROM groups g
+                LEFT JOIN group_daily_stats d ON d.group_id = g.id AND d.session_date > CURRENT_DATE - %(days)s
+                WHERE g.is_archived = FALSE
+                GROUP BY g.id
+            ) gs
+        ),
+        'revenue', (
+            SELECT COALESCE(json_agg(row_to_json(r) ORDER BY r.month), '[]'::json)
+            FROM (
+                SELECT month, SUM(charged) AS charged, SUM(paid) AS paid, SUM(visits) AS visits
+                FROM student_monthly_stats
+                WHERE month >= date_trunc('month', CURRENT_DATE) - make_interval(months => %(months)s - 1)
+                GROUP BY month
+            ) r
+        ),
+        'debtors', (
+            SELECT COALESCE(json_agg(row_to_json(d) ORDER BY d.balance), '[]'::json)
+            FROM (
+                SELECT s.id, u.full_name, s.balance, s.group_id, g.name AS group_name
+                FROM students s
+                JOIN users u ON s.user_id = u.id
+                LEFT JOIN groups g ON s.group_id = g.id
+                WHERE s.balance < 0
+                ORDER BY s.balance
+                LIMIT %(debtors)s
+            ) d
+        ),
+        'totals', (
+            SELECT json_build_object(
+                'students', COUNT(*),
+                'debtors', COUNT(*) FILTER (WHERE balance < 0),
+                'debt', -COALESCE(SUM(balance) FILTER (WHERE balance < 0), 0)
+            )
+            FROM students
+        )
+    )::text AS dashboard
+"""
+
+STUDENT_QUERY = """
+    SELECT month, sessions, visits, charged, paid
+    FROM student_monthly_stats
+    WHERE student_id = %(student_id)s
+      AND month >= date_trunc('month', CURRENT_DATE) - make_interval(months => %(months)s - 1)
+    ORDER BY month
+"""
+
+# Ученики, чей баланс уйдёт в минус за ближайшие %(sessions)s занятий группы по расписанию.
+# Даты занятий считаются один раз на группу, ученики проецируются одним проходом:
+# runs_out_on — занятие, после списания за которое баланс станет отрицательным.
+AT_RISK_QUERY = """
+    WITH upcoming AS (
+        SELECT group_id, session_date, session_number
+        FROM (
+            SELECT g.id AS group_id, d::date AS session_date,
+                   ROW_NUMBER() OVER (PARTITION BY g.id ORDER BY d) AS session_number
+            FROM groups g
+            CROSS JOIN generate_series(CURRENT_DATE, CURRENT_DATE + %(sessions)s * 7 + 6, INTERVAL '1 day') d
+            WHERE g.is_archived = FALSE
+              AND EXTRACT(ISODOW FROM d)::smallint = ANY(g.schedule_days)
+              AND (d > CURRENT_DATE OR g.schedule_time IS NULL OR g.schedule_time > LOCALTIME)
+        ) sessions
+        WHERE session_number <= %(sessions)s
+    ),
+    planned AS (
+        SELECT group_id, COUNT(*) AS sessions FROM upcoming GROUP BY group_id
+    ),
+    projection AS (
+        SELECT s.id AS student_id, u.full_name, s.group_id, g.name AS group_name,
+               COALESCE(s.balance, 0) AS balance, g.cost_per_session, p.sessions AS planned_sessions,
+               COALESCE(s.balance, 0) - p.sessions * g.cost_per_session AS projected_balance,
+               GREATEST(FLOOR(COALESCE(s.balance, 0)::numeric / g.cost_per_session), 0)::int + 1 AS runs_out_after
+        FROM students s
+        JOIN planned p ON p.group_id = s.group_id
+        JOIN groups g ON g.id = s.group_id
+        JOIN users u ON u.id = s.user_id
+        WHERE g.cost_per_session > 0
+          AND (%(group_id)s::integer IS NULL OR s.group_id = %(group_id)s::integer)
+          AND COALESCE(s.balance, 0) - p.sessions * g.cost_per_session < 0
+    )
+    SELECT pr.student_id, pr.full_name, pr.group_id, pr.group_name, pr.balance, pr.cost_per_session,
+           pr.planned_sessions, pr.projected_balance, up.session_date AS runs_out_on
+    FROM projection pr
+    JOIN upcoming up ON up.group_id = pr.group_id AND up.session_number = pr.runs_out_after
+    ORDER BY up.session_date, pr.projected_balance
+"""
+
+MAX_AT_RISK_SESSIONS = 30
+
+def _handle(event: dict, context) -> dict:
+    method = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Authorization',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    identity, denied = authenticate(event)
+    if denied:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': 'Требуется авторизация'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = None
+    try:
+        params = event.get('queryStringParameters', {}) or {}
+        student_id = params.get('student_id')
+        
+        try:
+            months = max(1, min(int(params.get('months') or 12), 60))
+            days = max(1, min(int(params.get('days') or 30), 366))
+            at_risk = max(1, min(int(params['at_risk']), MAX_AT_RISK_SESSIONS)) if params.get('at_risk') else None
+            group_id = int(params['group_id']) if params.get('group_id') else None
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': dump_json({'error': 'Некорректный период'}),
+                'isBase64Encoded': False
+            }
+        
+        conn = get_connection()
+        cur = conn.cursor(cursor_factory=TimedCursor)
+        
+        if at_risk:
+            with conn.cursor(cursor_factory=TimedTupleCursor) as rows_cur:
+                rows_cur.execute(AT_RISK_QUERY, {'sessions': at_risk, 'group_id': group_id})
+                students = encode_rows(rows_cur.description, rows_cur.fetchall())
+            body = dump_json({'sessions': at_risk, 'students': students})
+        elif student_id:
+            cur.execute(STUDENT_QUERY, {'student_id': student_id, 'months': months})
+            body = dump_json({'months': [dict(row) for row in cur.fetchall()]})
+        else:
+            cur.execute(DASHBOARD_QUERY, {'months': months, 'days': days, 'debtors': 50})
+            # JSON собирается в Postgres и уходит в ответ текстом, без разбора и повторной сериализации
+            body = cur.fetchone()['dashboard']
+        
+        cur.close()
+        release_connection(conn)
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': body,
+            'isBase64Encoded': False
+        }
+        
+    except Exception as e:
+        current_timings().error = repr(e)
+        if conn is not None:
+            release_connection(conn, broken=isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)))
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': f'Ошибка сервера: {str(e)}'}),
+            'isBase64Encoded': False
+        }
+
+def handler(event: dict, context) -> dict:
+    timings = _request.timings = RequestTimings()
+    response = _handle(event, context)
+    return report_timings('stats', event, response, timings)
@@ -2,20 +2,560 @@
 API управления учениками.
 Создание, чтение, обновление учеников и управление балансом.
 """
+import base64
+import csv
+import hashlib
+import hmac
+import io
 import json
 import os
+import time
 import random
 import string
-import bcrypt
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import threading
+from datetime import date
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '1'))
+DB_PING_AFTER = float(os.environ.get('DB_PING_AFTER', '30'))
+
+_pool = None
+_conn = None
+_last_used = {}
+
+def _connection_alive(conn) -> bool:
+    """Дешёвая проверка соединения: статус транзакции, а после простоя — SELECT 1"""
+    if conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        last_used = _last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used > DB_PING_AFTER:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+def get_connection():
+    """
+    Возвращает соединение с БД, переживающее вызовы в прогретом контейнере.
+    При DB_POOL_SIZE > 1 соединения выдаются из ограниченного пула.
+    """
+    started = time.perf_counter()
+    try:
+        load_psycopg2()
+        return _acquire_connection()
+    finally:
+        current_timings().connect += time.perf_counter() - started
+
+def _acquire_connection():
+    global _pool, _conn
+    if DB_POOL_SIZE > 1:
+        if _pool is None:
+            _pool = psycopg2.pool.ThreadedConnectionPool(1, DB_POOL_SIZE, os.environ['DATABASE_URL'])
+        conn = _pool.getconn()
+        if not _connection_alive(conn):
+            _pool.putconn(conn, close=True)
+            conn = _pool.getconn()
+        return conn
+    if _conn is None or not _connection_alive(_conn):
+        if _conn is not None and not _conn.closed:
+            _conn.close()
+        _conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    return _conn
+
+def release_connection(conn, broken: bool = False):
+    """Возвращает соединение для повторного использования, незавершённая транзакция откатывается"""
+    global _conn
+    if not broken and not conn.closed:
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    _last_used[id(conn)] = time.monotonic()
+    if _pool is not None:
+        _pool.putconn(conn, close=broken or bool(conn.closed))
+    elif broken:
+        if not conn.closed:
+            conn.close()
+        _conn = None
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+
+_request = threading.local()
+
+class RequestTimings:
+    """Замеры одного вызова: подключение к БД, SQL-запросы и сериализация ответа"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connect = 0.0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.statements = 0
+        self.slow_queries = []
+        self.error = None
+
+def current_timings() -> RequestTimings:
+    timings = getattr(_request, 'timings', None)
+    if timings is None:
+        timings = _request.timings = RequestTimings()
+    return timings
+
+class TimedCursorMixin:
+    """Считает запросы курсора, их время и отмечает медленные"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            timings = current_timings()
+            timings.db += elapsed
+            timings.statements += 1
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                timings.slow_queries.append({'ms': round(elapsed * 1000, 1), 'query': ' '.join(query.split())[:300]})
+
+psycopg2 = None
+TimedCursor = None
+TimedTupleCursor = None
+
+def load_psycopg2():
+    """
+    Импортирует драйвер БД при первом подключении, а не при загрузке модуля:
+    preflight и отказы до обращения к БД обходятся без него на холодном старте.
+    """
+    global psycopg2, TimedCursor, TimedTupleCursor
+    if TimedCursor is None:
+        import psycopg2
+        import psycopg2.extensions
+        import psycopg2.extras
+        import psycopg2.pool
+
+        class TimedCursor(TimedCursorMixin, psycopg2.extras.RealDictCursor):
+            """Курсор со строками-словарями для логики обработчика"""
+
+        class TimedTupleCursor(TimedCursorMixin, psycopg2.extensions.cursor):
+            """Курсор с кортежами для выборок, которые целиком уходят в ответ через encode_rows"""
+    return psycopg2
+
+# date, time, timestamp, timestamptz, numeric — в ответе они передаются строками
+TEXT_COLUMN_TYPES = {1082, 1083, 1114, 1184, 1700}
+
+def encode_rows(description, rows) -> list:
+    """
+    Превращает строки кортежного курсора в словари для ответа.
+    Колонки, которые нужно привести к строке, находятся один раз по описанию курсора,
+    поэтому сериализатору не приходится вызывать default= для каждого значения.
+    """
+    columns = [column.name for column in description]
+    text_columns = [index for index, column in enumerate(description) if column.type_code in TEXT_COLUMN_TYPES]
+    if not text_columns:
+        return [dict(zip(columns, row)) for row in rows]
+    result = []
+    for row in rows:
+        row = list(row)
+        for index in text_columns:
+            if row[index] is not None:
+                row[index] = str(row[index])
+        result.append(dict(zip(columns, row)))
+    return result
+
+orjson = None
+_orjson_checked = False
+
+def load_orjson():
+    """
+    Импортирует orjson при первой сериализации, а не при загрузке модуля:
+    preflight обходится без него на холодном старте. Возвращает None, если он не установлен.
+    """
+    global orjson, _orjson_checked
+    if not _orjson_checked:
+        _orjson_checked = True
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+    return orjson
+
+def dump_json(data) -> str:
+    """
+    Сериализует тело ответа с замером времени: orjson, если он установлен, иначе компактный json.
+    default=str остаётся запасным путём для одиночных дат и Decimal вне encode_rows.
+    """
+    started = time.perf_counter()
+    if load_orjson() is not None:
+        body = orjson.dumps(data, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+    else:
+        body = json.dumps(data, default=str, ensure_ascii=False, separators=(',', ':'))
+    current_timings().serialize += time.perf_counter() - started
+    return body
+
+def report_timings(function: str, event: dict, response: dict, timings: RequestTimings) -> dict:
+    """Добавляет в ответ заголовок Server-Timing и пишет в лог JSON-строку с замерами"""
+    total = time.perf_counter() - timings.started
+    response.setdefault('headers', {})
+    response['headers']['Server-Timing'] = (
+        f'connect;dur={timings.connect * 1000:.1f}, '
+        f'db;dur={timings.db * 1000:.1f};desc="{timings.statements} queries", '
+        f'serialize;dur={timings.serialize * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+    response['headers']['Timing-Allow-Origin'] = '*'
+    record = {
+        'level': 'warning' if timings.slow_queries or timings.error else 'info',
+        'function': function,
+        'method': event.get('httpMethod', 'GET'),
+        'status': response.get('statusCode'),
+        'total_ms': round(total * 1000, 1),
+        'connect_ms': round(timings.connect * 1000, 1),
+        'db_ms': round(timings.db * 1000, 1),
+        'statements': timings.statements,
+        'serialize_ms': round(timings.serialize * 1000, 1)
+    }
+    if timings.slow_queries:
+        record['slow_queries'] = timings.slow_queries
+    if timings.error:
+        record['error'] = timings.error
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+    return response
+
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(*key) -> str:
+    """Непрозрачный курсор страницы: ключ сортировки последней отданной строки"""
+    raw = json.dumps(key, default=str, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str, parse_key) -> list:
+    """
+    Разбирает курсор, выданный encode_cursor: parse_key проверяет ключ сортировки, второй
+    элемент — целый id строки. Подделанный курсор даёт ValueError, а не ошибку в запросе.
+    """
+    key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    if not isinstance(key, list) or len(key) != 2 or not isinstance(key[0], str) or type(key[1]) is not int:
+        raise ValueError('cursor')
+    return [parse_key(key[0]), key[1]]
+
+def parse_page_size(value, default: int) -> int:
+    """Размер страницы из параметра limit, ограниченный MAX_PAGE_SIZE"""
+    if not value:
+        return default
+    return max(1, min(int(value), MAX_PAGE_SIZE))
+
+SESSION_SECRET = os.environ.get('SESSION_SECRET', '')
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED') == '1'
+# Без секрета ни один токен не проверить: с AUTH_REQUIRED=1 функция отказала бы каждому
+# запросу, поэтому падает при загрузке, а не отвечает 401 на любой X-Authorization
+if AUTH_REQUIRED and not SESSION_SECRET:
+    raise RuntimeError('AUTH_REQUIRED=1 требует SESSION_SECRET')
+
+def verify_token(token: str):
+    """Проверяет access-токен функции auth по подписи и сроку, без обращения к БД"""
+    if not SESSION_SECRET:
+        return None
+    try:
+        body, signature = token.split('.')
+        expected = hmac.new(SESSION_SECRET.encode('utf-8'), body.encode('ascii'), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, base64.urlsafe_b64decode(signature + '=' * (-len(signature) % 4))):
+            return None
+        payload = json.loads(base64.urlsafe_b64decode(body + '=' * (-len(body) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('typ') != 'access' or payload.get('exp', 0) < time.time():
+        return None
+    return payload
+
+def authenticate(event: dict):
+    """
+    Возвращает (payload токена из X-Authorization или None, отказать ли в доступе).
+    Отказ — при недействительном токене или его отсутствии при AUTH_REQUIRED=1.
+    Без SESSION_SECRET auth не выдаёт токены, и заголовок не проверяется: запрос анонимный.
+    """
+    headers = event.get('headers') or {}
+    header = headers.get('X-Authorization') or headers.get('x-authorization') or ''
+    token = header[7:] if header.startswith('Bearer ') else header
+    if not token or not SESSION_SECRET:
+        return None, AUTH_REQUIRED
+    identity = verify_token(token)
+    return identity, identity is None
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Кандидаты берутся из триграммных индексов отдельно по users и students (OR между таблицами
+# индекс не использует), затем ранжируются: совпадение с начала ФИО или логина выше,
+# дальше по сходству слова в ФИО, логина и контакта родителя.
+SEARCH_QUERY = """
+    WITH matches AS (
+        SELECT s.id
+        FROM users u
+        JOIN students s ON s.user_id = u.id
+        WHERE u.full_name ILIKE %(pattern)s OR u.login ILIKE %(pattern)s OR u.full_name %% %(q)s
+        UNION
+        SELECT s.id
+        FROM students s
+        WHERE s.parent_contact ILIKE %(pattern)s
+    )
+    SELECT s.id, s.group_id, g.name AS group_name, u.full_name, u.login, s.parent_contact, s.balance,
+           (u.full_name ILIKE %(prefix)s OR u.login ILIKE %(prefix)s)::int
+               + GREATEST(word_similarity(%(q)s, u.full_name), similarity(u.login, %(q)s),
+                          similarity(COALESCE(s.parent_contact, ''), %(q)s)) AS score
+    FROM matches m
+    JOIN students s ON s.id = m.id
+    JOIN users u ON s.user_id = u.id
+    LEFT JOIN groups g ON s.group_id = g.id
+    WHERE %(group_id)s::integer IS NULL OR s.group_id = %(group_id)s::integer
+    ORDER BY score DESC, u.full_name, s.id
+    LIMIT %(limit)s
+"""
+
+def search_students(conn, search: str, group_id, limit: int) -> list:
+    """Поиск учеников по ФИО, логину и контакту родителя, лучшие совпадения первыми"""
+    escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    with conn.cursor(cursor_factory=TimedTupleCursor) as rows_cur:
+        rows_cur.execute(SEARCH_QUERY, {
+            'q': search,
+            'pattern': f'%{escaped}%',
+            'prefix': f'{escaped}%',
+            'group_id': group_id,
+            'limit': limit
+        })
+        return encode_rows(rows_cur.description, rows_cur.fetchall())
+
+# Каждому ученику нужен bcrypt-хеш временного пароля (~0,25 с): пачка больше не уложится
+# в таймаут функции даже на HASH_WORKERS потоках, и импорт откатится целиком.
+# Большие списки клиент отправляет частями (api.students.importMany)
+BULK_IMPORT_LIMIT = 100
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', str(os.cpu_count() or 2)))
+
+LOGIN_DIGITS = 8
+LOGIN_ATTEMPTS = 5
 
 def generate_login():
-    """Генерирует уникальный логин для ученика"""
-    random_num = ''.join(random.choices(string.digits, k=5))
+    """Генерирует случайный логин ученика; занятость проверяет allocate_logins"""
+    random_num = ''.join(random.choices(string.digits, k=LOGIN_DIGITS))
     return f'sambokid_{random_num}'
 
-def handler(event: dict, context) -> dict:
+def generate_password() -> str:
+    """Временный пароль ученика"""
+    return ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+
+def allocate_logins(cur, count: int) -> list:
+    """Генерирует count логинов, которых нет ни в базе, ни в самой пачке; не больше LOGIN_ATTEMPTS запросов"""
+    logins = []
+    for _ in range(LOGIN_ATTEMPTS):
+        candidates = {generate_login() for _ in range((count - len(logins)) * 2)} - set(logins)
+        cur.execute("SELECT login FROM users WHERE login = ANY(%s)", (list(candidates),))
+        taken = {row['login'] for row in cur.fetchall()}
+        logins.extend(sorted(candidates - taken)[:count - len(logins)])
+        if len(logins) == count:
+            return logins
+    raise RuntimeError('Не удалось подобрать свободные логины')
+
+def insert_users(cur, users: list) -> list:
+    """
+    Создаёт пользователей-учеников (password_hash, full_name, phone) с новыми логинами.
+    Логин, занятый параллельным импортом между проверкой и вставкой, пропускается
+    через ON CONFLICT без ошибки транзакции, и такие строки получают новые логины.
+    Возвращает пары (user_id, login) в порядке users.
+    """
+    created = [None] * len(users)
+    pending = list(range(len(users)))
+    for _ in range(LOGIN_ATTEMPTS):
+        logins = allocate_logins(cur, len(pending))
+        cur.execute("""
+            INSERT INTO users (login, password_hash, role, full_name, phone)
+            SELECT login, password_hash, 'student', full_name, phone
+            FROM unnest(%(logins)s::text[], %(hashes)s::text[], %(names)s::text[], %(phones)s::text[])
+                AS r(login, password_hash, full_name, phone)
+            ON CONFLICT (login) DO NOTHING
+            RETURNING id, login
+        """, {
+            'logins': logins,
+            'hashes': [users[index]['password_hash'] for index in pending],
+            'names': [users[index]['full_name'] for index in pending],
+            'phones': [users[index]['phone'] for index in pending]
+        })
+        inserted = {row['login']: row['id'] for row in cur.fetchall()}
+        for index, login in zip(pending, logins):
+            if login in inserted:
+                created[index] = (inserted[login], login)
+        pending = [index for index in pending if created[index] is None]
+        if not pending:
+            return created
+    raise RuntimeError('Не удалось подобрать свободные логины')
+
+def hash_password(password: str) -> str:
+    import bcrypt
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def hash_passwords(passwords: list) -> list:
+    """
+    Хеширует пароли параллельно: bcrypt отпускает GIL на время вычисления.
+    bcrypt и пул потоков загружаются только здесь, чтобы GET не платил за них на холодном старте.
+    """
+    if len(passwords) < 2:
+        return [hash_password(password) for password in passwords]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+        return list(executor.map(hash_password, passwords))
+
+def parse_import_rows(body: dict) -> list:
+    """Строки импорта из JSON-массива students или из CSV-текста в поле csv"""
+    if 'csv' in body:
+        text = str(body['csv']).lstrip('\ufeff')
+        try:
+            dialect = csv.Sniffer().sniff(text.split('\n', 1)[0], delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        return list(csv.DictReader(io.StringIO(text), dialect=dialect))
+    return body['students']
+
+def validate_import_row(row, group_ids: set):
+    """Приводит строку импорта к полям ученика; возвращает (поля, ошибка)"""
+    if not isinstance(row, dict):
+        return None, 'Строка должна быть объектом'
+    full_name = str(row.get('full_name') or '').strip()
+    if not full_name:
+        return None, 'ФИО ученика обязательно'
+    birth_date = str(row.get('birth_date') or '').strip() or None
+    if birth_date:
+        try:
+            date.fromisoformat(birth_date)
+        except ValueError:
+            return None, 'Дата рождения должна быть в формате ГГГГ-ММ-ДД'
+    group_id = str(row.get('group_id') or '').strip() or None
+    if group_id:
+        if not group_id.isdigit() or int(group_id) not in group_ids:
+            return None, 'Группа не найдена'
+        group_id = int(group_id)
+    return {
+        'full_name': full_name,
+        'birth_date': birth_date,
+        'parent_contact': str(row.get('parent_contact') or '').strip(),
+        'group_id': group_id
+    }, None
+
+CACHE_VERSION_TTL = float(os.environ.get('CACHE_VERSION_TTL', '5'))
+
+_versions = {}
+_versions_checked_at = 0.0
+
+def cache_versions(cur, max_age: float = CACHE_VERSION_TTL) -> dict:
+    """Штампы версий из cache_versions; перечитываются, если прочитаны больше max_age секунд назад"""
+    global _versions, _versions_checked_at
+    if time.monotonic() - _versions_checked_at >= max_age:
+        cur.execute("SELECT scope, version FROM cache_versions")
+        _versions = {row['scope']: row['version'] for row in cur.fetchall()}
+        _versions_checked_at = time.monotonic()
+    return _versions
+
+def make_etag(versions: dict, scopes: list, params: dict) -> str:
+    """Слабый ETag из версий данных scopes и параметров запроса"""
+    raw = json.dumps([[versions.get(scope, 0) for scope in scopes], params], sort_keys=True, default=str)
+    return 'W/"' + hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20] + '"'
+
+def not_modified(event: dict, etag: str):
+    """Ответ 304, если клиент прислал тот же ETag (или *) в If-None-Match, иначе None"""
+    headers = event.get('headers') or {}
+    header = headers.get('If-None-Match') or headers.get('if-none-match') or ''
+    tags = [tag.strip() for tag in header.split(',')]
+    if etag not in tags and '*' not in tags:
+        return None
+    return {
+        'statusCode': 304,
+        'headers': {'ETag': etag, 'Cache-Control': 'no-cache', 'Access-Control-Allow-Origin': '*'},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def bump_cache_versions(cur, *scopes) -> dict:
+    """
+    Инвалидирует кэши функций во всех контейнерах, увеличивая версии scopes, в транзакции записи:
+    версия и данные фиксируются вместе, и сбой после COMMIT не оставит устаревший ETag.
+    Строки блокируются в порядке имён. Возвращает новые версии: вызывающий код переносит их
+    в _versions своего контейнера только после COMMIT, чтобы откат не оставил версию, которой нет в БД.
+    """
+    cur.execute("""
+        INSERT INTO cache_versions (scope, version)
+        SELECT unnest(%s::text[]), 1
+        ON CONFLICT (scope) DO UPDATE SET version = cache_versions.version + 1
+        RETURNING scope, version
+    """, (sorted(set(scopes)),))
+    return {row['scope']: row['version'] for row in cur.fetchall()}
+
+def record_changes(cur, events: list):
+    """
+    Добавляет события в ленту изменений. Вызывается последним шагом перед COMMIT:
+    вставка берёт блокировку ленты, которая держится до конца транзакции.
+    """
+    if not events:
+        return
+    cur.execute("""
+        INSERT INTO change_events (entity, entity_id, data)
+        SELECT entity, entity_id, data
+        FROM jsonb_to_recordset(%s::jsonb) AS e(entity text, entity_id integer, data jsonb)
+    """, (json.dumps(events, default=str, ensure_ascii=False),))
+
+def import_students(cur, rows: list) -> list:
+    """
+    Создаёт учеников пачкой: хеши готовятся заранее, пользователи вставляются
+    insert_users, ученики — одним INSERT. Возвращает отчёт по строкам.
+    """
+    cur.execute("SELECT id FROM groups")
+    group_ids = {row['id'] for row in cur.fetchall()}
+    
+    report = []
+    valid = []
+    for number, row in enumerate(rows, start=1):
+        fields, error = validate_import_row(row, group_ids)
+        if error:
+            report.append({'row': number, 'status': 'error', 'error': error})
+        else:
+            valid.append((number, fields))
+    if not valid:
+        return report
+    
+    passwords = [generate_password() for _ in valid]
+    hashes = hash_passwords(passwords)
+    users = insert_users(cur, [
+        {'password_hash': password_hash, 'full_name': fields['full_name'], 'phone': fields['parent_contact']}
+        for (_, fields), password_hash in zip(valid, hashes)
+    ])
+    
+    cur.execute("""
+        INSERT INTO students (user_id, group_id, birth_date, parent_contact, balance)
+        SELECT user_id, group_id, birth_date, parent_contact, 0
+        FROM unnest(%(users)s::integer[], %(groups)s::integer[], %(birth_dates)s::date[], %(contacts)s::text[])
+            AS r(user_id, group_id, birth_date, parent_contact)
+        RETURNING id, user_id
+    """, {
+        'users': [user_id for user_id, _ in users],
+        'groups': [fields['group_id'] for _, fields in valid],
+        'birth_dates': [fields['birth_date'] for _, fields in valid],
+        'contacts': [fields['parent_contact'] for _, fields in valid]
+    })
+    student_ids = {row['user_id']: row['id'] for row in cur.fetchall()}
+    
+    for (number, fields), (user_id, login), password in zip(valid, users, passwords):
+        report.append({
+            'row': number,
+            'status': 'created',
+            'student_id': student_ids[user_id],
+            'full_name': fields['full_name'],
+            'group_id': fields['group_id'],
+            'login': login,
+            'temp_password': password
+        })
+    report.sort(key=lambda item: item['row'])
+    return report
+
+def _handle(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -31,46 +571,168 @@ def handler(event: dict, context) -> dict:
             'isBase64Encoded': False
         }
     
+    identity, denied = authenticate(event)
+    if denied:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dump_json({'error': 'Требуется авторизация'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = None
     try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        conn = get_connection()
+        cur = conn.cursor(cursor_factory=TimedCursor)
         
         if method == 'GET':
-            cur.execute("""
+            params = event.get('queryStringParameters', {}) or {}
+            group_id = params.get('group_id')
+            if group_id:
+                try:
+                    group_id = int(group_id)
+                except ValueError:
+                    cur.close()
+                    release_connection(conn)
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': dump_json({'error': 'Некорректный group_id'}),
+                        'isBase64Encoded': False
+                    }
+            
+            if 'q' in params:
+                search = (params.get('q') or '').strip()
+                try:
+                    limit = min(parse_page_size(params.get('limit'), SEARCH_LIMIT), MAX_SEARCH_LIMIT)
+                except ValueError:
+                    limit = 0
+                if len(search) < 2 or not limit:
+                    cur.close()
+                    release_connection(conn)
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': dump_json({'error': 'Запрос поиска — от 2 символов'}),
+                        'isBase64Encoded': False
+                    }
+                
+                found = search_students(conn, search, group_id, limit)
+                cur.close()
+                release_connection(conn)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dump_json({'students': found}),
+                    'isBase64Encoded': False
+                }
+            
+            try:
+                limit = parse_page_size(params.get('limit'), MAX_PAGE_SIZE)
+                after = decode_cursor(params['cursor'], str) if params.get('cursor') else None
+            except ValueError:
+                cur.close()
+                release_connection(conn)
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dump_json({'error': 'Некорректные параметры страницы'}),
+                    'isBase64Encoded': False
+                }
+            
+            etag = make_etag(cache_versions(cur, max_age=0), ['groups', 'students', 'balances'], params)
+            unchanged = not_modified(event, etag)
+            if unchanged:
+                cur.close()
+                release_connection(conn)
+                return unchanged
+            
+            conditions = []
+            if group_id:
+                conditions.append('s.group_id = %(group_id)s')
+            if after:
+                conditions.append('(u.full_name, s.id) > (%(after_name)s, %(after_id)s)')
+            
+            rows_cur = conn.cursor(cursor_factory=TimedTupleCursor)
+            rows_cur.execute(f"""
                 SELECT s.*, u.full_name, u.login, u.email, u.phone, g.name as group_name,
-                       (SELECT COUNT(*) FROM attendance WHERE student_id = s.id AND is_present = TRUE) as total_visits,
-                       (SELECT COUNT(*) FROM attendance WHERE student_id = s.id) as total_sessions
+                       CASE WHEN s.total_sessions > 0
+                            THEN ROUND(s.total_visits * 100.0 / s.total_sessions)::int
+                            ELSE 0
+                       END as attendance_percentage
                 FROM students s
                 JOIN users u ON s.user_id = u.id
                 LEFT JOIN groups g ON s.group_id = g.id
-                ORDER BY u.full_name
-            """)
-            students = cur.fetchall()
-            
-            result = []
-            for student in students:
-                student_dict = dict(student)
-                if student_dict['total_sessions'] > 0:
-                    student_dict['attendance_percentage'] = round(
-                        (student_dict['total_visits'] / student_dict['total_sessions']) * 100
-                    )
-                else:
-                    student_dict['attendance_percentage'] = 0
-                result.append(student_dict)
+                {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+                ORDER BY u.full_name, s.id
+                LIMIT %(limit)s
+            """, {
+                'group_id': group_id,
+                'after_name': after[0] if after else None,
+                'after_id': after[1] if after else None,
+                'limit': limit + 1
+            })
+            result = encode_rows(rows_cur.description, rows_cur.fetchall())
+            rows_cur.close()
+            next_cursor = None
+            if len(result) > limit:
+                result = result[:limit]
+                next_cursor = encode_cursor(result[-1]['full_name'], result[-1]['id'])
             
             cur.close()
-            conn.close()
+            release_connection(conn)
             
             return {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'students': result}, default=str),
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'ETag': etag, 'Cache-Control': 'no-cache'},
+                'body': dump_json({'students': result, 'next_cursor': next_cursor}),
                 'isBase64Encoded': False
             }
         
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
+            
+            if 'students' in body or 'csv' in body:
+                rows = parse_import_rows(body)
+                if not isinstance(rows, list) or not rows or len(rows) > BULK_IMPORT_LIMIT:
+                    cur.close()
+                    release_connection(conn)
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': dump_json({'error': f'Передайте от 1 до {BULK_IMPORT_LIMIT} учеников за запрос, больший список — частями'}),
+                        'isBase64Encoded': False
+                    }
+                
+                report = import_students(cur, rows)
+                bumped = bump_cache_versions(cur, 'students')
+                record_changes(cur, [
+                    {
+                        'entity': 'student',
+                        'entity_id': item['student_id'],
+                        'data': {'full_name': item['full_name'], 'group_id': item['group_id'], 'login': item['login']}
+                    }
+                    for item in report if item['status'] == 'created'
+                ])
+                conn.commit()
+                _versions.update(bumped)
+                cur.close()
+                release_connection(conn)
+                
+                created = sum(1 for item in report if item['status'] == 'created')
+                return {
+                    'statusCode': 201 if created else 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dump_json({
+                        'success': created > 0,
+                        'created': created,
+                        'failed': len(report) - created,
+                        'results': report
+                    }),
+                    'isBase64Encoded': False
+                }
+            
             full_name = body.get('full_name', '').strip()
             birth_date = body.get('birth_date')
             parent_contact = body.get('parent_contact', '').strip()
@@ -78,40 +740,43 @@ def handler(event: dict, context) -> dict:
             
             if not full_name:
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'ФИО ученика обязательно'}),
+                    'body': dump_json({'error': 'ФИО ученика обязательно'}),
                     'isBase64Encoded': False
                 }
             
-            login = generate_login()
-            temp_password = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-            password_hash = bcrypt.hashpw(temp_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            
-            cur.execute("""
-                INSERT INTO users (login, password_hash, role, full_name, phone)
-                VALUES (%s, %s, 'student', %s, %s)
-                RETURNING id
-            """, (login, password_hash, full_name, parent_contact))
-            user_id = cur.fetchone()['id']
+            temp_password = generate_password()
+            password_hash = hash_password(temp_password)
+            user_id, login = insert_users(cur, [
+                {'password_hash': password_hash, 'full_name': full_name, 'phone': parent_contact}
+            ])[0]
             
             cur.execute("""
                 INSERT INTO students (user_id, group_id, birth_date, parent_contact, balance)
                 VALUES (%s, %s, %s, %s, 0)
-                RETURNING id
+                RETURNING id, group_id
             """, (user_id, group_id, birth_date, parent_contact))
-            student_id = cur.fetchone()['id']
+            student = cur.fetchone()
+            student_id = student['id']
             
+            bumped = bump_cache_versions(cur, 'students')
+            record_changes(cur, [{
+                'entity': 'student',
+                'entity_id': student_id,
+                'data': {'full_name': full_name, 'group_id': student['group_id'], 'login': login}
+            }])
             conn.commit()
+            _versions.update(bumped)
             cur.close()
-            conn.close()
+            release_connection(conn)
             
             return {
                 'statusCode': 201,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
+                'body': dump_json({
                     'success': True,
                     'student_id': student_id,
                     'login': login,
@@ -123,18 +788,26 @@ def handler(event: dict, context) -> dict:
         
         else:
             cur.close()
-            conn.close()
+            release_connection(conn)
             return {
                 'statusCode': 405,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Method not allowed'}),
+                'body': dump_json({'error': 'Method not allowed'}),
                 'isBase64Encoded': False
             }
             
     except Exception as e:
+        current_timings().error = repr(e)
+        if conn is not None:
+            release_connection(conn, broken=isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)))
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'}),
+            'body': dump_json({'error': f'Ошибка сервера: {str(e)}'}),
             'isBase64Encoded': False
         }
+
+def handler(event: dict, context) -> dict:
+    timings = _request.timings = RequestTimings()
+    response = _handle(event, context)
+    return report_timings('students', event, response, timings)
@@ -0,0 +1,34 @@
+-- Агрегаты посещаемости ученика, которые обновляет отметка посещаемости
+ALTER TABLE students ADD COLUMN IF NOT EXISTS total_sessions INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE students ADD COLUMN IF NOT EXISTS total_visits INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE students ADD COLUMN IF NOT EXISTS last_visit DATE;
+
+-- Полный пересчёт агрегатов по таблице attendance (первичное заполнение и восстановление).
+-- Возвращает количество учеников, у которых значения были исправлены.
+CREATE OR REPLACE FUNCTION rebuild_student_attendance_stats() RETURNS INTEGER AS $$
+DECLARE
+    fixed INTEGER;
+BEGIN
+    UPDATE students s
+    SET total_sessions = agg.total_sessions,
+        total_visits = agg.total_visits,
+        last_visit = agg.last_visit
+    FROM (
+        SELECT st.id,
+               COUNT(a.id) AS total_sessions,
+               COUNT(a.id) FILTER (WHERE a.is_present) AS total_visits,
+               MAX(a.session_date) FILTER (WHERE a.is_present) AS last_visit
+        FROM students st
+        LEFT JOIN attendance a ON a.student_id = st.id
+        GROUP BY st.id
+    ) agg
+    WHERE s.id = agg.id
+      AND (s.total_sessions, s.total_visits, s.last_visit)
+          IS DISTINCT FROM (agg.total_sessions::int, agg.total_visits::int, agg.last_visit);
+    GET DIAGNOSTICS fixed = ROW_COUNT;
+    RETURN fixed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Первичное заполнение агрегатов
+SELECT rebuild_student_attendance_stats();
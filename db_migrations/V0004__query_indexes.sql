@@ -0,0 +1,22 @@
+-- Индексы под фактические запросы обработчиков
+
+-- Посещаемость группы и ученика: фильтр + ORDER BY session_date DESC, id DESC (keyset-пагинация)
+CREATE INDEX IF NOT EXISTS idx_attendance_group_date ON attendance(group_id, session_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_attendance_student_date_desc ON attendance(student_id, session_date DESC, id DESC);
+-- Общая лента посещаемости
+CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(session_date DESC, id DESC);
+-- Только присутствия: последний визит ученика и пересчёт агрегатов
+CREATE INDEX IF NOT EXISTS idx_attendance_present ON attendance(student_id, session_date DESC) WHERE is_present;
+-- Старый индекс покрывается idx_attendance_student_date_desc
+DROP INDEX IF EXISTS idx_attendance_student_date;
+
+-- Общая лента транзакций и история ученика
+CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_student_created ON transactions(student_id, created_at DESC, id DESC);
+DROP INDEX IF EXISTS idx_transactions_student;
+
+-- Список активных групп
+CREATE INDEX IF NOT EXISTS idx_groups_active ON groups(created_at DESC) WHERE is_archived = FALSE;
+-- Подсчёт учеников группы только по индексу
+CREATE INDEX IF NOT EXISTS idx_students_group_covering ON students(group_id) INCLUDE (id);
+DROP INDEX IF EXISTS idx_students_group_id;
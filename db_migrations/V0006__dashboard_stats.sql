@@ -0,0 +1,62 @@
+-- Сводка по группе за день: обновляется при отметке посещаемости
+CREATE TABLE IF NOT EXISTS group_daily_stats (
+    group_id INTEGER NOT NULL REFERENCES groups(id),
+    session_date DATE NOT NULL,
+    present_count INTEGER NOT NULL DEFAULT 0,
+    absent_count INTEGER NOT NULL DEFAULT 0,
+    revenue_charged INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (group_id, session_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_group_daily_stats_date ON group_daily_stats(session_date DESC);
+
+-- Сводка по ученику за месяц: посещения и списания из отметки посещаемости, оплаты из транзакций
+CREATE TABLE IF NOT EXISTS student_monthly_stats (
+    student_id INTEGER NOT NULL REFERENCES students(id),
+    month DATE NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    visits INTEGER NOT NULL DEFAULT 0,
+    charged INTEGER NOT NULL DEFAULT 0,
+    paid INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, month)
+);
+
+CREATE INDEX IF NOT EXISTS idx_student_monthly_stats_month ON student_monthly_stats(month DESC);
+
+-- Должники для дашборда
+CREATE INDEX IF NOT EXISTS idx_students_debtors ON students(balance) WHERE balance < 0;
+
+-- Полный пересчёт сводок (первичное заполнение и восстановление)
+CREATE OR REPLACE FUNCTION rebuild_dashboard_stats() RETURNS VOID AS $$
+BEGIN
+    DELETE FROM group_daily_stats;
+    INSERT INTO group_daily_stats (group_id, session_date, present_count, absent_count, revenue_charged)
+    SELECT group_id, session_date,
+           COUNT(*) FILTER (WHERE is_present),
+           COUNT(*) FILTER (WHERE NOT is_present),
+           COALESCE(SUM(cost_charged) FILTER (WHERE is_present), 0)
+    FROM attendance
+    GROUP BY group_id, session_date;
+
+    DELETE FROM student_monthly_stats;
+    INSERT INTO student_monthly_stats (student_id, month, sessions, visits, charged, paid)
+    SELECT student_id, month, SUM(sessions), SUM(visits), SUM(charged), SUM(paid)
+    FROM (
+        SELECT student_id, date_trunc('month', session_date)::date AS month,
+               COUNT(*) AS sessions,
+               COUNT(*) FILTER (WHERE is_present) AS visits,
+               COALESCE(SUM(cost_charged) FILTER (WHERE is_present), 0) AS charged,
+               0 AS paid
+        FROM attendance
+        GROUP BY 1, 2
+        UNION ALL
+        SELECT student_id, date_trunc('month', created_at)::date, 0, 0, 0, SUM(amount)
+        FROM transactions
+        WHERE transaction_type = 'payment'
+        GROUP BY 1, 2
+    ) parts
+    GROUP BY student_id, month;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_dashboard_stats();
@@ -0,0 +1,12 @@
+-- Ключи идемпотентности для операций с балансом: повтор запроса с тем же ключом
+-- возвращает сохранённый ответ без повторных списаний
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope VARCHAR(50) NOT NULL,
+    key VARCHAR(100) NOT NULL,
+    status_code INTEGER,
+    response TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (scope, key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys(created_at);
@@ -0,0 +1,8 @@
+-- Штампы версий для инвалидации кэшей функций: запись в группы/учеников увеличивает версию
+CREATE TABLE IF NOT EXISTS cache_versions (
+    scope VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1
+);
+
+INSERT INTO cache_versions (scope, version) VALUES ('groups', 1), ('students', 1)
+ON CONFLICT (scope) DO NOTHING;
@@ -0,0 +1,114 @@
+-- Снимки балансов: balance_snapshots хранит баланс каждого ученика по всем транзакциям
+-- с id <= transaction_id. Ученик без строки в снимке к этому моменту транзакций не имел.
+CREATE TABLE IF NOT EXISTS balance_snapshot_runs (
+    transaction_id INTEGER PRIMARY KEY,
+    as_of TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_balance_snapshot_runs_as_of ON balance_snapshot_runs(as_of);
+
+CREATE TABLE IF NOT EXISTS balance_snapshots (
+    transaction_id INTEGER NOT NULL REFERENCES balance_snapshot_runs(transaction_id),
+    student_id INTEGER NOT NULL REFERENCES students(id),
+    balance BIGINT NOT NULL,
+    PRIMARY KEY (transaction_id, student_id)
+);
+
+-- Новый снимок из предыдущего и транзакций после него. Границей берётся последняя транзакция
+-- старше p_settle, чтобы в снимок не попали номера ещё не зафиксированных транзакций.
+-- as_of — самое позднее время среди вошедших в снимок транзакций.
+CREATE OR REPLACE FUNCTION take_balance_snapshot(p_settle INTERVAL DEFAULT INTERVAL '10 minutes') RETURNS INTEGER AS $$
+DECLARE
+    v_previous_id INTEGER;
+    v_previous_as_of TIMESTAMP;
+    v_cutoff INTEGER;
+    v_as_of TIMESTAMP;
+BEGIN
+    LOCK TABLE balance_snapshot_runs IN EXCLUSIVE MODE;
+
+    SELECT transaction_id, as_of INTO v_previous_id, v_previous_as_of
+    FROM balance_snapshot_runs
+    ORDER BY transaction_id DESC
+    LIMIT 1;
+
+    SELECT MAX(id) INTO v_cutoff
+    FROM transactions
+    WHERE id > COALESCE(v_previous_id, 0) AND created_at < CURRENT_TIMESTAMP - p_settle;
+
+    IF v_cutoff IS NULL THEN
+        RETURN v_previous_id;
+    END IF;
+
+    SELECT GREATEST(v_previous_as_of, MAX(created_at)) INTO v_as_of
+    FROM transactions
+    WHERE id > COALESCE(v_previous_id, 0) AND id <= v_cutoff;
+
+    INSERT INTO balance_snapshot_runs (transaction_id, as_of) VALUES (v_cutoff, v_as_of);
+
+    INSERT INTO balance_snapshots (transaction_id, student_id, balance)
+    SELECT v_cutoff, COALESCE(b.student_id, t.student_id), COALESCE(b.balance, 0) + COALESCE(t.amount, 0)
+    FROM (
+        SELECT student_id, balance FROM balance_snapshots WHERE transaction_id = v_previous_id
+    ) b
+    FULL JOIN (
+        SELECT student_id, SUM(amount) AS amount
+        FROM transactions
+        WHERE id > COALESCE(v_previous_id, 0) AND id <= v_cutoff
+        GROUP BY student_id
+    ) t ON t.student_id = b.student_id;
+
+    RETURN v_cutoff;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Баланс учеников на конец дня p_date: последний снимок, целиком попадающий в этот день,
+-- плюс транзакции после него до конца дня
+CREATE OR REPLACE FUNCTION student_balances_as_of(p_date DATE)
+RETURNS TABLE (student_id INTEGER, balance BIGINT) AS $$
+    WITH run AS (
+        SELECT COALESCE(MAX(transaction_id), 0) AS transaction_id
+        FROM balance_snapshot_runs
+        WHERE as_of < p_date + 1
+    ),
+    parts AS (
+        SELECT b.student_id, b.balance
+        FROM balance_snapshots b, run
+        WHERE b.transaction_id = run.transaction_id
+        UNION ALL
+        SELECT t.student_id, t.amount
+        FROM transactions t, run
+        WHERE t.id > run.transaction_id AND t.created_at < p_date + 1
+    )
+    SELECT student_id, SUM(balance)::bigint
+    FROM parts
+    GROUP BY student_id
+$$ LANGUAGE sql STABLE;
+
+-- Расхождения students.balance с журналом транзакций: последний снимок плюс транзакции после него
+CREATE OR REPLACE FUNCTION student_balance_drift()
+RETURNS TABLE (student_id INTEGER, balance BIGINT, ledger_balance BIGINT, drift BIGINT) AS $$
+    WITH run AS (
+        SELECT COALESCE(MAX(transaction_id), 0) AS transaction_id FROM balance_snapshot_runs
+    ),
+    ledger AS (
+        SELECT parts.student_id, SUM(parts.amount) AS amount
+        FROM (
+            SELECT b.student_id, b.balance AS amount
+            FROM balance_snapshots b, run
+            WHERE b.transaction_id = run.transaction_id
+            UNION ALL
+            SELECT t.student_id, t.amount
+            FROM transactions t, run
+            WHERE t.id > run.transaction_id
+        ) parts
+        GROUP BY parts.student_id
+    )
+    SELECT s.id, COALESCE(s.balance, 0)::bigint, COALESCE(l.amount, 0)::bigint,
+           (COALESCE(s.balance, 0) - COALESCE(l.amount, 0))::bigint
+    FROM students s
+    LEFT JOIN ledger l ON l.student_id = s.id
+    WHERE COALESCE(s.balance, 0) <> COALESCE(l.amount, 0)
+$$ LANGUAGE sql STABLE;
+
+SELECT take_balance_snapshot();
@@ -0,0 +1,7 @@
+-- Поиск учеников по ФИО, логину и контакту родителя: триграммные индексы
+-- обслуживают ILIKE '%...%' и нечёткое совпадение (оператор %) без полного прохода
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_users_full_name_trgm ON users USING gin (full_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_login_trgm ON users USING gin (login gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_students_parent_contact_trgm ON students USING gin (parent_contact gin_trgm_ops);
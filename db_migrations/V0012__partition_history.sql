@@ -0,0 +1,166 @@
+-- Секционирование истории: attendance по session_date, transactions по created_at, секция на месяц.
+-- Строки вне созданных секций попадают в секцию DEFAULT и переносятся при создании нужной секции.
+-- Первичные ключи включают ключ секционирования: (id, session_date) и (id, created_at).
+
+-- Секции p_table помесячно с p_from по p_to включительно; возвращает число созданных
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(p_table TEXT, p_from DATE, p_to DATE) RETURNS INTEGER AS $$
+DECLARE
+    v_column TEXT := CASE p_table WHEN 'attendance' THEN 'session_date' ELSE 'created_at' END;
+    v_month DATE := date_trunc('month', p_from)::date;
+    v_next DATE;
+    v_name TEXT;
+    v_created INTEGER := 0;
+BEGIN
+    WHILE v_month <= p_to LOOP
+        v_next := (v_month + INTERVAL '1 month')::date;
+        v_name := p_table || '_y' || to_char(v_month, 'YYYY') || 'm' || to_char(v_month, 'MM');
+        IF to_regclass('public.' || v_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE public.%I (LIKE public.%I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_name, p_table);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM public.%I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO public.%I SELECT * FROM moved',
+                p_table || '_default', v_column, v_month, v_column, v_next, v_name
+            );
+            EXECUTE format('ALTER TABLE public.%I ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)', p_table, v_name, v_month, v_next);
+            v_created := v_created + 1;
+        END IF;
+        v_month := v_next;
+    END LOOP;
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Плановое обслуживание: секции с p_from (или с самой ранней строки в DEFAULT) до p_months_ahead месяцев вперёд
+CREATE OR REPLACE FUNCTION maintain_partitions(p_months_ahead INTEGER DEFAULT 3, p_from DATE DEFAULT NULL) RETURNS INTEGER AS $$
+DECLARE
+    v_until DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => p_months_ahead))::date;
+    v_attendance_from DATE;
+    v_transactions_from DATE;
+BEGIN
+    SELECT LEAST(MIN(session_date), date_trunc('month', CURRENT_DATE)::date, p_from) INTO v_attendance_from FROM attendance_default;
+    SELECT LEAST(MIN(created_at)::date, date_trunc('month', CURRENT_DATE)::date, p_from) INTO v_transactions_from FROM transactions_default;
+    RETURN ensure_monthly_partitions('attendance', v_attendance_from, v_until)
+         + ensure_monthly_partitions('transactions', v_transactions_from, v_until);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Посещаемость
+ALTER TABLE attendance RENAME TO attendance_unpartitioned;
+ALTER SEQUENCE attendance_id_seq OWNED BY NONE;
+
+CREATE TABLE attendance (
+    id INTEGER NOT NULL DEFAULT nextval('attendance_id_seq'),
+    student_id INTEGER REFERENCES students(id),
+    group_id INTEGER REFERENCES groups(id),
+    session_date DATE NOT NULL,
+    is_present BOOLEAN DEFAULT FALSE,
+    trainer_comment TEXT,
+    cost_charged INTEGER DEFAULT 300,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) PARTITION BY RANGE (session_date);
+
+CREATE TABLE attendance_default PARTITION OF attendance DEFAULT;
+
+-- Транзакции
+ALTER TABLE transactions RENAME TO transactions_unpartitioned;
+ALTER SEQUENCE transactions_id_seq OWNED BY NONE;
+
+CREATE TABLE transactions (
+    id INTEGER NOT NULL DEFAULT nextval('transactions_id_seq'),
+    student_id INTEGER REFERENCES students(id),
+    amount INTEGER NOT NULL,
+    transaction_type VARCHAR(50) NOT NULL CHECK (transaction_type IN ('payment', 'charge', 'adjustment')),
+    description TEXT,
+    created_by INTEGER REFERENCES users(id),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE transactions_default PARTITION OF transactions DEFAULT;
+
+-- Секции под существующие данные и на три месяца вперёд
+SELECT ensure_monthly_partitions(
+    'attendance',
+    LEAST((SELECT MIN(session_date) FROM attendance_unpartitioned), CURRENT_DATE),
+    (CURRENT_DATE + INTERVAL '3 months')::date
+);
+SELECT ensure_monthly_partitions(
+    'transactions',
+    LEAST((SELECT MIN(created_at)::date FROM transactions_unpartitioned), CURRENT_DATE),
+    (CURRENT_DATE + INTERVAL '3 months')::date
+);
+
+INSERT INTO attendance (id, student_id, group_id, session_date, is_present, trainer_comment, cost_charged, created_at)
+SELECT id, student_id, group_id, session_date, is_present, trainer_comment, cost_charged, created_at
+FROM attendance_unpartitioned;
+
+INSERT INTO transactions (id, student_id, amount, transaction_type, description, created_by, created_at)
+SELECT id, student_id, amount, transaction_type, description, created_by, COALESCE(created_at, CURRENT_TIMESTAMP)
+FROM transactions_unpartitioned;
+
+DROP TABLE attendance_unpartitioned;
+DROP TABLE transactions_unpartitioned;
+
+ALTER SEQUENCE attendance_id_seq OWNED BY attendance.id;
+ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id;
+
+ALTER TABLE attendance ADD PRIMARY KEY (id, session_date);
+ALTER TABLE attendance ADD UNIQUE (student_id, group_id, session_date);
+ALTER TABLE transactions ADD PRIMARY KEY (id, created_at);
+
+-- Индексы из V0004 на секционированных таблицах (создаются в каждой секции)
+CREATE INDEX IF NOT EXISTS idx_attendance_group_date ON attendance(group_id, session_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_attendance_student_date_desc ON attendance(student_id, session_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(session_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_attendance_present ON attendance(student_id, session_date DESC) WHERE is_present;
+CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_student_created ON transactions(student_id, created_at DESC, id DESC);
+
+-- Архив: отсоединённые секции прошлых сезонов переносятся в схему archive и остаются
+-- доступными для отчётов через archive.attendance_all и archive.transactions_all
+CREATE SCHEMA IF NOT EXISTS archive;
+
+CREATE OR REPLACE FUNCTION refresh_archive_views() RETURNS VOID AS $$
+DECLARE
+    v_table TEXT;
+    v_query TEXT;
+BEGIN
+    FOREACH v_table IN ARRAY ARRAY['attendance', 'transactions'] LOOP
+        SELECT string_agg(format('SELECT * FROM archive.%I', c.relname), ' UNION ALL ' ORDER BY c.relname)
+        INTO v_query
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'archive' AND c.relkind = 'r' AND c.relname ~ ('^' || v_table || '_y[0-9]{4}m[0-9]{2}$');
+        EXECUTE format(
+            'CREATE OR REPLACE VIEW archive.%I AS SELECT * FROM public.%I%s',
+            v_table || '_all', v_table, COALESCE(' UNION ALL ' || v_query, '')
+        );
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Отсоединяет секции, целиком лежащие до p_before, и переносит их в архив; возвращает их имена
+CREATE OR REPLACE FUNCTION archive_partitions(p_before DATE) RETURNS SETOF TEXT AS $$
+DECLARE
+    v_partition RECORD;
+BEGIN
+    FOR v_partition IN
+        SELECT parent.relname AS parent_name, child.relname AS child_name
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        JOIN pg_namespace n ON n.oid = child.relnamespace
+        WHERE n.nspname = 'public'
+          AND parent.relname IN ('attendance', 'transactions')
+          AND child.relname ~ '_y[0-9]{4}m[0-9]{2}$'
+          AND (to_date(substring(child.relname FROM '_y([0-9]{4})m') || substring(child.relname FROM 'm([0-9]{2})$'), 'YYYYMM')
+               + INTERVAL '1 month') <= p_before
+        ORDER BY child.relname
+    LOOP
+        EXECUTE format('ALTER TABLE public.%I DETACH PARTITION public.%I', v_partition.parent_name, v_partition.child_name);
+        EXECUTE format('ALTER TABLE public.%I SET SCHEMA archive', v_partition.child_name);
+        RETURN NEXT v_partition.child_name;
+    END LOOP;
+    PERFORM refresh_archive_views();
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT refresh_archive_views();
@@ -0,0 +1,55 @@
+-- Лента изменений вместо опроса списков: обработчики записи добавляют компактные события
+-- в той же транзакции, что и сами изменения, а функция changes отдаёт клиенту события
+-- после известного ему номера seq, дожидаясь новых через LISTEN change_events.
+CREATE TABLE IF NOT EXISTS change_events (
+    seq BIGSERIAL PRIMARY KEY,
+    entity VARCHAR(20) NOT NULL CHECK (entity IN ('attendance', 'transaction', 'balance', 'student', 'group')),
+    entity_id INTEGER NOT NULL,
+    data JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_change_events_created ON change_events(created_at);
+
+-- Номера выдаются под транзакционной блокировкой, которая держится до фиксации:
+-- события фиксируются в порядке seq, и читатель не пропустит событие, зафиксированное
+-- позже события с большим номером. Обработчики пишут события последним шагом перед COMMIT.
+CREATE OR REPLACE FUNCTION change_events_lock() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('change_events'));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Одно уведомление на оператор; слушатели получают его после фиксации транзакции
+CREATE OR REPLACE FUNCTION change_events_notify() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('change_events', (SELECT MAX(seq)::text FROM new_events));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS change_events_lock ON change_events;
+CREATE TRIGGER change_events_lock
+    BEFORE INSERT ON change_events
+    FOR EACH STATEMENT EXECUTE FUNCTION change_events_lock();
+
+DROP TRIGGER IF EXISTS change_events_notify ON change_events;
+CREATE TRIGGER change_events_notify
+    AFTER INSERT ON change_events
+    REFERENCING NEW TABLE AS new_events
+    FOR EACH STATEMENT EXECUTE FUNCTION change_events_notify();
+
+-- Удаляет события старше p_keep; последнее событие остаётся, чтобы по нему было видно,
+-- что клиент с меньшим номером отстал и должен перечитать данные целиком
+CREATE OR REPLACE FUNCTION prune_change_events(p_keep INTERVAL DEFAULT '7 days') RETURNS INTEGER AS $$
+DECLARE
+    v_deleted INTEGER;
+BEGIN
+    DELETE FROM change_events
+    WHERE created_at < CURRENT_TIMESTAMP - p_keep
+      AND seq < (SELECT MAX(seq) FROM change_events);
+    GET DIAGNOSTICS v_deleted = ROW_COUNT;
+    RETURN v_deleted;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,107 @@
+-- Ограничение попыток входа: корзины токенов по логину и по IP и прогрессивная блокировка
+-- после серии неудач. Таблица нелогируемая: состояние общее для всех экземпляров функции auth,
+-- запись не идёт в WAL, а после сбоя сервера таблица просто очищается.
+CREATE UNLOGGED TABLE IF NOT EXISTS login_throttle (
+    key VARCHAR(300) PRIMARY KEY,
+    tokens REAL NOT NULL,
+    failures INTEGER NOT NULL DEFAULT 0,
+    failed_at TIMESTAMPTZ,
+    locked_until TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_login_throttle_updated ON login_throttle(updated_at);
+
+-- Попытка входа по ключам p_keys ('ip:...', 'login:...'): корзина i вмещает p_burst[i] токенов
+-- и пополняется на токен за p_refill[i] секунд. Если ни один ключ не заблокирован и во всех
+-- корзинах есть токен, списывается по токену и retry_after = 0; иначе retry_after — через
+-- сколько секунд повторить, blocked_key — ключ, из-за которого отказ.
+-- Неудачи забываются через p_forget без новых неудач; записи, простоявшие p_forget,
+-- удаляются порциями (p_forget должен быть не меньше наибольшего срока блокировки).
+CREATE OR REPLACE FUNCTION login_throttle_take(
+    p_keys TEXT[], p_burst REAL[], p_refill REAL[], p_forget INTERVAL,
+    OUT retry_after INTEGER, OUT blocked_key TEXT, OUT failures INTEGER
+) AS $$
+DECLARE
+    v_now TIMESTAMPTZ := clock_timestamp();
+    v_row login_throttle%ROWTYPE;
+    v_wait INTEGER;
+BEGIN
+    retry_after := 0;
+    failures := 0;
+
+    DELETE FROM login_throttle
+    WHERE key IN (
+        SELECT key FROM login_throttle
+        WHERE updated_at < v_now - p_forget
+        LIMIT 100
+        FOR UPDATE SKIP LOCKED
+    );
+
+    -- Ключи блокируются в порядке массива; вызывающий передаёт их всегда в одном порядке
+    FOR i IN 1 .. cardinality(p_keys) LOOP
+        INSERT INTO login_throttle (key, tokens, updated_at) VALUES (p_keys[i], p_burst[i], v_now)
+        ON CONFLICT (key) DO NOTHING;
+        SELECT * INTO v_row FROM login_throttle WHERE key = p_keys[i] FOR UPDATE;
+
+        IF v_row.failed_at < v_now - p_forget THEN
+            v_row.failures := 0;
+        END IF;
+        v_row.tokens := LEAST(p_burst[i], v_row.tokens + EXTRACT(EPOCH FROM v_now - v_row.updated_at) / p_refill[i]);
+        UPDATE login_throttle
+        SET tokens = v_row.tokens, failures = v_row.failures, updated_at = v_now
+        WHERE key = p_keys[i];
+
+        IF v_row.locked_until > v_now THEN
+            v_wait := ceil(EXTRACT(EPOCH FROM v_row.locked_until - v_now));
+        ELSIF v_row.tokens < 1 THEN
+            v_wait := ceil((1 - v_row.tokens) * p_refill[i]);
+        ELSE
+            v_wait := 0;
+        END IF;
+        IF v_wait > retry_after THEN
+            retry_after := v_wait;
+            blocked_key := p_keys[i];
+        END IF;
+        failures := GREATEST(failures, v_row.failures);
+    END LOOP;
+
+    IF retry_after = 0 THEN
+        UPDATE login_throttle SET tokens = tokens - 1 WHERE key = ANY(p_keys);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Неудачный вход: после p_lock_after[i] неудач подряд ключ блокируется на p_lock_base секунд,
+-- и каждая следующая неудача удваивает срок, но не больше p_lock_max.
+-- Возвращает наибольший назначенный срок блокировки в секундах (0 — без блокировки).
+CREATE OR REPLACE FUNCTION login_throttle_fail(
+    p_keys TEXT[], p_lock_after INTEGER[], p_lock_base INTEGER, p_lock_max INTEGER
+) RETURNS INTEGER AS $$
+    WITH failed AS (
+        UPDATE login_throttle t
+        SET failures = t.failures + 1,
+            failed_at = clock_timestamp(),
+            locked_until = CASE
+                WHEN t.failures + 1 >= k.lock_after THEN clock_timestamp()
+                    + make_interval(secs => LEAST(p_lock_max, p_lock_base * power(2, t.failures + 1 - k.lock_after)))
+                ELSE t.locked_until
+            END
+        FROM unnest(p_keys, p_lock_after) AS k(key, lock_after)
+        WHERE t.key = k.key
+        RETURNING t.failures, k.lock_after
+    )
+    SELECT COALESCE(MAX(LEAST(p_lock_max, p_lock_base * power(2, failures - lock_after))) FILTER (WHERE failures >= lock_after), 0)::integer
+    FROM failed
+$$ LANGUAGE sql;
+
+-- Текущее состояние для наблюдения: заблокированные ключи и ключи с неудачами
+CREATE OR REPLACE VIEW login_throttle_status AS
+SELECT key,
+       round(tokens::numeric, 2) AS tokens,
+       failures,
+       failed_at,
+       locked_until,
+       GREATEST(0, ceil(EXTRACT(EPOCH FROM locked_until - clock_timestamp())))::integer AS locked_for,
+       updated_at
+FROM login_throttle;
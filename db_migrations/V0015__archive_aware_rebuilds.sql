@@ -0,0 +1,82 @@
+-- Пересчёты и баланс на дату учитывают историю, перенесённую в схему archive (V0012):
+-- читают archive.attendance_all и archive.transactions_all вместо рабочих таблиц.
+
+CREATE OR REPLACE FUNCTION rebuild_student_attendance_stats() RETURNS INTEGER AS $$
+DECLARE
+    fixed INTEGER;
+BEGIN
+    UPDATE students s
+    SET total_sessions = agg.total_sessions,
+        total_visits = agg.total_visits,
+        last_visit = agg.last_visit
+    FROM (
+        SELECT st.id,
+               COUNT(a.id) AS total_sessions,
+               COUNT(a.id) FILTER (WHERE a.is_present) AS total_visits,
+               MAX(a.session_date) FILTER (WHERE a.is_present) AS last_visit
+        FROM students st
+        LEFT JOIN archive.attendance_all a ON a.student_id = st.id
+        GROUP BY st.id
+    ) agg
+    WHERE s.id = agg.id
+      AND (s.total_sessions, s.total_visits, s.last_visit)
+          IS DISTINCT FROM (agg.total_sessions::int, agg.total_visits::int, agg.last_visit);
+    GET DIAGNOSTICS fixed = ROW_COUNT;
+    RETURN fixed;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rebuild_dashboard_stats() RETURNS VOID AS $$
+BEGIN
+    DELETE FROM group_daily_stats;
+    INSERT INTO group_daily_stats (group_id, session_date, present_count, absent_count, revenue_charged)
+    SELECT group_id, session_date,
+           COUNT(*) FILTER (WHERE is_present),
+           COUNT(*) FILTER (WHERE NOT is_present),
+           COALESCE(SUM(cost_charged) FILTER (WHERE is_present), 0)
+    FROM archive.attendance_all
+    GROUP BY group_id, session_date;
+
+    DELETE FROM student_monthly_stats;
+    INSERT INTO student_monthly_stats (student_id, month, sessions, visits, charged, paid)
+    SELECT student_id, month, SUM(sessions), SUM(visits), SUM(charged), SUM(paid)
+    FROM (
+        SELECT student_id, date_trunc('month', session_date)::date AS month,
+               COUNT(*) AS sessions,
+               COUNT(*) FILTER (WHERE is_present) AS visits,
+               COALESCE(SUM(cost_charged) FILTER (WHERE is_present), 0) AS charged,
+               0 AS paid
+        FROM archive.attendance_all
+        GROUP BY 1, 2
+        UNION ALL
+        SELECT student_id, date_trunc('month', created_at)::date, 0, 0, 0, SUM(amount)
+        FROM archive.transactions_all
+        WHERE transaction_type = 'payment'
+        GROUP BY 1, 2
+    ) parts
+    GROUP BY student_id, month;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Баланс на конец дня p_date: последний снимок в пределах дня плюс транзакции после него,
+-- включая отсоединённые в архив — дата может быть раньше снимка, взятого перед архивацией
+CREATE OR REPLACE FUNCTION student_balances_as_of(p_date DATE)
+RETURNS TABLE (student_id INTEGER, balance BIGINT) AS $$
+    WITH run AS (
+        SELECT COALESCE(MAX(transaction_id), 0) AS transaction_id
+        FROM balance_snapshot_runs
+        WHERE as_of < p_date + 1
+    ),
+    parts AS (
+        SELECT b.student_id, b.balance
+        FROM balance_snapshots b, run
+        WHERE b.transaction_id = run.transaction_id
+        UNION ALL
+        SELECT t.student_id, t.amount
+        FROM archive.transactions_all t, run
+        WHERE t.id > run.transaction_id AND t.created_at < p_date + 1
+    )
+    SELECT student_id, SUM(balance)::bigint
+    FROM parts
+    GROUP BY student_id
+$$ LANGUAGE sql STABLE;
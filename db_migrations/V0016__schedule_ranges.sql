@@ -0,0 +1,48 @@
+-- Диапазон дней с пробелами вокруг дефиса ('ПН - СР 18:00') разбирается как диапазон,
+-- а не как два отдельных дня. Диапазон в обратном порядке ('ПТ - ПН') по-прежнему
+-- не разбирается: days остаётся NULL, текст расписания сохраняется как есть.
+CREATE OR REPLACE FUNCTION parse_schedule(p_schedule TEXT, OUT days SMALLINT[], OUT starts_at TIME) AS $$
+DECLARE
+    v_names CONSTANT TEXT[] := ARRAY['ПН', 'ВТ', 'СР', 'ЧТ', 'ПТ', 'СБ', 'ВС'];
+    v_token TEXT;
+    v_from INTEGER;
+    v_to INTEGER;
+    v_days INTEGER[] := '{}';
+BEGIN
+    IF p_schedule IS NULL OR btrim(p_schedule) = '' THEN
+        RETURN;
+    END IF;
+
+    starts_at := substring(p_schedule FROM '([0-9]{1,2}:[0-9]{2})')::time;
+
+    FOR v_token IN
+        SELECT token
+        FROM regexp_split_to_table(
+            regexp_replace(
+                translate(regexp_replace(p_schedule, '[0-9]{1,2}:[0-9]{2}', ' ', 'g'), 'пнвтсрчб–—', 'ПНВТСРЧБ--'),
+                '[[:space:]]*-[[:space:]]*', '-', 'g'
+            ),
+            '[[:space:],;/.]+'
+        ) AS token
+        WHERE token !~ '^-*$'
+    LOOP
+        v_from := array_position(v_names, split_part(v_token, '-', 1));
+        v_to := COALESCE(array_position(v_names, NULLIF(split_part(v_token, '-', 2), '')), v_from);
+        IF v_from IS NULL OR v_to IS NULL OR v_to < v_from THEN
+            RETURN;
+        END IF;
+        v_days := v_days || ARRAY(SELECT generate_series(v_from, v_to));
+    END LOOP;
+
+    IF cardinality(v_days) > 0 THEN
+        days := ARRAY(SELECT DISTINCT day FROM unnest(v_days) AS day ORDER BY day)::smallint[];
+    END IF;
+EXCEPTION
+    WHEN data_exception THEN
+        days := NULL;
+        starts_at := NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- Перечитывание расписаний с диапазонами, записанных по старым правилам
+UPDATE groups SET schedule = schedule WHERE schedule ~ '-|–|—';
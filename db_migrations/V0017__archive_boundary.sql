@@ -0,0 +1,38 @@
+-- Граница архива: первый день после последнего месяца p_table, перенесённого в схему archive
+-- (NULL — архива ещё нет). Занятия раньше границы не отмечаются: строка попала бы в секцию
+-- DEFAULT рядом с архивной и списала бы оплату второй раз.
+CREATE OR REPLACE FUNCTION archive_boundary(p_table TEXT) RETURNS DATE AS $$
+    SELECT (MAX(to_date(substring(c.relname FROM '_y([0-9]{4})m') || substring(c.relname FROM 'm([0-9]{2})$'), 'YYYYMM'))
+            + INTERVAL '1 month')::date
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'archive' AND c.relkind = 'r' AND c.relname ~ ('^' || p_table || '_y[0-9]{4}m[0-9]{2}$')
+$$ LANGUAGE sql STABLE;
+
+-- Секции создаются только после границы архива: секция с именем архивной уже не появится
+-- в public, и следующий archive_partitions не упрётся в занятое имя в схеме archive
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(p_table TEXT, p_from DATE, p_to DATE) RETURNS INTEGER AS $$
+DECLARE
+    v_column TEXT := CASE p_table WHEN 'attendance' THEN 'session_date' ELSE 'created_at' END;
+    v_month DATE := GREATEST(date_trunc('month', p_from)::date, archive_boundary(p_table));
+    v_next DATE;
+    v_name TEXT;
+    v_created INTEGER := 0;
+BEGIN
+    WHILE v_month <= p_to LOOP
+        v_next := (v_month + INTERVAL '1 month')::date;
+        v_name := p_table || '_y' || to_char(v_month, 'YYYY') || 'm' || to_char(v_month, 'MM');
+        IF to_regclass('public.' || v_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE public.%I (LIKE public.%I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_name, p_table);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM public.%I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO public.%I SELECT * FROM moved',
+                p_table || '_default', v_column, v_month, v_column, v_next, v_name
+            );
+            EXECUTE format('ALTER TABLE public.%I ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)', p_table, v_name, v_month, v_next);
+            v_created := v_created + 1;
+        END IF;
+        v_month := v_next;
+    END LOOP;
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,4 @@
+-- Хэш тела запроса, выполненного под ключом идемпотентности: повтор с тем же ключом,
+-- но другим телом отклоняется, а не получает чужой сохранённый ответ.
+-- У ключей, сохранённых до миграции, хэша нет — для них тело не сверяется
+ALTER TABLE idempotency_keys ADD COLUMN IF NOT EXISTS request_hash VARCHAR(64);
@@ -0,0 +1,185 @@
+"""
+Нагрузочный замер обработчиков функций в процессе на локальной базе.
+
+Сценарии: запросы из tests.json каждой функции (--mix tests) или
+синтетический вечерний пик (--mix peak), когда тренеры одновременно
+отмечают посещаемость, а родители смотрят баланс. Запросы выполняются
+из N параллельных потоков; по каждому эндпоинту выводятся пропускная
+способность, p50/p95/p99 задержки и среднее число SQL-запросов.
+
+Запуск: DATABASE_URL=... python scripts/benchmark.py --migrate --seed --mix peak --workers 16 --requests 2000
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import psycopg2.extensions
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import ThreadedConnectionPool
+from localdb import FUNCTIONS, ROOT, apply_migrations, connect, cursor_class, load_function, seed
+
+_local = threading.local()
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Курсор, считающий выполненные запросы текущего потока"""
+
+    def execute(self, query, vars=None):
+        _local.statements += 1
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        _local.statements += 1
+        return super().executemany(query, vars_list)
+
+class CountingConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        kwargs['cursor_factory'] = cursor_class(CountingCursor, kwargs.get('cursor_factory'))
+        return super().cursor(*args, **kwargs)
+
+def attach_pool(modules: dict, pool: ThreadedConnectionPool):
+    """Подменяет соединения функций общим пулом со счётчиком запросов"""
+    def get_connection():
+        return pool.getconn()
+
+    def release_connection(conn, broken=False):
+        if not broken and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        pool.putconn(conn, close=broken)
+
+    for module in modules.values():
+        module.get_connection = get_connection
+        module.release_connection = release_connection
+
+def event(method: str, query: dict = None, body: dict = None) -> dict:
+    return {
+        'httpMethod': method,
+        'queryStringParameters': query,
+        'headers': {},
+        'body': json.dumps(body or {})
+    }
+
+def tests_mix() -> list:
+    """Сценарии из tests.json с равными весами"""
+    scenarios = []
+    for name in FUNCTIONS:
+        tests = json.loads((ROOT / 'backend' / name / 'tests.json').read_text(encoding='utf-8'))['tests']
+        for test in tests:
+            scenarios.append((f"{name} {test['method']}", name, 1,
+                              lambda test=test: event(test['method'], test.get('queryParams'), test.get('body'))))
+    return scenarios
+
+def peak_mix(conn) -> list:
+    """Вечерний пик: отметки посещаемости всеми группами и чтения списков"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT g.id, array_agg(s.id) FROM groups g JOIN students s ON s.group_id = g.id GROUP BY g.id")
+        rosters = cur.fetchall()
+        cur.execute("SELECT login FROM users WHERE role = 'student' LIMIT 1000")
+        logins = [row[0] for row in cur.fetchall()]
+    conn.rollback()
+    students = [student_id for _, roster in rosters for student_id in roster]
+
+    def mark():
+        group_id, roster = random.choice(rosters)
+        session_date = date.today() - timedelta(days=random.randint(0, 6))
+        present = random.sample(roster, k=int(len(roster) * 0.8))
+        return event('POST', body={'group_id': group_id, 'session_date': session_date.isoformat(), 'present_students': present})
+
+    return [
+        ('attendance POST', 'attendance', 30, mark),
+        ('attendance GET group', 'attendance', 15,
+         lambda: event('GET', {'group_id': str(random.choice(rosters)[0])})),
+        ('attendance GET student', 'attendance', 10,
+         lambda: event('GET', {'student_id': str(random.choice(students))})),
+        ('transactions GET student', 'transactions', 10,
+         lambda: event('GET', {'student_id': str(random.choice(students))})),
+        ('transactions POST', 'transactions', 5,
+         lambda: event('POST', body={'student_id': random.choice(students), 'amount': 3600})),
+        ('students GET', 'students', 5, lambda: event('GET')),
+        ('groups GET', 'groups', 15, lambda: event('GET')),
+        ('stats GET', 'stats', 5, lambda: event('GET')),
+        # Разные адреса клиентов, чтобы замер шёл через bcrypt, а не упирался в ограничение по IP
+        ('auth POST', 'auth', 5,
+         lambda: dict(event('POST', body={'login': random.choice(logins), 'password': 'wrong-password'}),
+                      requestContext={'identity': {'sourceIp': f'10.{random.randint(0, 255)}.{random.randint(0, 255)}.1'}})),
+    ]
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный замер обработчиков функций')
+    parser.add_argument('--migrate', action='store_true', help='применить миграции к пустой базе')
+    parser.add_argument('--seed', action='store_true', help='заполнить базу тестовым объёмом')
+    parser.add_argument('--students', type=int, default=3000)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--mix', choices=['tests', 'peak'], default='peak')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--json', help='сохранить результаты в файл для сравнения до/после')
+    args = parser.parse_args()
+
+    setup = connect()
+    if args.migrate:
+        apply_migrations(setup)
+    if args.seed:
+        seed(setup, groups=max(1, args.students // 75), students=args.students, years=args.years)
+
+    modules = {name: load_function(name) for name in FUNCTIONS}
+    pool = ThreadedConnectionPool(args.workers, args.workers, setup.dsn, connection_factory=CountingConnection)
+    attach_pool(modules, pool)
+
+    scenarios = tests_mix() if args.mix == 'tests' else peak_mix(setup)
+    setup.close()
+    weights = [weight for _, _, weight, _ in scenarios]
+    jobs = random.choices(scenarios, weights=weights, k=args.requests)
+
+    def call(job):
+        endpoint, name, _, make_event = job
+        request = make_event()
+        _local.statements = 0
+        started = time.perf_counter()
+        response = modules[name].handler(request, None)
+        elapsed = time.perf_counter() - started
+        return endpoint, elapsed, response['statusCode'], _local.statements
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(call, jobs))
+    wall = time.perf_counter() - started
+    pool.closeall()
+
+    by_endpoint = defaultdict(list)
+    for endpoint, elapsed, status, statements in results:
+        by_endpoint[endpoint].append((elapsed, status, statements))
+
+    report = {'workers': args.workers, 'requests': len(results), 'seconds': round(wall, 3),
+              'throughput': round(len(results) / wall, 1), 'endpoints': {}}
+    print(f"{'endpoint':<26}{'n':>6}{'err':>6}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'stmts':>7}")
+    for endpoint, rows in sorted(by_endpoint.items()):
+        latencies = [elapsed * 1000 for elapsed, _, _ in rows]
+        stats = {
+            'count': len(rows),
+            'errors': sum(1 for _, status, _ in rows if status >= 500),
+            'rps': round(len(rows) / wall, 1),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'statements': round(sum(statements for _, _, statements in rows) / len(rows), 1)
+        }
+        report['endpoints'][endpoint] = stats
+        print(f"{endpoint:<26}{stats['count']:>6}{stats['errors']:>6}{stats['rps']:>8}"
+              f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['statements']:>7}")
+    print(f"total: {report['requests']} requests in {report['seconds']} s, {report['throughput']} req/s")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as target:
+            json.dump(report, target, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
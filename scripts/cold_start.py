@@ -0,0 +1,90 @@
+"""
+Замер холодного старта функций: каждый прогон — новый процесс Python.
+
+Для каждой функции измеряются время импорта index.py и время до первого
+ответа: preflight OPTIONS, а с --with-db ещё и первый запрос к базе.
+Также выводится, какие тяжёлые модули оказались загружены к моменту
+ответа — preflight не должен тянуть драйвер БД, bcrypt и orjson.
+
+Запуск: python scripts/cold_start.py --runs 10
+        DATABASE_URL=... python scripts/cold_start.py --with-db --json cold.json
+"""
+import argparse
+import importlib.util
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# localdb импортирует psycopg2, поэтому в дочерний процесс он не подключается
+ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ['psycopg2', 'bcrypt', 'orjson', 'concurrent.futures']
+
+def db_event(name: str) -> dict:
+    """Первый запрос к базе: для auth — вход несуществующего пользователя, без bcrypt"""
+    if name == 'auth':
+        return {'httpMethod': 'POST', 'headers': {}, 'queryStringParameters': {},
+                'body': json.dumps({'login': 'cold_start_probe', 'password': 'probe'})}
+    return {'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': {}, 'body': ''}
+
+def child(name: str, with_db: bool):
+    """Один холодный старт в текущем процессе; результат печатается JSON-строкой"""
+    started = time.perf_counter()
+    spec = importlib.util.spec_from_file_location(f'{name}_function', ROOT / 'backend' / name / 'index.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    imported = time.perf_counter()
+    event = db_event(name) if with_db else {'httpMethod': 'OPTIONS', 'headers': {}, 'body': ''}
+    response = module.handler(event, None)
+    answered = time.perf_counter()
+    print(json.dumps({
+        'import_ms': (imported - started) * 1000,
+        'first_response_ms': (answered - imported) * 1000,
+        'status': response['statusCode'],
+        'modules': [module_name for module_name in HEAVY_MODULES if module_name in sys.modules]
+    }))
+
+def measure(name: str, with_db: bool) -> dict:
+    command = [sys.executable, __file__, '--child', name]
+    if with_db:
+        command.append('--with-db')
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер холодного старта функций')
+    parser.add_argument('--runs', type=int, default=5, help='число новых процессов на функцию')
+    parser.add_argument('--with-db', action='store_true', help='первый запрос идёт в базу из DATABASE_URL')
+    parser.add_argument('--json', help='сохранить результаты в файл для сравнения до/после')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.with_db)
+        return
+
+    from localdb import FUNCTIONS
+
+    report = {'runs': args.runs, 'with_db': args.with_db, 'functions': {}}
+    print(f"{'function':<14}{'import ms':>11}{'first ms':>10}{'status':>8}  loaded")
+    for name in FUNCTIONS:
+        samples = [measure(name, args.with_db) for _ in range(args.runs)]
+        stats = {
+            'import_ms': round(statistics.median(sample['import_ms'] for sample in samples), 2),
+            'first_response_ms': round(statistics.median(sample['first_response_ms'] for sample in samples), 2),
+            'status': samples[-1]['status'],
+            'modules': samples[-1]['modules']
+        }
+        report['functions'][name] = stats
+        print(f"{name:<14}{stats['import_ms']:>11}{stats['first_response_ms']:>10}{stats['status']:>8}  "
+              f"{', '.join(stats['modules']) or '-'}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as target:
+            json.dump(report, target, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
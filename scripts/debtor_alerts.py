@@ -0,0 +1,36 @@
+"""
+Список учеников, чей баланс уйдёт в минус за ближайшие N занятий группы.
+Использует тот же запрос, что и GET stats?at_risk=N; подходит для запуска по расписанию (cron).
+
+Запуск: DATABASE_URL=... python scripts/debtor_alerts.py --sessions 4 [--group-id 3] [--json alerts.json]
+"""
+import argparse
+import json
+from localdb import connect, load_function
+
+def main():
+    parser = argparse.ArgumentParser(description='Ученики, которым скоро не хватит баланса')
+    parser.add_argument('--sessions', type=int, default=4, help='сколько ближайших занятий учитывать')
+    parser.add_argument('--group-id', type=int)
+    parser.add_argument('--json', help='сохранить список в файл')
+    args = parser.parse_args()
+
+    stats = load_function('stats')
+    conn = connect()
+    with conn, conn.cursor() as cur:
+        cur.execute(stats.AT_RISK_QUERY, {'sessions': args.sessions, 'group_id': args.group_id})
+        columns = [column.name for column in cur.description]
+        students = [dict(zip(columns, row)) for row in cur.fetchall()]
+    conn.close()
+
+    for student in students:
+        print(f"{student['runs_out_on']}  {student['full_name']} ({student['group_name']}): "
+              f"баланс {student['balance']}, после {student['planned_sessions']} занятий {student['projected_balance']}")
+    print(f'Учеников в зоне риска: {len(students)}')
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as target:
+            json.dump(students, target, ensure_ascii=False, indent=2, default=str)
+
+if __name__ == '__main__':
+    main()
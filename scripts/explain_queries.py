@@ -0,0 +1,145 @@
+"""
+Проверка планов запросов обработчиков на локальной заполненной базе.
+
+Каждый сценарий вызывает handler в процессе; перед каждым запросом
+выполняется EXPLAIN с теми же параметрами. Seq Scan по большим таблицам
+считается регрессией планировщика, как и ответ 5xx, и скрипт завершается с кодом 1.
+Дополнительные сценарии с expectedStatus проверяют и код ответа; setup — SQL,
+который выполняется перед вызовом (перенос месяца в архив, состояние
+ограничения входа). Все изменения откатываются.
+
+Запуск: DATABASE_URL=... python scripts/explain_queries.py [--migrate] [--seed]
+"""
+import argparse
+import json
+import re
+import sys
+from datetime import date, timedelta
+import psycopg2.extensions
+from localdb import FUNCTIONS, ROOT, apply_migrations, connect, cursor_class, load_function, seed
+
+LARGE_TABLES = {'attendance', 'transactions'}
+
+# Месяц заполненной истории (localdb.seed заполняет два года), который сценарий переносит в архив
+ARCHIVED_MONTH = (date.today().replace(day=1) - timedelta(days=365)).replace(day=1)
+ARCHIVE_SETUP = ("SELECT archive_partitions(%s)", ((ARCHIVED_MONTH + timedelta(days=31)).replace(day=1),))
+
+# Ключи ограничения входа заполняются в setup и откатываются, поэтому сценарии повторяемы
+THROTTLE_BUCKET_SETUP = ("INSERT INTO login_throttle (key, tokens) VALUES ('login:throttle.bucket', 0)",)
+THROTTLE_LOCKED_SETUP = ("""
+    INSERT INTO login_throttle (key, tokens, failures, failed_at, locked_until)
+    VALUES ('login:throttle.locked', 5, 5, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP + INTERVAL '5 minutes')
+""",)
+
+EXTRA_SCENARIOS = {
+    'auth': [
+        {'name': 'Overlong login', 'method': 'POST', 'expectedStatus': 401,
+         'body': {'login': 'overlong.' + 'x' * 300, 'password': 'wrongpass'}},
+        {'name': 'Empty login bucket', 'method': 'POST', 'setup': THROTTLE_BUCKET_SETUP, 'expectedStatus': 429,
+         'body': {'login': 'throttle.bucket', 'password': 'wrongpass'}},
+        {'name': 'Locked login', 'method': 'POST', 'setup': THROTTLE_LOCKED_SETUP, 'expectedStatus': 429,
+         'body': {'login': 'throttle.locked', 'password': 'wrongpass'}},
+    ],
+    'attendance': [
+        {'name': 'Mark session in archived month', 'method': 'POST', 'setup': ARCHIVE_SETUP, 'expectedStatus': 400,
+         'body': {'group_id': 1, 'session_date': (ARCHIVED_MONTH + timedelta(days=2)).isoformat(), 'present_students': [1]}},
+        {'name': 'Group attendance', 'method': 'GET', 'queryParams': {'group_id': '1'}},
+        {'name': 'Student attendance', 'method': 'GET', 'queryParams': {'student_id': '1'}},
+        {'name': 'Attendance by dates', 'method': 'GET', 'queryParams': {'date_from': '2025-09-01', 'date_to': '2025-09-30'}},
+    ],
+    'transactions': [
+        {'name': 'Student ledger', 'method': 'GET', 'queryParams': {'student_id': '1'}},
+        {'name': 'Charges only', 'method': 'GET', 'queryParams': {'type': 'charge'}},
+    ],
+    'students': [
+        {'name': 'Group students', 'method': 'GET', 'queryParams': {'group_id': '1'}},
+    ],
+}
+
+class ExplainingCursor(psycopg2.extensions.cursor):
+    """Курсор, который перед каждым запросом сохраняет его план"""
+    plans = []
+
+    def execute(self, query, vars=None):
+        if not self.name and query.lstrip().split(None, 1)[0].upper() in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE'):
+            super().execute('EXPLAIN (FORMAT JSON) ' + query, vars)
+            row = self.fetchone()
+            plan = row['QUERY PLAN'] if isinstance(row, dict) else row[0]
+            self.plans.append((query, plan[0]['Plan']))
+        return super().execute(query, vars)
+
+class RollbackConnection(psycopg2.extensions.connection):
+    """Соединение, в котором commit обработчиков ничего не фиксирует"""
+
+    def cursor(self, *args, **kwargs):
+        kwargs['cursor_factory'] = cursor_class(ExplainingCursor, kwargs.get('cursor_factory'))
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        pass
+
+def seq_scans(plan: dict):
+    """
+    Имена таблиц, которые план читает последовательным сканированием; секции считаются своей таблицей.
+    Пустая секция (обычно _default) читается так с нулевой стоимостью и регрессией не считается.
+    """
+    if plan.get('Node Type') == 'Seq Scan' and plan['Total Cost'] > 0:
+        yield re.sub(r'_(y[0-9]{4}m[0-9]{2}|default)$', '', plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        yield from seq_scans(child)
+
+def scenarios(name: str) -> list:
+    tests = json.loads((ROOT / 'backend' / name / 'tests.json').read_text(encoding='utf-8'))['tests']
+    return tests + EXTRA_SCENARIOS.get(name, [])
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--migrate', action='store_true', help='применить миграции к пустой базе')
+    parser.add_argument('--seed', action='store_true', help='заполнить базу тестовым объёмом')
+    args = parser.parse_args()
+
+    if args.migrate or args.seed:
+        setup = connect()
+        if args.migrate:
+            apply_migrations(setup)
+        if args.seed:
+            seed(setup)
+        setup.close()
+
+    conn = connect(connection_factory=RollbackConnection)
+    failures = 0
+    for name in FUNCTIONS:
+        module = load_function(name)
+        module.get_connection = lambda: conn
+        module.release_connection = lambda conn, broken=False: None
+        for test in scenarios(name):
+            ExplainingCursor.plans = []
+            event = {
+                'httpMethod': test['method'],
+                'headers': test.get('headers', {}),
+                'queryStringParameters': test.get('queryParams'),
+                'body': json.dumps(test.get('body', {}))
+            }
+            if test.get('setup'):
+                with psycopg2.extensions.connection.cursor(conn) as setup:
+                    setup.execute(*test['setup'])
+            response = module.handler(event, None)
+            checked = test in EXTRA_SCENARIOS.get(name, []) and 'expectedStatus' in test
+            if response['statusCode'] >= 500 or checked and response['statusCode'] != test['expectedStatus']:
+                failures += 1
+                print(f"[FAIL] {name} / {test['name']} ({response['statusCode']}): {response['body'][:200]}")
+            for query, plan in ExplainingCursor.plans:
+                scans = sorted(set(seq_scans(plan)) & LARGE_TABLES)
+                status = 'FAIL' if scans else 'ok'
+                failures += bool(scans)
+                first_line = ' '.join(query.split())[:90]
+                print(f"[{status}] {name} / {test['name']} ({response['statusCode']}): "
+                      f"cost={plan['Total Cost']:.0f} {first_line}")
+                if scans:
+                    print(f"       Seq Scan: {', '.join(scans)}")
+            conn.rollback()
+    conn.close()
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
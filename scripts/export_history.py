@@ -0,0 +1,35 @@
+"""
+Выгрузка посещаемости и транзакций за период в файлы CSV или NDJSON.
+Строки пишутся по мере чтения серверным курсором, память не растёт с периодом.
+
+Запуск: DATABASE_URL=... python scripts/export_history.py 2025-09-01 2026-05-31 --format csv --out reports
+"""
+import argparse
+from pathlib import Path
+from localdb import connect, load_function
+
+def main():
+    parser = argparse.ArgumentParser(description='Выгрузка истории посещаемости и транзакций за период')
+    parser.add_argument('date_from')
+    parser.add_argument('date_to')
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    parser.add_argument('--group-id', type=int)
+    parser.add_argument('--out', default='.')
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    conn = connect()
+    params = {'date_from': args.date_from, 'date_to': args.date_to, 'group_id': args.group_id}
+    for name in ('attendance', 'transactions'):
+        module = load_function(name)
+        path = out / f'{name}_{args.date_from}_{args.date_to}.{args.format}'
+        with open(path, 'w', encoding='utf-8', newline='') as target:
+            for chunk in module.export_rows(conn, module.EXPORT_QUERY, params, args.format):
+                target.write(chunk)
+        conn.rollback()
+        print(f'{name}: {path}')
+    conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Локальная база для проверок и замеров: применение миграций, заполнение
+объёмными тестовыми данными и загрузка обработчиков функций в процесс.
+"""
+import importlib.util
+import os
+from pathlib import Path
+import psycopg2
+import psycopg2.extensions
+
+ROOT = Path(__file__).resolve().parent.parent
+FUNCTIONS = ['auth', 'groups', 'students', 'attendance', 'transactions', 'stats', 'changes']
+
+SEED_PASSWORD_HASH = '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewY5GyYk3b7Y4Iye'
+
+def connect(**kwargs):
+    """Соединение с локальной базой из DATABASE_URL"""
+    return psycopg2.connect(os.environ['DATABASE_URL'], **kwargs)
+
+def apply_migrations(conn):
+    """Применяет все миграции из db_migrations по порядку версий"""
+    migrations = sorted(
+        (ROOT / 'db_migrations').glob('V*__*.sql'),
+        key=lambda path: int(path.name[1:].split('__')[0])
+    )
+    with conn.cursor() as cur:
+        for path in migrations:
+            cur.execute(path.read_text(encoding='utf-8'))
+    conn.commit()
+
+def seed(conn, groups: int = 40, students: int = 3000, years: int = 3):
+    """
+    Заполняет базу объёмом, близким к боевому: группы, ученики, посещения
+    ПН/СР/ПТ за несколько лет, списания за посещения и ежемесячные оплаты.
+    Повторный вызов ничего не делает.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM users WHERE login LIKE 'seed\\_%' LIMIT 1")
+        if cur.fetchone():
+            return
+
+        cur.execute("""
+            INSERT INTO users (login, password_hash, role, full_name)
+            SELECT 'seed_trainer_' || i, %s, 'trainer', 'Тренер ' || i
+            FROM generate_series(1, %s) i
+        """, (SEED_PASSWORD_HASH, groups))
+        cur.execute("""
+            INSERT INTO groups (name, trainer_id, schedule, cost_per_session)
+            SELECT 'Группа ' || substr(u.login, 14), u.id, 'ПН, СР, ПТ 16:00', 300
+            FROM users u WHERE u.login LIKE 'seed\\_trainer\\_%'
+        """)
+        cur.execute("""
+            WITH seed_groups AS (
+                SELECT array_agg(g.id ORDER BY g.id) AS ids
+                FROM groups g JOIN users u ON g.trainer_id = u.id
+                WHERE u.login LIKE 'seed\\_trainer\\_%%'
+            ),
+            new_users AS (
+                INSERT INTO users (login, password_hash, role, full_name, phone)
+                SELECT 'seed_kid_' || i, %s, 'student',
+                       'Ученик ' || upper(substr(md5(i::text), 1, 6)) || ' ' || i,
+                       '+7900' || lpad(i::text, 7, '0')
+                FROM generate_series(1, %s) i
+                RETURNING id, login, phone
+            )
+            INSERT INTO students (user_id, group_id, birth_date, parent_contact, balance)
+            SELECT nu.id,
+                   sg.ids[1 + substr(nu.login, 10)::int %% array_length(sg.ids, 1)],
+                   DATE '2012-01-01' + (substr(nu.login, 10)::int %% 2500),
+                   nu.phone, 0
+            FROM new_users nu, seed_groups sg
+        """, (SEED_PASSWORD_HASH, students))
+        # Секции истории создаются заранее, чтобы строки не оседали в секции DEFAULT
+        cur.execute("SELECT maintain_partitions(3, (CURRENT_DATE - make_interval(years => %s))::date)", (years,))
+        cur.execute("""
+            INSERT INTO attendance (student_id, group_id, session_date, is_present, cost_charged)
+            SELECT student_id, group_id, session_date, present, CASE WHEN present THEN 300 ELSE 0 END
+            FROM (
+                -- random() в списке выборки считается для каждой строки, а не один раз на запрос
+                SELECT s.id AS student_id, s.group_id, d::date AS session_date, random() < 0.8 AS present
+                FROM students s
+                JOIN users u ON s.user_id = u.id AND u.login LIKE 'seed\\_kid\\_%%'
+                CROSS JOIN generate_series(CURRENT_DATE - make_interval(years => %s), CURRENT_DATE - 1, interval '1 day') d
+                WHERE extract(isodow FROM d) IN (1, 3, 5)
+            ) marks
+            ON CONFLICT DO NOTHING
+        """, (years,))
+        cur.execute("""
+            INSERT INTO transactions (student_id, amount, transaction_type, description, created_at)
+            SELECT a.student_id, -a.cost_charged, 'charge', 'Посещение ' || a.session_date, a.session_date + TIME '16:00'
+            FROM attendance a
+            JOIN students s ON a.student_id = s.id
+            JOIN users u ON s.user_id = u.id AND u.login LIKE 'seed\\_kid\\_%'
+            WHERE a.is_present
+        """)
+        cur.execute("""
+            INSERT INTO transactions (student_id, amount, transaction_type, description, created_at)
+            SELECT s.id, 3600, 'payment', 'Оплата за ' || to_char(m, 'MM.YYYY'), m + TIME '10:00'
+            FROM students s
+            JOIN users u ON s.user_id = u.id AND u.login LIKE 'seed\\_kid\\_%%'
+            CROSS JOIN generate_series(date_trunc('month', CURRENT_DATE - make_interval(years => %s)), CURRENT_DATE - 1, interval '1 month') m
+        """, (years,))
+        cur.execute("""
+            UPDATE students s SET balance = t.total
+            FROM (SELECT student_id, SUM(amount) AS total FROM transactions GROUP BY student_id) t
+            WHERE s.id = t.student_id
+        """)
+        cur.execute('SELECT rebuild_student_attendance_stats()')
+    conn.commit()
+
+    analyze = conn.cursor()
+    conn.autocommit = True
+    analyze.execute('ANALYZE')
+    conn.autocommit = False
+    analyze.close()
+
+def load_function(name: str):
+    """
+    Импортирует backend/<name>/index.py как отдельный модуль.
+    Драйвер БД подгружается сразу: скрипты подменяют get_connection,
+    а курсоры обработчиков появляются только после load_psycopg2.
+    """
+    path = ROOT / 'backend' / name / 'index.py'
+    spec = importlib.util.spec_from_file_location(f'{name}_function', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.load_psycopg2()
+    return module
+
+_cursor_classes = {}
+
+def cursor_class(mixin, factory=None):
+    """Класс курсора, добавляющий поведение mixin к курсору, который запросил обработчик"""
+    factory = factory or psycopg2.extensions.cursor
+    key = (mixin, factory)
+    if key not in _cursor_classes:
+        _cursor_classes[key] = type(mixin.__name__ + factory.__name__, (mixin, factory), {})
+    return _cursor_classes[key]
@@ -0,0 +1,48 @@
+"""
+Состояние ограничения попыток входа: заблокированные ключи, ключи с неудачами
+и пустые корзины. Ключи вида ip:<адрес> и login:<логин>.
+С --unlock снимает блокировку и сбрасывает счётчик неудач ключа.
+
+Запуск: DATABASE_URL=... python scripts/login_throttle.py [--all] [--json state.json]
+        DATABASE_URL=... python scripts/login_throttle.py --unlock login:a.biktashev
+"""
+import argparse
+import json
+from localdb import connect
+
+def main():
+    parser = argparse.ArgumentParser(description='Ограничение попыток входа')
+    parser.add_argument('--all', action='store_true', help='показать все ключи, а не только проблемные')
+    parser.add_argument('--unlock', metavar='KEY', help='снять блокировку ключа')
+    parser.add_argument('--json', help='сохранить состояние в файл')
+    args = parser.parse_args()
+
+    conn = connect()
+    with conn, conn.cursor() as cur:
+        if args.unlock:
+            cur.execute("""
+                UPDATE login_throttle SET failures = 0, failed_at = NULL, locked_until = NULL
+                WHERE key = %s
+            """, (args.unlock,))
+            print(f'Разблокировано ключей: {cur.rowcount}')
+        cur.execute(f"""
+            SELECT key, tokens, failures, failed_at, locked_until, locked_for, updated_at
+            FROM login_throttle_status
+            {'' if args.all else 'WHERE locked_for > 0 OR failures > 0 OR tokens < 1'}
+            ORDER BY locked_for DESC, failures DESC, key
+        """)
+        columns = [column.name for column in cur.description]
+        rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+    conn.close()
+
+    for row in rows:
+        state = f"заблокирован ещё {row['locked_for']} с" if row['locked_for'] else 'активен'
+        print(f"{row['key']}: {state}, неудач {row['failures']}, токенов {row['tokens']}")
+    print(f'Ключей: {len(rows)}, заблокировано: {sum(1 for row in rows if row["locked_for"])}')
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as target:
+            json.dump(rows, target, ensure_ascii=False, indent=2, default=str)
+
+if __name__ == '__main__':
+    main()
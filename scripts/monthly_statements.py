@@ -0,0 +1,162 @@
+"""
+Ежемесячные выписки для родителей: посещения, списания, оплаты, баланс на начало
+и конец месяца по каждому ученику.
+
+Выписки считаются пачками учеников по student_id несколькими запросами на всю
+пачку: посещения и транзакции месяца агрегируются с группировкой по ученику,
+JSON выписки собирается в Postgres и пишется в NDJSON-файл построчно. Баланс на
+конец месяца берётся из журнала (student_balances_as_of) один раз на весь запуск,
+поэтому совпадает с GET transactions?balance_as_of. Посещения, транзакции и
+баланс на дату (V0015) читаются через archive.*_all, поэтому выписки за месяцы
+прошлых сезонов не меняются после scripts/partitions.py archive.
+
+После каждой пачки в файл <выписки>.progress записываются последний ученик и
+длина файла; повторный запуск после сбоя обрезает недописанный хвост и
+продолжает с места остановки. --restart начинает заново.
+
+Запуск: DATABASE_URL=... python scripts/monthly_statements.py 2026-09 --out statements [--group-id 3]
+"""
+import argparse
+import json
+import os
+import time
+from datetime import date
+from pathlib import Path
+from localdb import connect
+
+BATCH_SIZE = 500
+
+CLOSING_BALANCES_QUERY = """
+    CREATE TEMP TABLE statement_balances ON COMMIT DROP AS
+    SELECT student_id, balance FROM student_balances_as_of(%(month_end)s::date - 1);
+    CREATE UNIQUE INDEX ON statement_balances(student_id);
+    ANALYZE statement_balances;
+"""
+
+STATEMENTS_QUERY = """
+    WITH batch AS (
+        SELECT s.id, s.parent_contact, u.full_name, g.name AS group_name
+        FROM students s
+        JOIN users u ON u.id = s.user_id
+        LEFT JOIN groups g ON g.id = s.group_id
+        WHERE s.id > %(after)s
+          AND (%(group_id)s::integer IS NULL OR s.group_id = %(group_id)s::integer)
+        ORDER BY s.id
+        LIMIT %(batch)s
+    ),
+    visits AS (
+        SELECT a.student_id,
+               COUNT(*) AS sessions,
+               COUNT(*) FILTER (WHERE a.is_present) AS visits,
+               json_agg(a.session_date ORDER BY a.session_date) FILTER (WHERE a.is_present) AS visit_dates
+        FROM archive.attendance_all a
+        WHERE a.student_id IN (SELECT id FROM batch)
+          AND a.session_date >= %(month_start)s AND a.session_date < %(month_end)s
+        GROUP BY a.student_id
+    ),
+    ledger AS (
+        SELECT t.student_id,
+               SUM(t.amount) AS net,
+               COALESCE(SUM(-t.amount) FILTER (WHERE t.transaction_type = 'charge'), 0) AS charged,
+               COALESCE(SUM(t.amount) FILTER (WHERE t.transaction_type = 'payment'), 0) AS paid,
+               COALESCE(SUM(t.amount) FILTER (WHERE t.transaction_type = 'adjustment'), 0) AS adjusted,
+               json_agg(json_build_object(
+                   'date', t.created_at, 'type', t.transaction_type, 'amount', t.amount, 'description', t.description
+               ) ORDER BY t.created_at, t.id) AS transactions
+        FROM archive.transactions_all t
+        WHERE t.student_id IN (SELECT id FROM batch)
+          AND t.created_at >= %(month_start)s AND t.created_at < %(month_end)s
+        GROUP BY t.student_id
+    )
+    SELECT b.id, json_build_object(
+        'month', %(month)s,
+        'student_id', b.id,
+        'full_name', b.full_name,
+        'group_name', b.group_name,
+        'parent_contact', b.parent_contact,
+        'opening_balance', COALESCE(sb.balance, 0) - COALESCE(l.net, 0),
+        'sessions', COALESCE(v.sessions, 0),
+        'visits', COALESCE(v.visits, 0),
+        'visit_dates', COALESCE(v.visit_dates, '[]'::json),
+        'charged', COALESCE(l.charged, 0),
+        'paid', COALESCE(l.paid, 0),
+        'adjusted', COALESCE(l.adjusted, 0),
+        'closing_balance', COALESCE(sb.balance, 0),
+        'transactions', COALESCE(l.transactions, '[]'::json)
+    )::text AS statement
+    FROM batch b
+    LEFT JOIN visits v ON v.student_id = b.id
+    LEFT JOIN ledger l ON l.student_id = b.id
+    LEFT JOIN statement_balances sb ON sb.student_id = b.id
+    ORDER BY b.id
+"""
+
+def load_progress(path: Path) -> dict:
+    """Точка продолжения: последний записанный ученик и длина файла выписок"""
+    if not path.exists():
+        return {'after': 0, 'offset': 0, 'written': 0, 'done': False}
+    return json.loads(path.read_text(encoding='utf-8'))
+
+def save_progress(path: Path, progress: dict):
+    """Атомарно сохраняет точку продолжения: сначала во временный файл, затем переименование"""
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps(progress), encoding='utf-8')
+    os.replace(temporary, path)
+
+def main():
+    parser = argparse.ArgumentParser(description='Ежемесячные выписки для родителей')
+    parser.add_argument('month', help='месяц в формате YYYY-MM')
+    parser.add_argument('--group-id', type=int)
+    parser.add_argument('--out', default='.')
+    parser.add_argument('--batch', type=int, default=BATCH_SIZE, help='учеников в одной пачке')
+    parser.add_argument('--restart', action='store_true', help='начать заново, не продолжая прошлый запуск')
+    args = parser.parse_args()
+
+    month_start = date.fromisoformat(f'{args.month}-01')
+    month_end = date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    suffix = f'_group{args.group_id}' if args.group_id else ''
+    path = out / f'statements_{args.month}{suffix}.ndjson'
+    progress_path = out / f'statements_{args.month}{suffix}.progress'
+
+    progress = {'after': 0, 'offset': 0, 'written': 0, 'done': False} if args.restart else load_progress(progress_path)
+    if progress['done']:
+        print(f'Выписки уже готовы: {path} ({progress["written"]} учеников), для пересчёта --restart')
+        return
+    if progress['after']:
+        print(f'Продолжение после ученика {progress["after"]}, уже записано {progress["written"]}')
+
+    started = time.perf_counter()
+    conn = connect()
+    conn.set_session(isolation_level='REPEATABLE READ')
+    params = {
+        'month': args.month,
+        'month_start': month_start,
+        'month_end': month_end,
+        'group_id': args.group_id,
+        'batch': args.batch
+    }
+    with conn.cursor() as cur, open(path, 'ab' if progress['offset'] else 'wb') as target:
+        target.truncate(progress['offset'])
+        cur.execute(CLOSING_BALANCES_QUERY, params)
+        while True:
+            cur.execute(STATEMENTS_QUERY, dict(params, after=progress['after']))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            target.write(''.join(statement + '\n' for _, statement in rows).encode('utf-8'))
+            target.flush()
+            os.fsync(target.fileno())
+            progress.update(after=rows[-1][0], offset=target.tell(), written=progress['written'] + len(rows))
+            save_progress(progress_path, progress)
+            print(f'записано {progress["written"]}, последний ученик {progress["after"]}', flush=True)
+    conn.rollback()
+    conn.close()
+
+    progress['done'] = True
+    save_progress(progress_path, progress)
+    print(f'Выписок: {progress["written"]} в {path} за {time.perf_counter() - started:.1f} с')
+
+if __name__ == '__main__':
+    main()
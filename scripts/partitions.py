@@ -0,0 +1,62 @@
+"""
+Обслуживание секций attendance и transactions.
+
+maintain — создаёт помесячные секции на несколько месяцев вперёд, переносит
+строки, попавшие в секцию DEFAULT, и удаляет события ленты изменений старше
+--keep-changes; запускать по расписанию, например раз в неделю.
+archive  — отсоединяет секции прошлых сезонов (сезон начинается 1 сентября)
+и переносит их в схему archive. Текущий сезон и --keep-seasons предыдущих остаются
+в рабочих таблицах; архив доступен отчётам через archive.attendance_all и
+archive.transactions_all, через них же читают баланс на дату и пересчёты сводок
+(V0015), а выгрузки attendance и transactions — когда период заходит в архив.
+Отметки занятий в архивных месяцах отклоняются, и maintain не создаёт заново
+секции архивных месяцев (V0017). Перед отсоединением берётся снимок балансов,
+чтобы сверка не зависела от отсоединённых транзакций.
+
+Запуск: DATABASE_URL=... python scripts/partitions.py maintain --months-ahead 3
+        DATABASE_URL=... python scripts/partitions.py archive --keep-seasons 1
+"""
+import argparse
+from datetime import date
+from localdb import connect
+
+SEASON_START_MONTH = 9
+
+def season_start(today: date, seasons_back: int = 0) -> date:
+    """Начало сезона, в который попадает today, или на seasons_back сезонов раньше"""
+    year = today.year if today.month >= SEASON_START_MONTH else today.year - 1
+    return date(year - seasons_back, SEASON_START_MONTH, 1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Секции истории посещаемости и транзакций')
+    commands = parser.add_subparsers(dest='command', required=True)
+    maintain = commands.add_parser('maintain', help='создать секции вперёд')
+    maintain.add_argument('--months-ahead', type=int, default=3)
+    maintain.add_argument('--keep-changes', default='7 days', help='сколько хранить события ленты изменений')
+    archive = commands.add_parser('archive', help='отсоединить секции прошлых сезонов')
+    archive.add_argument('--keep-seasons', type=int, default=0, help='сколько прошлых сезонов оставить в рабочих таблицах')
+    archive.add_argument('--dry-run', action='store_true', help='только показать границу архива')
+    args = parser.parse_args()
+
+    conn = connect()
+    with conn, conn.cursor() as cur:
+        if args.command == 'maintain':
+            cur.execute('SELECT maintain_partitions(%s)', (args.months_ahead,))
+            print(f'Создано секций: {cur.fetchone()[0]}')
+            cur.execute('SELECT prune_change_events(%s::interval)', (args.keep_changes,))
+            print(f'Удалено событий ленты: {cur.fetchone()[0]}')
+        else:
+            before = season_start(date.today(), args.keep_seasons)
+            print(f'Граница архива: {before}')
+            if not args.dry_run:
+                cur.execute("SET lock_timeout = '10s'")
+                cur.execute('SELECT take_balance_snapshot()')
+                cur.execute('SELECT archive_partitions(%s)', (before,))
+                archived = [row[0] for row in cur.fetchall()]
+                for name in archived:
+                    print(f'archive.{name}')
+                print(f'В архив перенесено секций: {len(archived)}')
+    conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+"""
+Пересчёт агрегатов посещаемости учеников (total_sessions, total_visits, last_visit).
+Версии кэшей balances и students увеличиваются в той же транзакции, чтобы функции не отдавали
+закэшированные до пересчёта значения.
+Запуск: DATABASE_URL=... python scripts/rebuild_student_stats.py
+"""
+import os
+import psycopg2
+
+def main():
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    with conn, conn.cursor() as cur:
+        cur.execute('SELECT rebuild_student_attendance_stats()')
+        fixed = cur.fetchone()[0]
+        if fixed:
+            cur.execute("""
+                INSERT INTO cache_versions (scope, version)
+                SELECT unnest(ARRAY['balances', 'students']), 1
+                ON CONFLICT (scope) DO UPDATE SET version = cache_versions.version + 1
+            """)
+    conn.close()
+    print(f'Пересчитаны агрегаты посещаемости, исправлено учеников: {fixed}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Сверка балансов учеников с журналом транзакций.
+
+Сначала берётся новый снимок балансов (take_balance_snapshot), затем
+students.balance сравнивается с последним снимком плюс транзакциями после
+него — полного прохода по transactions нет. С --repair расхождения
+исправляются: баланс приводится к журналу одним UPDATE, поэтому
+параллельные отметки и оплаты не теряются.
+
+Запуск: DATABASE_URL=... python scripts/reconcile_balances.py [--repair] [--no-snapshot]
+"""
+import argparse
+import os
+import psycopg2
+
+def main():
+    parser = argparse.ArgumentParser(description='Сверка балансов с журналом транзакций')
+    parser.add_argument('--repair', action='store_true', help='привести students.balance к журналу')
+    parser.add_argument('--no-snapshot', action='store_true', help='не брать новый снимок перед сверкой')
+    parser.add_argument('--settle', default='10 minutes', help='в снимок не попадают транзакции моложе этого интервала')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    with conn, conn.cursor() as cur:
+        if not args.no_snapshot:
+            cur.execute('SELECT take_balance_snapshot(%s::interval)', (args.settle,))
+            print(f'Снимок балансов по транзакцию #{cur.fetchone()[0] or 0}')
+
+    with conn, conn.cursor() as cur:
+        if args.repair:
+            cur.execute("""
+                UPDATE students s
+                SET balance = COALESCE(s.balance, 0) - d.drift
+                FROM student_balance_drift() d
+                WHERE s.id = d.student_id
+                RETURNING s.id, d.balance, d.ledger_balance, d.drift
+            """)
+        else:
+            cur.execute("SELECT student_id, balance, ledger_balance, drift FROM student_balance_drift() ORDER BY student_id")
+        rows = cur.fetchall()
+        if args.repair and rows:
+            cur.execute("""
+                INSERT INTO cache_versions (scope, version) VALUES ('balances', 1)
+                ON CONFLICT (scope) DO UPDATE SET version = cache_versions.version + 1
+            """)
+    conn.close()
+
+    for student_id, balance, ledger_balance, drift in rows:
+        print(f'ученик {student_id}: баланс {balance}, по журналу {ledger_balance}, расхождение {drift:+d}')
+    if args.repair:
+        print(f'Исправлено балансов: {len(rows)}')
+    else:
+        print(f'Расхождений: {len(rows)}, сумма {sum(drift for *_, drift in rows):+d}')
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,70 @@ const API_BASE = {
   transactions: 'https://functions.poehali.dev/1ebcd5ce-86f7-4573-ac0c-91a97656f57c',
 };
 
+const SESSION_KEY = 'sambo_session';
+
+interface Session {
+  access_token: string;
+  refresh_token: string;
+}
+
+const loadSession = (): Session | null => {
+  const saved = localStorage.getItem(SESSION_KEY);
+  return saved ? JSON.parse(saved) : null;
+};
+
+const refreshAccessToken = async (session: Session): Promise<Session | null> => {
+  const response = await fetch(API_BASE.auth, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ action: 'refresh', refresh_token: session.refresh_token }),
+  });
+  if (!response.ok) {
+    localStorage.removeItem(SESSION_KEY);
+    return null;
+  }
+  const data = await response.json();
+  const refreshed = { ...session, access_token: data.access_token };
+  localStorage.setItem(SESSION_KEY, JSON.stringify(refreshed));
+  return refreshed;
+};
+
+const authorizedFetch = async (url: string, init: RequestInit = {}): Promise<Response> => {
+  const withToken = (session: Session | null): RequestInit => ({
+    ...init,
+    headers: session ? { ...init.headers, 'X-Authorization': `Bearer ${session.access_token}` } : init.headers,
+  });
+  const session = loadSession();
+  const response = await fetch(url, withToken(session));
+  if (response.status !== 401 || !session) return response;
+  const refreshed = await refreshAccessToken(session);
+  return refreshed ? fetch(url, withToken(refreshed)) : response;
+};
+
+// Ключ идемпотентности создаётся один раз на действие пользователя (отправку формы оплаты,
+// нажатие «Отметить») и передаётся при каждом повторе: сервер не выполнит запрос с тем же
+// ключом второй раз, а вернёт сохранённый ответ
+export const newIdempotencyKey = (): string => crypto.randomUUID();
+
+const IDEMPOTENT_RETRIES = 2;
+
+const postIdempotent = async (url: string, body: unknown, idempotencyKey: string): Promise<Response> => {
+  const init: RequestInit = {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey },
+    body: JSON.stringify(body),
+  };
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await authorizedFetch(url, init);
+      if (response.status < 500 || attempt >= IDEMPOTENT_RETRIES) return response;
+    } catch (error) {
+      if (attempt >= IDEMPOTENT_RETRIES) throw error;
+    }
+    await new Promise((resolve) => setTimeout(resolve, 500 * 2 ** attempt));
+  }
+};
+
 export interface User {
   id: number;
   login: string;
@@ -23,6 +87,8 @@ export interface Group {
   trainer_id?: number;
   trainer_name?: string;
   schedule?: string;
+  schedule_days?: number[] | null;
+  schedule_time?: string | null;
   cost_per_session: number;
   student_count?: number;
 }
@@ -52,6 +118,28 @@ export interface Transaction {
   student_name?: string;
 }
 
+// Импорт принимает не больше 100 учеников за запрос: на каждого сервер считает bcrypt-хеш
+// временного пароля, и большая пачка не уложилась бы в таймаут функции
+export const STUDENTS_IMPORT_LIMIT = 100;
+
+export interface StudentImportRow {
+  full_name: string;
+  birth_date?: string;
+  parent_contact?: string;
+  group_id?: number;
+}
+
+export interface StudentImportResult {
+  row: number;
+  status: 'created' | 'error';
+  error?: string;
+  student_id?: number;
+  full_name?: string;
+  group_id?: number | null;
+  login?: string;
+  temp_password?: string;
+}
+
 export const api = {
   auth: {
     login: async (login: string, password: string): Promise<{ user: User }> => {
@@ -62,19 +150,36 @@ export const api = {
       });
       const data = await response.json();
       if (!response.ok) throw new Error(data.error || 'Ошибка авторизации');
+      if (data.access_token) {
+        localStorage.setItem(
+          SESSION_KEY,
+          JSON.stringify({ access_token: data.access_token, refresh_token: data.refresh_token })
+        );
+      }
       return data;
     },
+
+    logout: async (): Promise<void> => {
+      const session = loadSession();
+      localStorage.removeItem(SESSION_KEY);
+      if (!session) return;
+      await fetch(API_BASE.auth, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ action: 'logout', refresh_token: session.refresh_token }),
+      });
+    },
   },
 
   groups: {
     getAll: async (): Promise<Group[]> => {
-      const response = await fetch(API_BASE.groups);
+      const response = await authorizedFetch(API_BASE.groups);
       const data = await response.json();
       return data.groups || [];
     },
 
     create: async (group: Partial<Group>): Promise<Group> => {
-      const response = await fetch(API_BASE.groups, {
+      const response = await authorizedFetch(API_BASE.groups, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(group),
@@ -86,19 +191,48 @@ export const api = {
   },
 
   students: {
-    getAll: async (): Promise<Student[]> => {
-      const response = await fetch(API_BASE.students);
+    // Одна страница списка (до 500 учеников); следующая запрашивается по next_cursor, когда понадобится
+    getPage: async (cursor?: string | null): Promise<{ students: Student[]; next_cursor: string | null }> => {
+      const url = cursor ? `${API_BASE.students}?cursor=${encodeURIComponent(cursor)}` : API_BASE.students;
+      const response = await authorizedFetch(url);
+      const data = await response.json();
+      if (!response.ok) throw new Error(data.error || 'Ошибка загрузки учеников');
+      return { students: data.students || [], next_cursor: data.next_cursor || null };
+    },
+
+    search: async (query: string, groupId?: number): Promise<Student[]> => {
+      const params = new URLSearchParams({ q: query });
+      if (groupId) params.set('group_id', String(groupId));
+      const response = await authorizedFetch(`${API_BASE.students}?${params}`);
       const data = await response.json();
+      if (!response.ok) throw new Error(data.error || 'Ошибка поиска');
       return data.students || [];
     },
 
+    // Отправляет список частями по STUDENTS_IMPORT_LIMIT; номера строк в отчёте — по всему списку
+    importMany: async (rows: StudentImportRow[]): Promise<{ created: number; failed: number; results: StudentImportResult[] }> => {
+      const results: StudentImportResult[] = [];
+      for (let start = 0; start < rows.length; start += STUDENTS_IMPORT_LIMIT) {
+        const response = await authorizedFetch(API_BASE.students, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ students: rows.slice(start, start + STUDENTS_IMPORT_LIMIT) }),
+        });
+        const data = await response.json();
+        if (!data.results) throw new Error(data.error || 'Ошибка импорта учеников');
+        results.push(...data.results.map((item: StudentImportResult) => ({ ...item, row: item.row + start })));
+      }
+      const created = results.filter((item) => item.status === 'created').length;
+      return { created, failed: results.length - created, results };
+    },
+
     create: async (student: {
       full_name: string;
       birth_date?: string;
       parent_contact?: string;
       group_id?: number;
     }): Promise<{ student_id: number; login: string; temp_password: string }> => {
-      const response = await fetch(API_BASE.students, {
+      const response = await authorizedFetch(API_BASE.students, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(student),
@@ -111,13 +245,13 @@ export const api = {
 
   attendance: {
     getByStudent: async (studentId: number) => {
-      const response = await fetch(`${API_BASE.attendance}?student_id=${studentId}`);
+      const response = await authorizedFetch(`${API_BASE.attendance}?student_id=${studentId}`);
       const data = await response.json();
       return data.attendance || [];
     },
 
     getByGroup: async (groupId: number) => {
-      const response = await fetch(`${API_BASE.attendance}?group_id=${groupId}`);
+      const response = await authorizedFetch(`${API_BASE.attendance}?group_id=${groupId}`);
       const data = await response.json();
       return data.attendance || [];
     },
@@ -128,27 +262,35 @@ export const api = {
       present_students: number[];
       trainer_comment?: string;
       trainer_id?: number;
-    }) => {
-      const response = await fetch(API_BASE.attendance, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(params),
-      });
+    }, idempotencyKey: string) => {
+      const response = await postIdempotent(API_BASE.attendance, params, idempotencyKey);
       const data = await response.json();
       if (!response.ok) throw new Error(data.error || 'Ошибка отметки посещаемости');
       return data;
     },
+
+    markBatch: async (sessions: {
+      group_id: number;
+      session_date: string;
+      present_students: number[];
+      trainer_comment?: string;
+    }[], idempotencyKey: string) => {
+      const response = await postIdempotent(API_BASE.attendance, { sessions }, idempotencyKey);
+      const data = await response.json();
+      if (!response.ok) throw new Error(data.error || 'Ни одно занятие не отмечено');
+      return data;
+    },
   },
 
   transactions: {
     getAll: async (): Promise<Transaction[]> => {
-      const response = await fetch(API_BASE.transactions);
+      const response = await authorizedFetch(API_BASE.transactions);
       const data = await response.json();
       return data.transactions || [];
     },
 
     getByStudent: async (studentId: number): Promise<Transaction[]> => {
-      const response = await fetch(`${API_BASE.transactions}?student_id=${studentId}`);
+      const response = await authorizedFetch(`${API_BASE.transactions}?student_id=${studentId}`);
       const data = await response.json();
       return data.transactions || [];
     },
@@ -158,12 +300,8 @@ export const api = {
       amount: number;
       description?: string;
       created_by?: number;
-    }) => {
-      const response = await fetch(API_BASE.transactions, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(params),
-      });
+    }, idempotencyKey: string) => {
+      const response = await postIdempotent(API_BASE.transactions, params, idempotencyKey);
       const data = await response.json();
       if (!response.ok) throw new Error(data.error || 'Ошибка пополнения баланса');
       return data;
@@ -15,6 +15,8 @@ const Index = () => {
   const [user, setUser] = useState<User | null>(null);
   const [groups, setGroups] = useState<Group[]>([]);
   const [students, setStudents] = useState<Student[]>([]);
+  const [studentsCursor, setStudentsCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const { toast } = useToast();
 
@@ -34,12 +36,13 @@ const Index = () => {
 
   const loadData = async () => {
     try {
-      const [groupsData, studentsData] = await Promise.all([
+      const [groupsData, studentsPage] = await Promise.all([
         api.groups.getAll(),
-        api.students.getAll(),
+        api.students.getPage(),
       ]);
       setGroups(groupsData);
-      setStudents(studentsData);
+      setStudents(studentsPage.students);
+      setStudentsCursor(studentsPage.next_cursor);
     } catch (error) {
       toast({
         title: 'Ошибка загрузки данных',
@@ -49,11 +52,31 @@ const Index = () => {
     }
   };
 
+  const loadMoreStudents = async () => {
+    if (!studentsCursor) return;
+    setLoadingMore(true);
+    try {
+      const page = await api.students.getPage(studentsCursor);
+      setStudents(prev => [...prev, ...page.students]);
+      setStudentsCursor(page.next_cursor);
+    } catch (error) {
+      toast({
+        title: 'Ошибка загрузки учеников',
+        description: error instanceof Error ? error.message : 'Неизвестная ошибка',
+        variant: 'destructive',
+      });
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleLogout = () => {
     localStorage.removeItem('sambo_user');
+    api.auth.logout().catch(() => undefined);
     setUser(null);
     setGroups([]);
     setStudents([]);
+    setStudentsCursor(null);
   };
 
   if (loading) {
@@ -354,6 +377,14 @@ const Index = () => {
                   </div>
                 </CardContent>
               </Card>
+              {studentsCursor && (
+                <div className="flex justify-center mt-4">
+                  <Button variant="outline" onClick={loadMoreStudents} disabled={loadingMore}>
+                    {loadingMore && <Icon name="Loader2" size={16} className="mr-2 animate-spin" />}
+                    Показать ещё
+                  </Button>
+                </div>
+              )}
             </TabsContent>
 
             <TabsContent value="finance" className="py-6">
@@ -403,9 +434,9 @@ const Index = () => {
                       <CardTitle className="text-center text-sm">{day}</CardTitle>
                     </CardHeader>
                     <CardContent className="space-y-2">
-                      {groups.filter(g => g.schedule?.includes(day)).map(group => (
+                      {groups.filter(g => g.schedule_days ? g.schedule_days.includes(idx + 1) : g.schedule?.includes(day)).map(group => (
                         <div key={group.id} className="p-2 rounded bg-primary/10 border border-primary/20 text-xs">
-                          <p className="font-semibold">{group.schedule?.split(' ').pop()}</p>
+                          <p className="font-semibold">{group.schedule_time?.slice(0, 5) ?? group.schedule?.split(' ').pop()}</p>
                           <p className="text-muted-foreground">{group.name}</p>
                         </div>
                       ))}